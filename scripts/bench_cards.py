@@ -0,0 +1,43 @@
+"""
+Рендер 24 карточек листинга (products/card.html): сборка на лету
+(display_name/variant_label/get_absolute_url на каждую карточку) против VariantCard.
+
+    python scripts/bench_cards.py --variants 5000
+    DATABASE_URL=postgres://... python scripts/bench_cards.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.template.loader import get_template
+    from products.models import VariantCard
+    from products.utils.cards import refresh_dirty
+    from products.utils.list import base_qs
+
+    card = get_template('products/card.html')
+
+    def page():
+        return ''.join(card.render({'v': v}) for v in base_qs().order_by('id')[:24])
+
+    with test_database():
+        seed_catalog(variants=args.variants)
+        q_live, ms_live, html_live = measure(page, args.repeat)
+        refresh_dirty()
+        q_card, ms_card, html_card = measure(page, args.repeat)
+        assert html_live == html_card
+
+        report(f'24 cards, {args.variants} variants ({VariantCard.objects.count()} stored cards)', [
+            ('built per card', q_live, ms_live),
+            ('VariantCard', q_card, ms_card),
+        ])
+
+
+if __name__ == '__main__':
+    main()
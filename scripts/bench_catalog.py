@@ -0,0 +1,112 @@
+"""
+Общие хелперы для бенчмарков каталога: поднимают Django на тестовой БД
+(DATABASE_URL из окружения или sqlite), наполняют её синтетическим каталогом
+и меряют число запросов и латентность.
+
+    python scripts/bench_facets.py --variants 20000
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+import django
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lightbikeshop.settings')
+for key in ('CDEK_ID', 'CDEK_SECRET', 'CDEK_SENDER_CODE'):
+    os.environ.setdefault(key, 'bench')
+
+from django.conf import settings as djsettings  # noqa: E402
+
+# бенчмарку не нужен Redis: версии каталога и кэши живут в памяти процесса
+djsettings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_catalog(variants=20000, text_attrs=10, number_attrs=5, values_per_attr=12,
+                 brands=40, variants_per_product=4, seed=42):
+    """
+    Одна листовая категория с text_attrs + number_attrs фильтруемыми атрибутами.
+    Вставка через bulk_create — без сигналов и без пересчёта slug'ов.
+    """
+    from products.models import (
+        Attribute, AttributeValue, Brand, Category, CategoryAttribute, Product, Variant,
+    )
+    rnd = random.Random(seed)
+    root = Category.objects.create(title='Bench', slug='bench')
+    cat = Category.objects.create(title='Bench leaf', title_singular='Деталь', slug='bench-leaf', parent=root)
+    brand_objs = Brand.objects.bulk_create(
+        [Brand(title=f'Brand {i:03d}', slug=f'brand-{i:03d}', image='b.png') for i in range(brands)]
+    )
+    attrs = Attribute.objects.bulk_create(
+        [Attribute(name=f'Text {i}', slug=f'text-{i}', value_type=Attribute.TEXT) for i in range(text_attrs)]
+        + [Attribute(name=f'Num {i}', slug=f'num-{i}', value_type=Attribute.NUMBER) for i in range(number_attrs)]
+    )
+    CategoryAttribute.objects.bulk_create(
+        [CategoryAttribute(category=cat, attribute=a, is_filterable=True, is_variant=(i == 0), sort_order=i)
+         for i, a in enumerate(attrs)]
+    )
+
+    products = Product.objects.bulk_create([
+        Product(id=uuid.uuid4(), base_name=f'Model {i}', category=cat, brand=rnd.choice(brand_objs))
+        for i in range(max(1, variants // variants_per_product))
+    ], batch_size=2000)
+
+    vs = []
+    for i in range(variants):
+        price = Decimal(rnd.randint(300, 60000))
+        vs.append(Variant(
+            id=uuid.uuid4(), product=products[i % len(products)], slug=f'bench-{i}',
+            price=price, old_price=(price * Decimal('1.2')) if i % 5 == 0 else None,
+            inventory=rnd.choice([0, 0, 1, 3, 10]), seller_article=f'ART-{i:06d}',
+        ))
+    Variant.objects.bulk_create(vs, batch_size=2000)
+
+    avs = []
+    for v in vs:
+        for a in attrs:
+            if a.value_type == Attribute.TEXT:
+                avs.append(AttributeValue(variant=v, attribute=a, value_text=f'v{rnd.randrange(values_per_attr)}'))
+            else:
+                avs.append(AttributeValue(variant=v, attribute=a, value_number=Decimal(rnd.randint(10, 300)) / 10))
+    AttributeValue.objects.bulk_create(avs, batch_size=5000)
+    return cat
+
+
+def measure(fn, repeat=5):
+    """(число запросов за один прогон, медиана мс, результат)."""
+    with CaptureQueriesContext(connection) as ctx:
+        result = fn()
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return len(ctx.captured_queries), statistics.median(timings), result
+
+
+def report(title, rows):
+    print(f'\n{title} [{connection.vendor}]')
+    print(f'{"variant":<28}{"queries":>10}{"median, ms":>14}')
+    for name, queries, ms in rows:
+        print(f'{name:<28}{queries:>10}{ms:>14.1f}')
@@ -0,0 +1,60 @@
+"""
+Листинг категории (первая страница + count + фасеты): SQL-путь против
+in-process индекса products.utils.catalog_index.
+
+    python scripts/bench_catalog_index.py --variants 50000
+    DATABASE_URL=postgres://... python scripts/bench_catalog_index.py
+"""
+import argparse
+import time
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.core.paginator import Paginator
+    from django.test import RequestFactory
+    from products.utils import catalog_index
+    from products.utils.facets import compute_facets
+    from products.utils.list import (
+        apply_attr_filters, apply_scope, attr_slug_map, base_qs, order_qs, parse_params,
+    )
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants)
+        params = parse_params(RequestFactory().get('/', {
+            'in_stock': '1', 'sort': 'price_asc', 'a_text-1': 'v1,v2,v3', 'a_num-0_min': '5',
+        }))
+        by_slug = attr_slug_map(cat)
+
+        def sql():
+            qs = apply_attr_filters(apply_scope(base_qs(), cat, None, params), params, by_slug)
+            page = Paginator(order_qs(qs, params.sort), 24).get_page(params.page)
+            return [v.id for v in page.object_list], page.paginator.count, compute_facets(cat, None, params)
+
+        t0 = time.perf_counter()
+        catalog_index.get_index()
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        def indexed():
+            index = catalog_index.get_index()
+            page = Paginator(index.listing(cat, None, params, by_slug), 24).get_page(params.page)
+            return [v.id for v in page.object_list], page.paginator.count, index.facets(cat, None, params)
+
+        q_sql, ms_sql, (ids_sql, count_sql, _) = measure(sql, args.repeat)
+        q_idx, ms_idx, (ids_idx, count_idx, _) = measure(indexed, args.repeat)
+        assert count_sql == count_idx and ids_sql == ids_idx
+
+        report(f'listing, {args.variants} variants, {count_idx} matches (index build {build_ms:.0f} ms)', [
+            ('SQL', q_sql, ms_sql),
+            ('catalog_index', q_idx, ms_idx),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Сортировка "discount" и фильтр on_sale по хранимому Variant.discount: план и время первой
+страницы (SQL-путь; на PostgreSQL — Index Scan по variant_discount_sort_idx без Sort).
+
+    python scripts/bench_discount.py --variants 100000
+    DATABASE_URL=postgres://... python scripts/bench_discount.py --analyze
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=100000)
+    parser.add_argument('--on-sale', type=float, default=0.1, help='доля вариантов со старой ценой')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+    args = parser.parse_args()
+
+    from django.db import connection
+    from django.db.models import F
+    from products.models import Variant
+    from products.utils.list import apply_scope, base_qs, order_qs, parse_params
+    from django.test import RequestFactory
+
+    with test_database():
+        seed_catalog(variants=args.variants, text_attrs=0, number_attrs=0)
+        # старая цена у каждого N-го варианта — одним UPDATE, discount пересчитывает БД
+        every = max(1, round(1 / args.on_sale))
+        ids = list(Variant.objects.order_by('id').values_list('id', flat=True))[::every]
+        for start in range(0, len(ids), 5000):
+            Variant.objects.filter(id__in=ids[start:start + 5000]).update(old_price=F('price') * 1.3)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        options = {'analyze': True} if args.analyze and connection.vendor == 'postgresql' else {}
+        rows = []
+        for query in ({'sort': 'discount'}, {'sort': 'discount', 'on_sale': '1'}, {'on_sale': '1'}):
+            params = parse_params(RequestFactory().get('/', query))
+            qs = order_qs(apply_scope(base_qs(), None, None, params), params.sort)
+            print(query, qs[:24].explain(**options), sep='\n')
+            rows.append(('&'.join(f'{k}={v}' for k, v in query.items()),
+                         *measure(lambda: list(qs[:24]), args.repeat)[:2]))
+        report(f'discount, {args.variants} variants, {Variant.objects.filter(discount__gt=0).count()} on sale', rows)
+
+
+if __name__ == '__main__':
+    main()
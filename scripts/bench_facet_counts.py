@@ -0,0 +1,83 @@
+"""
+Счётчики фасетов («Shimano (12)») при выбранных бренде и значениях атрибутов:
+COUNT на каждое значение против compute_facets (два сгруппированных запроса
+с маской непройденных фильтров) и catalog_index.facets.
+
+    python scripts/bench_facet_counts.py --variants 10000 --values 250
+    DATABASE_URL=postgres://... python scripts/bench_facet_counts.py
+"""
+import argparse
+from dataclasses import replace
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=10000)
+    parser.add_argument('--values', type=int, default=250, help='значений у каждого текстового атрибута')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from django.test import RequestFactory
+    from products.models import Attribute
+    from products.utils import catalog_index
+    from products.utils.facets import compute_facets
+    from products.utils.list import apply_attr_filters, apply_scope, attr_slug_map, base_qs, parse_params
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants, values_per_attr=args.values)
+        params = parse_params(RequestFactory().get('/', {
+            'brands': 'brand-001,brand-002,brand-003', 'a_text-1': 'v1,v2,v3,v4', 'a_num-0_min': '5',
+        }))
+        by_slug = attr_slug_map(cat)
+
+        def per_value():
+            """Наивно: отдельный COUNT на каждый бренд и каждое значение, без фильтра своего измерения."""
+            facets = compute_facets(cat, None, params)  # списки значений
+            scope = apply_scope(base_qs(), cat, None, replace(params, brand_slugs=[]))
+            brands = {}
+            for b in facets['brand_facet']:
+                qs = apply_attr_filters(scope, params, by_slug)
+                brands[b['product__brand__slug']] = (
+                    qs.filter(product__brand__slug=b['product__brand__slug']).distinct().count())
+            counts = {}
+            for f in facets['attr_facets']:
+                a = f['attribute']
+                if a.value_type != Attribute.TEXT:
+                    continue
+                others = replace(params, attr_params={k: v for k, v in params.attr_params.items()
+                                                      if k != f'a_{a.slug}'})
+                qs = apply_attr_filters(apply_scope(base_qs(), cat, None, others), others, by_slug)
+                counts[a.id] = {v: qs.filter(attribute_values__attribute=a, attribute_values__value_text=v)
+                                      .distinct().count() for v in f['counts']}
+            return brands, counts
+
+        def grouped():
+            facets = compute_facets(cat, None, params)
+            return ({b['product__brand__slug']: b['count'] for b in facets['brand_facet']},
+                    {f['attribute'].id: f['counts'] for f in facets['attr_facets']
+                     if f['attribute'].value_type == Attribute.TEXT})
+
+        def indexed():
+            facets = catalog_index.get_index().facets(cat, None, params)
+            return ({b['product__brand__slug']: b['count'] for b in facets['brand_facet']},
+                    {f['attribute'].id: f['counts'] for f in facets['attr_facets']
+                     if f['attribute'].value_type == Attribute.TEXT})
+
+        q_naive, ms_naive, naive = measure(per_value, 1)
+        q_sql, ms_sql, sql = measure(grouped, args.repeat)
+        catalog_index.get_index()
+        q_idx, ms_idx, idx = measure(indexed, args.repeat)
+        assert naive == sql == idx
+
+        values = sum(len(c) for c in sql[1].values()) + len(sql[0])
+        report(f'facet counts, {args.variants} variants, {values} counted values', [
+            ('COUNT per value', q_naive, ms_naive),
+            ('compute_facets', q_sql, ms_sql),
+            ('catalog_index', q_idx, ms_idx),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Фасеты листинга: старая схема (legacy_facets — агрегат цены, бренды и по запросу на каждый
+фильтруемый атрибут) против compute_facets.
+
+    python scripts/bench_facets.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/bench_facets.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def legacy_facets(cat, fb):
+    """Прежняя схема: агрегат цены, бренды и по запросу на каждый фильтруемый атрибут."""
+    from django.db.models import Max, Min
+    from products.models import Attribute, AttributeValue
+
+    items = []
+    for ca in cat.category_attributes.select_related('attribute').filter(is_filterable=True):
+        a = ca.attribute
+        item = {'attribute': a, 'values': None, 'range': None}
+        if a.value_type == Attribute.TEXT:
+            item['values'] = list(AttributeValue.objects
+                                  .filter(attribute=a, variant__in=fb).exclude(value_text='')
+                                  .values_list('value_text', flat=True).distinct().order_by('value_text')[:200])
+        elif a.value_type == Attribute.BOOL:
+            item['values'] = [{'label': 'Да', 'value': '1'}, {'label': 'Нет', 'value': '0'}]
+        else:
+            item['range'] = (AttributeValue.objects.filter(attribute=a, variant__in=fb)
+                             .aggregate(min=Min('value_number'), max=Max('value_number')))
+        items.append(item)
+    return {
+        'price_range': fb.aggregate(min=Min('price'), max=Max('price')),
+        'brand_facet': list(fb.values('product__brand__slug', 'product__brand__title')
+                            .exclude(product__brand__slug__isnull=True).distinct().order_by('product__brand__title')),
+        'attr_facets': items,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.test import RequestFactory
+    from products.utils.facets import compute_facets
+    from products.utils.list import faceting_base_qs, parse_params
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants)
+        params = parse_params(RequestFactory().get('/', {'in_stock': '1'}))
+
+        def legacy():
+            return legacy_facets(cat, faceting_base_qs(cat, None, params))
+
+        def single_pass():
+            return compute_facets(cat, None, params)
+
+        q_old, ms_old, old = measure(legacy, args.repeat)
+        q_new, ms_new, new = measure(single_pass, args.repeat)
+        assert old['price_range'] == new['price_range']
+        assert old['brand_facet'] == [{k: v for k, v in b.items() if k != 'count'} for b in new['brand_facet']]
+        assert [(f['attribute'].id, f['values'], f['range']) for f in old['attr_facets']] == \
+               [(f['attribute'].id, f['values'], f['range']) for f in new['attr_facets']]
+
+        report(f'facets, {args.variants} variants, {len(new["attr_facets"])} filterable attrs', [
+            ('per-attribute queries', q_old, ms_old),
+            ('compute_facets', q_new, ms_new),
+        ])
+
+
+if __name__ == '__main__':
+    main()
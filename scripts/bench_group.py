@@ -0,0 +1,58 @@
+"""
+Листинг ?group=product: первая и следующая страницы и число товаров против обычного
+листинга по вариантам (SQL-путь; представитель товара — ROW_NUMBER() OVER (PARTITION BY product_id)).
+
+    python scripts/bench_group.py --variants 100000
+    DATABASE_URL=postgres://... python scripts/bench_group.py --analyze
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=100000)
+    parser.add_argument('--per-product', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+    args = parser.parse_args()
+
+    from django.db import connection
+    from django.test import RequestFactory
+    from products.utils.cursor import QuerySetSource, paginate_cursor, parse_ordering
+    from products.utils.list import (
+        apply_attr_filters, apply_scope, attr_slug_map, base_qs, group_by_product, order_qs, ordering_for,
+        parse_params,
+    )
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants, variants_per_product=args.per_product)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        rows = []
+        for query in ({'sort': 'price_asc'}, {'sort': 'price_asc', 'a_text-1': 'v1,v2', 'in_stock': '1'}):
+            for group in (False, True):
+                params = parse_params(RequestFactory().get('/', dict(query, **({'group': 'product'} if group else {}))))
+                qs = apply_attr_filters(apply_scope(base_qs(), cat, None, params), params, attr_slug_map(cat))
+                if group:
+                    qs = group_by_product(qs, params.sort)
+                qs = order_qs(qs, params.sort)
+                ordering = parse_ordering(ordering_for(params.sort))
+                source = QuerySetSource(qs, ordering)
+                first = paginate_cursor(source, ordering, None)
+                name = f"{'products' if group else 'variants'}{', filtered' if len(query) > 1 else ''}"
+                rows += [
+                    (f'{name}: first page', *measure(lambda: source.seek(None, False, 25), args.repeat)[:2]),
+                    (f'{name}: next page', *measure(
+                        lambda: paginate_cursor(source, ordering, first.next_cursor).object_list, args.repeat)[:2]),
+                    (f'{name}: count', *measure(source.count, args.repeat)[:2]),
+                ]
+                if group and args.analyze and connection.vendor == 'postgresql':
+                    print(qs[:25].explain(analyze=True))
+        report(f'group by product, {args.variants} variants, {args.per_product} per product', rows)
+
+
+if __name__ == '__main__':
+    main()
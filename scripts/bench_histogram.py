@@ -0,0 +1,53 @@
+"""
+Гистограммы цены и числовых атрибутов в фасетах: стоимость границ корзин (промах кэша —
+SQL с percentile_disc или колонки индекса каталога) и фасетов с гистограммами против тех
+же фасетов без них (SQL: width_bucket в тех же сгруппированных запросах; индекс — searchsorted).
+
+    python scripts/bench_histogram.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/bench_histogram.py
+"""
+import argparse
+from unittest import mock
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.test import RequestFactory
+    from products.utils import catalog_index, histogram
+    from products.utils.facets import compute_facets, filterable_attributes
+    from products.utils.list import parse_params
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants)
+        params = parse_params(RequestFactory().get('/', {'in_stock': '1', 'price_min': '5000', 'a_text-1': 'v1,v2'}))
+        attrs = filterable_attributes(cat)
+        index = catalog_index.get_index()
+        no_edges = mock.patch.object(histogram, 'cached_edges', lambda cat, br, compute: {histogram.PRICE: []})
+
+        q_sql_edges, ms_sql_edges, edges = measure(lambda: histogram.sql_edges(cat, None, attrs), args.repeat)
+        q_idx_edges, ms_idx_edges, idx_edges = measure(
+            lambda: index.histogram_edges(cat, None, params, attrs), args.repeat)
+        assert edges == idx_edges
+
+        rows = [('edges: SQL', q_sql_edges, ms_sql_edges), ('edges: index', q_idx_edges, ms_idx_edges)]
+        for name, facets in (('SQL', lambda: compute_facets(cat, None, params)),
+                             ('index', lambda: index.facets(cat, None, params))):
+            with no_edges:
+                q_old, ms_old, _ = measure(facets, args.repeat)
+            facets()  # границы — в кэш
+            q_new, ms_new, result = measure(facets, args.repeat)
+            assert result['price_histogram'] and all(f['histogram'] for f in result['attr_facets'] if f['range'])
+            rows += [(f'facets: {name}, no histograms', q_old, ms_old), (f'facets: {name}, histograms', q_new, ms_new)]
+
+        report(f'histograms, {args.variants} variants, {len(histogram.number_attributes(attrs))} number attrs, '
+               f'{histogram.BUCKETS} buckets', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Глубокая страница листинга на SQL-пути: Paginator (COUNT + OFFSET) против
+курсора (WHERE по ключу + кэшированный count).
+
+    python scripts/bench_pagination.py --variants 50000 --page 400
+    DATABASE_URL=postgres://... python scripts/bench_pagination.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--page', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.core.paginator import Paginator
+    from products.utils.cursor import QuerySetSource, legacy_page_cursor, paginate_cursor, parse_ordering
+    from products.utils.list import FilterParams, apply_scope, base_qs, order_qs, ordering_for
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants)
+        params = FilterParams('', args.page, 'price_asc', None, None, False, [], {})
+        qs = order_qs(apply_scope(base_qs(), cat, None, params), params.sort)
+        ordering = parse_ordering(ordering_for(params.sort))
+        source = QuerySetSource(qs, ordering, count_key='bench:count')
+        token = legacy_page_cursor(source, ordering, args.page)
+
+        def offset():
+            page = Paginator(qs, 24).get_page(args.page)
+            return [v.id for v in page.object_list]
+
+        def cursor():
+            return [v.id for v in paginate_cursor(source, ordering, token).object_list]
+
+        q_off, ms_off, ids_off = measure(offset, args.repeat)
+        cursor()  # прогрев кэша count
+        q_cur, ms_cur, ids_cur = measure(cursor, args.repeat)
+        assert ids_off == ids_cur
+
+        report(f'page {args.page} of {args.variants} variants, sort={params.sort}', [
+            ('Paginator (COUNT+OFFSET)', q_off, ms_off),
+            ('cursor', q_cur, ms_cur),
+        ])
+
+
+if __name__ == '__main__':
+    main()
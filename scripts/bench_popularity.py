@@ -0,0 +1,102 @@
+"""
+Сортировка "по популярности": время пересчёта Variant.popularity (products.utils.popularity)
+на каталоге с заказами, ко-покупками и просмотрами, обновление индекса каталога воркером
+после пересчёта (только колонка popularity) против полной сборки, план и время первой страницы
+листинга с sort=pop — на PostgreSQL это Index Scan по variant_pop_sort_idx без Sort.
+
+    python scripts/bench_popularity.py --variants 100000
+    DATABASE_URL=postgres://... python scripts/bench_popularity.py --analyze
+"""
+import argparse
+import datetime as dt
+import itertools
+import random
+import time
+from decimal import Decimal
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def seed_activity(orders, views, pairs, days=120, seed=42):
+    """Заказы, просмотры по дням и пары ко-покупок; частота варианта — по Ципфу."""
+    from django.utils import timezone
+    from cart.models import Order, OrderItem
+    from products.models import CopurchaseVariantStat, Variant, VariantViewDay
+
+    rnd = random.Random(seed)
+    ids = list(Variant.objects.values_list('id', flat=True))
+    rnd.shuffle(ids)
+    cum = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(ids))))
+    pick = lambda: rnd.choices(ids, cum_weights=cum)[0]  # noqa: E731
+
+    order_objs = Order.objects.bulk_create(
+        [Order(user_name='Bench', contact_phone='+70000000000', status=rnd.choice(['paid', 'paid', 'canceled']))
+         for _ in range(orders)], batch_size=2000)
+    now = timezone.now()
+    for o in order_objs:
+        o.date_ordered = now - dt.timedelta(days=rnd.uniform(0, days))
+    Order.objects.bulk_update(order_objs, ['date_ordered'], batch_size=2000)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=o, variant_id=pick(), price=Decimal(100), quantity=rnd.randint(1, 3), amount=Decimal(100))
+        for o in order_objs for _ in range(rnd.randint(1, 3))
+    ], batch_size=5000)
+
+    today = timezone.localdate()
+    seen = {(pick(), today - dt.timedelta(days=rnd.randrange(days))) for _ in range(views)}
+    VariantViewDay.objects.bulk_create(
+        [VariantViewDay(variant_id=v, day=d, views=rnd.randint(1, 50)) for v, d in seen], batch_size=5000)
+    couples = {tuple(sorted((pick(), pick()))) for _ in range(pairs)}
+    CopurchaseVariantStat.objects.bulk_create(
+        [CopurchaseVariantStat(variant_min_id=a, variant_max_id=b, count=1) for a, b in couples if a != b],
+        batch_size=5000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=100000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--views', type=int, default=300000, help='строк VariantViewDay (вариант, день)')
+    parser.add_argument('--pairs', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+    args = parser.parse_args()
+
+    from django.db import connection
+    from products.utils import catalog_index, popularity
+    from products.utils.list import base_qs, order_qs
+
+    with test_database():
+        seed_catalog(variants=args.variants, text_attrs=0, number_attrs=0)
+        seed_activity(args.orders, args.views, args.pairs)
+
+        catalog_index.get_index()
+        t0 = time.perf_counter()
+        changed = popularity.recompute()
+        recompute_ms = (time.perf_counter() - t0) * 1000
+        # воркер после пересчёта: перечитать колонку popularity против полной сборки индекса
+        t0 = time.perf_counter()
+        catalog_index.get_index()
+        refresh_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        catalog_index.CatalogIndex.build(0)
+        build_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        popularity.recompute()
+        idle_ms = (time.perf_counter() - t0) * 1000
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        def first_page():
+            return [v.id for v in order_qs(base_qs(), 'pop')[:24]]
+
+        options = {'analyze': True} if args.analyze and connection.vendor == 'postgresql' else {}
+        print(order_qs(base_qs(), 'pop')[:24].explain(**options))
+        q, ms, _ = measure(first_page, args.repeat)
+        report(f'popularity, {args.variants} variants: recompute {recompute_ms:.0f} ms ({changed} changed), '
+               f'repeat with no changes {idle_ms:.0f} ms; index: popularity refresh {refresh_ms:.0f} ms, '
+               f'full build {build_ms:.0f} ms', [('first page, sort=pop', q, ms)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Первая страница поиска: SQL (resolve_query + tsquery + count) против кэша
+выдачи products.utils.search_cache (только строки страницы по id) и цена
+записи в журнал поиска (products.utils.search_log.record) на запрос.
+
+    python scripts/bench_search_cache.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/bench_search_cache.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    from products.utils import search_cache, search_log
+    from products.utils.cursor import QuerySetSource, paginate_cursor, parse_ordering
+    from products.utils.list import apply_scope, base_qs, order_qs, ordering_for, parse_params
+    from products.utils.search import reindex_dirty
+    from django.test import RequestFactory
+
+    with test_database():
+        seed_catalog(variants=args.variants, text_attrs=1, number_attrs=0)
+        reindex_dirty(batch_size=5000)
+        params = parse_params(RequestFactory().get('/', {'q': 'brand 007 model'}))
+        ordering = parse_ordering(ordering_for(params.sort, ranked=True))
+
+        def sql_source():
+            qs = order_qs(apply_scope(base_qs(), None, None, params), params.sort, ranked=True)
+            return QuerySetSource(qs, ordering)
+
+        def page(source):
+            p = paginate_cursor(source, ordering, None)
+            return [v.id for v in p.object_list], p.count
+
+        key = search_cache.search_key('/catalog/search/', params)
+        q_sql, ms_sql, sql = measure(lambda: page(sql_source()), args.repeat)
+        page(search_cache.CachedSearch(key, ordering, sql_source))  # прогрев
+        q_hit, ms_hit, hit = measure(lambda: page(search_cache.CachedSearch(key, ordering, sql_source)), args.repeat)
+        assert sql == hit
+        q_log, ms_log, _ = measure(lambda: search_log.record(params.q, hit[1], 10.0), args.repeat)
+
+        report(f'first search page, {args.variants} variants, {hit[1]} matches', [
+            ('SQL', q_sql, ms_sql),
+            ('search_cache hit', q_hit, ms_hit),
+            ('search_log.record', q_log, ms_log),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Поиск с нормализацией написания (products.utils.search.filter_search): запрос
+как набран, транслитом и в другой раскладке — число запросов и время первой
+страницы должны совпадать, сколько бы вариантов написания ни было.
+
+    python scripts/bench_search_spelling.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/bench_search_spelling.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+QUERIES = (
+    ('as typed', 'brand 007 model'),
+    ('transliterated', 'бранд 007 модел'),
+    ('wrong layout', 'икфтв 007 ьщвуд'),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    from django.db import connection
+    from products.models import SearchTerm
+    from products.utils.list import base_qs, order_qs
+    from products.utils.search import filter_search, reindex_dirty
+
+    with test_database():
+        seed_catalog(variants=args.variants, text_attrs=1, number_attrs=0)
+        reindex_dirty(batch_size=5000)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+
+        rows, results = [], []
+        for title, q in QUERIES:
+            queries, ms, ids = measure(lambda: [v.id for v in order_qs(filter_search(base_qs(), q), 'pop')[:24]],
+                                       args.repeat)
+            rows.append((title, queries, ms))
+            results.append(ids)
+        assert results[0] and all(r == results[0] for r in results), 'spellings must find the same page'
+        report(f'search page, {args.variants} variants, {SearchTerm.objects.count()} dictionary words', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Контентная похожесть для рекомендаций: прежний цикл по парам в Python
+(reco_variants._content_similarity по множествам "slug=value") против матриц
+products.utils.similarity — top-K соседей для каждого варианта категории пачками.
+Цикл по парам на всей категории слишком долог — меряется на --sample строках и
+пересчитывается на все; на них же сверяются значения.
+
+    python scripts/bench_similarity.py --variants 50000
+"""
+import argparse
+import time
+
+from bench_catalog import report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=50000)
+    parser.add_argument('--sample', type=int, default=50, help='строк для цикла по парам')
+    parser.add_argument('--top-k', type=int, default=24)
+    args = parser.parse_args()
+
+    from products.models import Variant
+    from products.utils import reco_variants
+    from products.utils.similarity import ContentSimilarity
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants, text_attrs=6, number_attrs=2)
+        pool = list(reco_variants._light(Variant.objects.filter(product__category=cat, is_active=True)))
+        t0 = time.perf_counter()
+        sig_map = reco_variants._attr_signature([v.id for v in pool])
+        signature_ms = (time.perf_counter() - t0) * 1000
+
+        sample = pool[:args.sample]
+        t0 = time.perf_counter()
+        loop = [[reco_variants._content_similarity(a, b, sig_map) for b in pool] for a in sample]
+        loop_ms = (time.perf_counter() - t0) * 1000 * len(pool) / len(sample)
+
+        t0 = time.perf_counter()
+        engine = ContentSimilarity.from_variants(pool, sig_map)
+        encode_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        top = engine.top_k(args.top_k)
+        top_ms = (time.perf_counter() - t0) * 1000
+
+        assert engine.block(range(len(sample))).tolist() == loop
+        for i, (row, (cols, sims)) in enumerate(zip(loop, top)):
+            others = sorted((x for j, x in enumerate(row) if j != i), reverse=True)
+            assert sims.tolist() == others[:args.top_k]
+        report(f'content similarity, {len(pool)} variants, {engine.attrs.shape[1]} attr features, '
+               f'top {args.top_k}; signatures {signature_ms:.0f} ms', [
+                   ('pairs in Python (est.)', 0, loop_ms),
+                   ('matrix: encode', 0, encode_ms),
+                   ('matrix: top-K, chunked', 0, top_ms),
+               ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Подсказки поиска (/catalog/suggest/): поиск по VariantSearch (как products:search,
+первые 8 вариантов) против in-process префиксного индекса products.utils.suggest —
+время сборки индекса и задержка на запрос для разных префиксов.
+
+    python scripts/bench_suggest.py --variants 100000
+    DATABASE_URL=postgres://... python scripts/bench_suggest.py
+"""
+import argparse
+import time
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+QUERIES = ('m', 'mod', 'model 12', 'brand 01', 'art-0123', 'art0999', 'дет', 'brand 007 model 3')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    from django.test import RequestFactory
+    from products import views
+    from products.utils import suggest
+    from products.utils.cards import refresh_cards
+    from products.utils.list import base_qs
+    from products.utils.search import filter_search, reindex_dirty
+
+    with test_database():
+        seed_catalog(variants=args.variants, text_attrs=1, number_attrs=0)
+        reindex_dirty(batch_size=5000)
+
+        t0 = time.perf_counter()
+        index = suggest.get_index()
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        factory = RequestFactory()
+        rows = []
+        for q in QUERIES:
+            q_sql, ms_sql, _ = measure(lambda: [v.id for v in filter_search(base_qs(), q)[:suggest.LIMIT]], args.repeat)
+            q_idx, ms_idx, ids = measure(lambda: index.variants(q), args.repeat)
+            refresh_cards(ids)  # seed_catalog идёт мимо сигналов — карточки только для выдачи
+            q_view, ms_view, _ = measure(lambda: views.suggest(factory.get('/', {'q': q})), args.repeat)
+            rows += [(f'{q!r}: SQL', q_sql, ms_sql),
+                     (f'{q!r}: index ({len(ids)})', q_idx, ms_idx),
+                     (f'{q!r}: view', q_view, ms_view)]
+
+        report(f'suggest, {args.variants} variants, {len(index.terms)} terms (index build {build_ms:.0f} ms)', rows)
+
+
+if __name__ == '__main__':
+    main()
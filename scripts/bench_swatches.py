@@ -0,0 +1,52 @@
+"""
+Свотчи соседей в карточках листинга (products.utils.swatches): страница из 24 карточек —
+наивно (соседи каждого товара через Product.variants) против одного запроса на страницу
+(build) и наборов из кэша по версиям товаров (load).
+
+    python scripts/bench_swatches.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/bench_swatches.py
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--per-product', type=int, default=8)
+    parser.add_argument('--page', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from django.core.cache import cache
+    from products.utils import swatches
+    from products.utils.detail import fmt_value
+    from products.utils.list import base_qs, order_qs
+
+    with test_database():
+        seed_catalog(variants=args.variants, variants_per_product=args.per_product)
+        variants = list(order_qs(base_qs(), 'price_asc')[:args.page])
+        product_ids = [v.product_id for v in variants]
+
+        def naive():
+            return {v.id: [(fmt_value(av), s.get_absolute_url())
+                           for s in v.product.variants.filter(is_active=True)
+                           for av in s.attribute_values.select_related('attribute')
+                           if av.attribute_id in {ca.attribute_id for ca in v.product.variant_attributes}]
+                    for v in variants}
+
+        def cold():
+            cache.clear()
+            return swatches.load(product_ids)
+
+        swatches.load(product_ids)
+        report(f'swatches, {args.variants} variants, {args.per_product} per product, page of {args.page}', [
+            ('per card (Product.variants)', *measure(naive, args.repeat)[:2]),
+            ('batched, cold cache', *measure(cold, args.repeat)[:2]),
+            ('batched, cached', *measure(lambda: swatches.for_cards(variants), args.repeat)[:2]),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Планы запроса страницы листинга с фильтрами по атрибутам: прежняя схема
+(JOIN на AttributeValue на каждый GET-параметр + DISTINCT) против
+apply_attr_filters (EXISTS на атрибут), плюс время первой страницы.
+
+    python scripts/explain_attr_filters.py --variants 20000
+    DATABASE_URL=postgres://... python scripts/explain_attr_filters.py --analyze
+"""
+import argparse
+
+from bench_catalog import measure, report, seed_catalog, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--variants', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (только PostgreSQL)')
+    args = parser.parse_args()
+
+    from django.db import connection
+    from django.test import RequestFactory
+    from products.utils.list import (
+        _LOOKUP, _VALUE_FIELD, apply_attr_filters, apply_scope, attr_slug_map, base_qs, compile_attr_filters,
+        order_qs, parse_params,
+    )
+
+    def joined(qs, params, by_slug):
+        # как было: по фильтру (и JOIN) на параметр, потом DISTINCT по всему результату
+        for a, op, value in compile_attr_filters(params, by_slug):
+            field = f"attribute_values__{_VALUE_FIELD[a.value_type]}{_LOOKUP[op]}"
+            qs = qs.filter(**{"attribute_values__attribute__slug": a.slug, field: value})
+        return qs
+
+    with test_database():
+        cat = seed_catalog(variants=args.variants)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+        params = parse_params(RequestFactory().get('/', {
+            'a_text-1': 'v1,v2,v3', 'a_text-2': 'v4,v5', 'a_num-0_min': '5', 'a_num-0_max': '20',
+        }))
+        by_slug = attr_slug_map(cat)
+        scope = apply_scope(base_qs(), cat, None, params)
+
+        def before():
+            return order_qs(joined(scope, params, by_slug), params.sort).distinct()[:24]
+
+        def after():
+            return order_qs(apply_attr_filters(scope, params, by_slug), params.sort)[:24]
+
+        options = {'analyze': True} if args.analyze and connection.vendor == 'postgresql' else {}
+        for title, qs in (('JOIN per parameter + DISTINCT', before), ('EXISTS per attribute', after)):
+            print(f'\n=== {title} ===')
+            print(qs().explain(**options))
+
+        q_old, ms_old, old = measure(lambda: [v.id for v in before()], args.repeat)
+        q_new, ms_new, new = measure(lambda: [v.id for v in after()], args.repeat)
+        assert old == new
+        report(f'first listing page, {args.variants} variants, 4 attribute parameters', [
+            ('JOIN + DISTINCT', q_old, ms_old),
+            ('EXISTS', q_new, ms_new),
+        ])
+
+
+if __name__ == '__main__':
+    main()
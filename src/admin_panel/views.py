@@ -8,6 +8,7 @@ from django.db.models import Count
 from django.db.models.functions import TruncDate
 from django.core.cache import cache
 from cart.models import Order
+from products.utils import page_cache, search_cache, search_log
 
 TZ = timezone.get_current_timezone()
 
@@ -124,5 +125,9 @@ def admin_index(request):
         "ord_shift": orders["shift"],
         "ord_start": timezone.localtime(orders["start"]),
         "ord_end": timezone.localtime(orders["end"]),
+        "list_cache": page_cache.stats(),
+        "detail_cache": page_cache.stats(page_cache.DETAIL),
+        "search_cache": search_cache.stats(),
+        "search_log": search_log.report(),
     })
     return TemplateResponse(request, "admin/index.html", ctx)
\ No newline at end of file
@@ -0,0 +1,15 @@
+# cart/management/commands/backfill_copurchases.py
+from django.core.management.base import BaseCommand
+
+from cart.signals_copurchase_variant import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает статистику ко-покупок (CopurchaseVariantStat) по всем позициям заказов "
+        "одним INSERT … SELECT; после — build_recommendations --all."
+    )
+
+    def handle(self, *args, **opts):
+        pairs = backfill()
+        self.stdout.write(self.style.SUCCESS(f"Готово. Пар в истории заказов: {pairs}"))
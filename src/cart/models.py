@@ -107,29 +107,24 @@ class Cart(models.Model):
 
     # --- данные для фронта ---
     def get_items(self):
-        rows = (self.items
-                .select_related(
-                    'variant', 'variant__product', 'variant__product__brand', 'variant__product__category'
-                )
-                .prefetch_related('variant__images'))
+        # название, фото и ссылка — из VariantCard: вся корзина одним запросом
+        rows = self.items.select_related('variant', 'variant__card')
         data = []
         for ci in rows:
             v = ci.variant
-            name = v.display_name() if hasattr(v, "display_name") and callable(v.display_name) else str(v)
-            first_img = v.images.first()
-            img_url = first_img.image.url if first_img and first_img.image else ""
+            card = v.card_view
             unit_price = float(v.price)
             item_total = int(round(unit_price * ci.quantity))
             data.append({
                 "variant": {
                     "id": v.id,
-                    "name": name,
-                    "imageURL": img_url,
-                    "main_image_url": getattr(v, "main_image_url", lambda: img_url)(),
+                    "name": card.display_name,
+                    "imageURL": card.thumb_url,
+                    "main_image_url": card.thumb_url,
                     "inventory": v.inventory,
                     "slug": v.slug or "",
                     "price": unit_price,
-                    "product_url": v.get_absolute_url(),
+                    "product_url": card.url_path,
                 },
                 "quantity": ci.quantity,
                 "product_total_price": item_total
@@ -279,28 +274,23 @@ class SessionCart:
         ids = list(self.cart.keys())
         if not ids:
             return []
-        variants = (Variant.objects
-                    .filter(id__in=ids)
-                    .select_related('product', 'product__brand', 'product__category')
-                    .prefetch_related('images'))
+        variants = Variant.objects.filter(id__in=ids).select_related('card')
         out = []
         for v in variants:
             qty = int(self.cart.get(str(v.id), 0))
-            name = v.display_name() if hasattr(v, "display_name") and callable(v.display_name) else str(v)
-            first_img = v.images.first()
-            img_url = first_img.image.url if first_img and first_img.image else ""
+            card = v.card_view
             unit_price = float(v.price)
             item_total = int(round(unit_price * qty))
             out.append({
                 "variant": {
                     "id": v.id,
-                    "name": name,
-                    "imageURL": img_url,
-                    "main_image_url": getattr(v, "main_image_url", lambda: img_url)(),
+                    "name": card.display_name,
+                    "imageURL": card.thumb_url,
+                    "main_image_url": card.thumb_url,
                     "inventory": v.inventory,
                     "slug": v.slug or "",
                     "price": unit_price,
-                    "product_url": v.get_absolute_url(),
+                    "product_url": card.url_path,
                 },
                 "quantity": qty,
                 "product_total_price": item_total
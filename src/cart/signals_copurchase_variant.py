@@ -1,15 +1,106 @@
+"""
+Статистика ко-покупок (CopurchaseVariantStat): пара вариантов (min, max) и число заказов,
+в которых они встретились.
+
+Оформление заказа пары не пишет — после коммита ставит задачу cart.tasks.record_copurchases;
+задача пишет все пары заказа одним INSERT … ON CONFLICT DO UPDATE (count = count + EXCLUDED.count).
+backfill() пересчитывает статистику по всем OrderItem одним INSERT … SELECT.
+"""
+import uuid
 from itertools import combinations
-from django.db.models import F
-from django.db import transaction
+from typing import Iterable, List, Mapping, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cart.models import Order, OrderItem
 from products.models import CopurchaseVariantStat
+from products.utils.reco_variants import touch_variants
+from products.utils.search import is_postgres
+
+BATCH_SIZE = 500  # пар на один INSERT … VALUES (sqlite)
+
+Pair = Tuple[uuid.UUID, uuid.UUID]
+
+_STAT = CopurchaseVariantStat._meta.db_table
+
+_UPSERT_SQL = f"""
+INSERT INTO {_STAT} (variant_min_id, variant_max_id, count, last_seen)
+{{rows}}
+ON CONFLICT (variant_min_id, variant_max_id)
+DO UPDATE SET count = {_STAT}.count + EXCLUDED.count, last_seen = EXCLUDED.last_seen
+"""
+
+# пары по порядку: встречные upsert'ы блокируют строки в одной последовательности и не ловят дедлок
+_UNNEST = ("SELECT u.a, u.b, u.n, %s FROM unnest(%s::uuid[], %s::uuid[], %s::integer[]) AS u(a, b, n)"
+           " ORDER BY u.a, u.b")
+
+# WHERE обязателен: без него sqlite читает ON CONFLICT как условие JOIN
+_BACKFILL_SQL = f"""
+INSERT INTO {_STAT} (variant_min_id, variant_max_id, count, last_seen)
+SELECT a.variant_id, b.variant_id, COUNT(DISTINCT a.order_id), MAX(o.date_ordered)
+FROM {OrderItem._meta.db_table} a
+JOIN {OrderItem._meta.db_table} b ON b.order_id = a.order_id AND a.variant_id < b.variant_id
+JOIN {Order._meta.db_table} o ON o.id = a.order_id
+WHERE true
+GROUP BY a.variant_id, b.variant_id
+ORDER BY a.variant_id, b.variant_id
+ON CONFLICT (variant_min_id, variant_max_id)
+DO UPDATE SET count = EXCLUDED.count, last_seen = EXCLUDED.last_seen
+"""
+
+
+def _ids(variant_ids: Iterable) -> List[uuid.UUID]:
+    # строки из задачи и UUID из корзины сортируются одинаково — как uuid в PG и hex в sqlite
+    return sorted({uuid.UUID(str(v)) for v in variant_ids if v})
+
+
+def bump_copurchases_variants(variant_ids) -> None:
+    """Ставит запись пар заказа после коммита текущей транзакции; повторы id не важны."""
+    from cart.tasks import record_copurchases
+
+    ids = [str(v) for v in _ids(variant_ids)]
+    if len(ids) < 2:
+        return
+    # брокер недоступен — заказ всё равно оформлен, статистику догонит backfill
+    transaction.on_commit(lambda: record_copurchases.delay(ids), robust=True)
+
+
+def write_pairs(counts: Mapping[Pair, int]) -> int:
+    """Прибавляет count к парам (min < max); отсутствующие создаёт. Возвращает число пар."""
+    rows = sorted(counts.items())  # (min, max) по возрастанию — порядок блокировок
+    if not rows:
+        return 0
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_postgres():
+            cursor.execute(_UPSERT_SQL.format(rows=_UNNEST), [
+                now, [str(a) for (a, _), _ in rows], [str(b) for (_, b), _ in rows], [n for _, n in rows],
+            ])
+        else:
+            field = CopurchaseVariantStat._meta.get_field
+            prep_id = field("variant_min").get_db_prep_value
+            last_seen = field("last_seen").get_db_prep_value(now, connection)
+            for start in range(0, len(rows), BATCH_SIZE):
+                batch = rows[start:start + BATCH_SIZE]
+                values = "VALUES " + ", ".join(["(%s, %s, %s, %s)"] * len(batch))
+                cursor.execute(_UPSERT_SQL.format(rows=values), [
+                    p for (a, b), n in batch for p in (prep_id(a, connection), prep_id(b, connection), n, last_seen)
+                ])
+    return len(rows)
+
+
+def record(variant_ids) -> int:
+    """Пары одного заказа: +1 каждой; рекомендации вариантов пересоберутся."""
+    ids = _ids(variant_ids)
+    written = write_pairs({pair: 1 for pair in combinations(ids, 2)})
+    if written:
+        touch_variants(ids)
+    return written
+
 
-def bump_copurchases_variants(variant_ids: list[int]) -> None:
-    ids = sorted(set(v for v in variant_ids if v))
-    if len(ids) < 2: return
-    with transaction.atomic():
-        for a, b in combinations(ids, 2):
-            obj, created = CopurchaseVariantStat.objects.get_or_create(
-                variant_min_id=a, variant_max_id=b, defaults={"count": 1}
-            )
-            if not created:
-                CopurchaseVariantStat.objects.filter(pk=obj.pk).update(count=F("count")+1)
\ No newline at end of file
+def backfill() -> int:
+    """Пересчитывает count и last_seen всех пар по истории OrderItem; возвращает число пар в истории."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_BACKFILL_SQL)
+        return cursor.rowcount
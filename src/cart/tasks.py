@@ -0,0 +1,9 @@
+from celery import shared_task
+from django.db import OperationalError
+
+from cart import signals_copurchase_variant as copurchase
+
+# дедлок встречных upsert'ов, обрыв соединения: запись пар атомарна, повтор безопасен
+@shared_task(bind=True, autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
+def record_copurchases(self, variant_ids):
+    return {"pairs": copurchase.record(variant_ids)}
@@ -318,7 +318,7 @@ def checkout(request):
             )
             for v, q in lines:
                 OrderItem.objects.create(order=order, variant=v, price=v.price, quantity=q, amount=(D(v.price) * int(q)).quantize(D("0.01")))
-            bump_copurchases_variants([v.id for v, q in lines for _ in range(q)])
+            bump_copurchases_variants([v.id for v, q in lines])  # запись — задачей после коммита
       except Exception:
         logger.exception("Failed to create order or order items for checkout")
         messages.error(request, "Не удалось оформить заказ. Попробуйте ещё раз.", extra_tags="global")
@@ -1,7 +1,8 @@
 # core/context_processors.py
 from django.urls import reverse, NoReverseMatch
 from django.apps import apps
-from products.models import Category, Brand, Variant
+from products.models import Brand, Variant
+from products.utils.category_tree import get_tree
 from .models import Page
 from django.core.cache import cache
 from django.utils.timezone import localtime
@@ -68,6 +69,9 @@ def _apply_rules(items, path, rm):
                 return True
     return False
 
+def _category_url(tree, cat_id):
+    return reverse("products:category", kwargs={"category_path": tree.path(cat_id)})
+
 def breadcrumbs(request):
     path = (request.path or "/").rstrip("/") + "/"
     rm = getattr(request, "resolver_match", None)
@@ -84,25 +88,23 @@ def breadcrumbs(request):
     variant_slug = kw.get("slug")
 
     if variant_slug:
-        variant = (
-            Variant.objects
-            .select_related("product", "product__category", "product__category__parent")
-            .filter(slug=variant_slug)
-            .first()
-        )
-
-        if variant:
-            category = variant.product.category
-
-            chain = []
-            while category:
-                chain.append(category)
-                category = category.parent
-
-            for cat in reversed(chain):
-                items.append((cat.title, cat.get_absolute_url()))
-
-            items.append((str(variant), None))
+        # (категория, название) кладёт products.views.detail — без второго запроса варианта
+        crumb = getattr(request, "variant_crumb", None)
+        if crumb is None:
+            variant = (
+                Variant.objects
+                .select_related("product", "product__brand", "product__category")
+                .filter(slug=variant_slug)
+                .first()
+            )
+            crumb = (variant.product.category_id, str(variant)) if variant else None
+
+        if crumb:
+            tree = get_tree()
+            for node in tree.ancestors(crumb[0]):
+                items.append((node.title, _category_url(tree, node.id)))
+
+            items.append((crumb[1], None))
             return {"breadcrumbs": items, "breadcrumbs_is_variant": True}
 
     if path.startswith("/legal/"):
@@ -127,10 +129,10 @@ def breadcrumbs(request):
 
     cat_path = kw.get("category_path")
     if cat_path:
-        parts = [p for p in cat_path.strip("/").split("/") if p]
-        for i, seg in enumerate(parts):
-            cat = Category.objects.get(slug=seg)
-            items.append((cat.title, cat.get_absolute_url()))
+        tree = get_tree()
+        cat_id = tree.resolve(cat_path)
+        for node in tree.ancestors(cat_id) if cat_id else []:
+            items.append((node.title, _category_url(tree, node.id)))
         return {"breadcrumbs": items, "breadcrumbs_is_variant": False}
 
     return {"breadcrumbs": items, "breadcrumbs_is_variant": False}
@@ -155,3 +155,106 @@ if (document.readyState === 'loading') {
   init();
 }
 })();
+
+
+// подсказки поиска в шапке (products:suggest)
+(function() {
+const form = document.getElementById('search-form');
+if (!form || !form.dataset.suggestUrl) return;
+const input = form.querySelector('.search__input');
+const box = document.createElement('div');
+box.className = 'suggest';
+box.hidden = true;
+form.appendChild(box);
+
+let timer = null;
+let controller = null;
+let active = -1;
+
+function item(href, text, thumb, price) {
+  const a = document.createElement('a');
+  a.className = 'suggest__item';
+  a.href = href;
+  if (thumb) {
+    const img = document.createElement('img');
+    img.className = 'suggest__thumb';
+    img.src = thumb;
+    img.alt = '';
+    img.loading = 'lazy';
+    a.appendChild(img);
+  }
+  const name = document.createElement('span');
+  name.className = 'suggest__name';
+  name.textContent = text;
+  a.appendChild(name);
+  if (price) {
+    const p = document.createElement('span');
+    p.className = 'suggest__price';
+    p.textContent = Number(price).toLocaleString('ru-RU') + ' ₽';
+    a.appendChild(p);
+  }
+  return a;
+}
+
+function group(title, nodes) {
+  if (!nodes.length) return;
+  const h = document.createElement('div');
+  h.className = 'suggest__group';
+  h.textContent = title;
+  box.appendChild(h);
+  nodes.forEach(n => box.appendChild(n));
+}
+
+function render(data) {
+  box.replaceChildren();
+  active = -1;
+  group('Категории', data.categories.map(c => item(c.url, c.title)));
+  group('Бренды', data.brands.map(b => item(b.url, b.title)));
+  group('Товары', data.variants.map(v => item(v.url, v.name, v.thumb, v.price)));
+  box.hidden = !box.childElementCount;
+}
+
+function load() {
+  const q = input.value.trim();
+  if (q.length < 2) {
+    box.hidden = true;
+    return;
+  }
+  if (controller) controller.abort();
+  controller = new AbortController();
+  fetch(form.dataset.suggestUrl + '?q=' + encodeURIComponent(q), {signal: controller.signal})
+      .then(r => r.ok ? r.json() : null)
+      .then(data => {
+        if (data && data.q === input.value.trim()) render(data);
+      })
+      .catch(() => {});
+}
+
+input.addEventListener('input', () => {
+  clearTimeout(timer);
+  timer = setTimeout(load, 150);
+});
+
+input.addEventListener('keydown', ev => {
+  const items = box.querySelectorAll('.suggest__item');
+  if (box.hidden || !items.length) return;
+  if (ev.key === 'ArrowDown' || ev.key === 'ArrowUp') {
+    ev.preventDefault();
+    if (active >= 0) items[active].classList.remove('is-active');
+    active = (active + (ev.key === 'ArrowDown' ? 1 : items.length - 1 + (active < 0 ? 1 : 0))) % items.length;
+    items[active].classList.add('is-active');
+  } else if (ev.key === 'Enter' && active >= 0) {
+    ev.preventDefault();
+    window.location.href = items[active].href;
+  } else if (ev.key === 'Escape') {
+    box.hidden = true;
+  }
+});
+
+document.addEventListener('click', ev => {
+  if (!form.contains(ev.target)) box.hidden = true;
+});
+input.addEventListener('focus', () => {
+  if (box.childElementCount) box.hidden = false;
+});
+})();
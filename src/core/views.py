@@ -10,8 +10,9 @@ from django.http import HttpResponse
 def home(request):
     wheel = Wheel.objects.filter(is_active=True).order_by("order")
     brands = Brand.objects.all()
-    variants_rec = Variant.objects.filter(rec=True, inventory__gt=0)[:20]
-    variants_new = Variant.objects.filter(new=True, inventory__gt=0)[:20]
+    # карточки — из VariantCard, по одному запросу на блок
+    variants_rec = Variant.objects.filter(rec=True, inventory__gt=0).select_related("card")[:20]
+    variants_new = Variant.objects.filter(new=True, inventory__gt=0).select_related("card")[:20]
     pickups = PickupPoint.objects.filter(is_main=True).order_by("city", "sort", "title")
 
     social_links = SocialLink.objects.all()
@@ -76,6 +76,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 MIDDLEWARE = [
@@ -338,10 +339,41 @@ CELERY_BEAT_SCHEDULE = {
         "task": "products.tasks.update_inventory_minutely",
         "schedule": 60.0,  # раз в минуту
     },
+    "search-reindex-dirty": {
+        "task": "products.tasks.reindex_search_dirty",
+        "schedule": 300.0,  # добираем документы, помеченные dirty правками брендов/категорий
+    },
+    "cards-rebuild-dirty": {
+        "task": "products.tasks.rebuild_cards_dirty",
+        "schedule": 300.0,  # то же для карточек вариантов (VariantCard)
+    },
+    "search-log-flush": {
+        "task": "products.tasks.flush_search_log",
+        "schedule": 60.0,  # журнал поиска из буфера в Redis — пачкой в SearchLog
+    },
+    "variant-views-flush": {
+        "task": "products.tasks.flush_variant_views",
+        "schedule": 300.0,  # просмотры вариантов из буфера в Redis — в VariantViewDay
+    },
+    "popularity-recompute": {
+        "task": "products.tasks.recompute_popularity",
+        "schedule": 3600.0,  # Variant.popularity для сортировки "pop"
+    },
+    "category-facets-rebuild": {
+        "task": "products.tasks.rebuild_category_facets",
+        "schedule": 60.0,  # снимки фасетов категорий без фильтров (facet_snapshot), изменившихся категорий
+    },
+    "recommendations-build": {
+        "task": "products.tasks.build_recommendations",
+        "schedule": 600.0,  # RelatedVariant(source=AUTO) по категориям, затронутым правками и заказами
+    },
 }
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
 
+# In-process индекс каталога (products/utils/catalog_index.py); False — листинг и фасеты идут через SQL
+CATALOG_INDEX_ENABLED = env_bool("CATALOG_INDEX_ENABLED", True)
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
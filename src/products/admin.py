@@ -11,6 +11,7 @@ from django.db.models import Prefetch
 from .models import *
 
 from products.integrations.ms import get, save_variant_images, HEADERS
+from products.utils import reco_variants
 
 
 # ---------- helpers ----------
@@ -211,7 +212,7 @@ class VariantAdmin(SortableAdminBase, ColumnToggleModelAdmin):
     list_display = (
         "image_preview", "id", "display_name_col", "slug",
         "seller_article", "ozon_article", "wb_article", "price", "old_price",
-        "inventory", "new", "rec", "is_active", "updated",
+        "discount", "inventory", "new", "rec", "is_active", "updated",
     )
     default_selected_columns = list(list_display)
     list_display_links = ("image_preview", "id", "display_name_col")
@@ -307,6 +308,16 @@ class RelatedVariantAdmin(admin.ModelAdmin):
     autocomplete_fields = ("from_variant","to_variant")
     ordering = ("-pinned","-weight","position","id")
 
+    # post_delete у RelatedVariant нет (см. products.signals) — категории для пересчёта рекомендаций отмечаем здесь
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        reco_variants.touch_variants([obj.from_variant_id])
+
+    def delete_queryset(self, request, queryset):
+        from_ids = list(queryset.values_list("from_variant_id", flat=True))
+        super().delete_queryset(request, queryset)
+        reco_variants.touch_variants(from_ids)
+
 @admin.register(CopurchaseVariantStat)
 class CopurchaseVariantStatAdmin(admin.ModelAdmin):
     list_display = ("variant_min","variant_max","count","last_seen")
\ No newline at end of file
@@ -5,6 +5,8 @@ from products.models import Variant
 from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
+from products.utils.catalog_index import record_changes
+from products.utils.versions import CATALOG, bump_products, bump_version
 
 S = requests.Session()
 S.headers.update({
@@ -69,7 +71,14 @@ def sync_inventory() -> dict:
             Variant.objects.bulk_update(to_update, ["inventory"])
         updated = len(to_update)
 
+    gone = list(Variant.objects.exclude(id__in=report_ids).exclude(inventory=0).values_list("id", flat=True))
     zeroed = (Variant.objects.filter(id__isnull=False).exclude(id__in=report_ids).update(inventory=0))
+    if to_update or gone:
+        # bulk_update/update идут мимо сигналов — индексу каталога и страницам вариантов сообщаем сами
+        changed = [v.id for v in to_update] + gone
+        record_changes(changed)
+        bump_products(Variant.objects.filter(id__in=changed).values_list("product_id", flat=True))
+        bump_version(CATALOG)
     total_db = Variant.objects.filter(id__isnull=False).count()
     matched = Variant.objects.filter(id__in=report_ids).count()
     stats = {"total": total_db, "matched": matched, "updated": updated, "zeroed": zeroed}
@@ -0,0 +1,22 @@
+# products/management/commands/build_recommendations.py
+from django.core.management.base import BaseCommand
+
+from products.utils import reco_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рекомендации (RelatedVariant, source=AUTO) по категориям, затронутым "
+        "с прошлого запуска; --all — по всему каталогу (первый запуск, смена весов)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Все категории с активными вариантами")
+
+    def handle(self, *args, **opts):
+        if opts["all"]:
+            written = reco_variants.build_all()
+            self.stdout.write(self.style.SUCCESS(f"Готово. Записано связей: {written}"))
+        else:
+            handled = reco_variants.build_touched()
+            self.stdout.write(self.style.SUCCESS(f"Готово. Разобрано отметок: {handled}"))
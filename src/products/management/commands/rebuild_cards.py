@@ -0,0 +1,32 @@
+# products/management/commands/rebuild_cards.py
+from django.core.management.base import BaseCommand
+
+from products.models import VariantCard
+from products.utils.cards import BATCH_SIZE, pending_ids, refresh_cards
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает карточки вариантов (VariantCard) пачками: варианты без карточки "
+        "или с dirty=True. Каждая пачка коммитится, прерванный прогон продолжается с места остановки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Сначала пометить все карточки dirty (полная пересборка)")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **opts):
+        if opts["all"]:
+            marked = VariantCard.objects.update(dirty=True)
+            self.stdout.write(self.style.NOTICE(f"Помечено к пересборке: {marked}"))
+
+        total = 0
+        while True:
+            ids = pending_ids(opts["batch_size"])
+            if not ids:
+                break
+            total += refresh_cards(ids)
+            self.stdout.write(f"  ... {total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово. Пересобрано карточек: {total}"))
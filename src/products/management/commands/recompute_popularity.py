@@ -0,0 +1,15 @@
+# products/management/commands/recompute_popularity.py
+from django.core.management.base import BaseCommand
+
+from products.utils.popularity import flush_views, recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает Variant.popularity (сортировка «по популярности») по заказам, "
+        "ко-покупкам и просмотрам; то же раз в час делает products.tasks.recompute_popularity."
+    )
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"Просмотров из буфера: {flush_views()}")
+        self.stdout.write(self.style.SUCCESS(f"Готово. Изменилось вариантов: {recompute()}"))
@@ -0,0 +1,33 @@
+# products/management/commands/reindex_search.py
+from django.core.management.base import BaseCommand
+
+from products.models import VariantSearch
+from products.utils.search import BATCH_SIZE, pending_ids, reindex_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает поисковые документы вариантов пачками. "
+        "Обрабатываются документы без строки в индексе или с dirty=True; "
+        "каждая пачка коммитится, поэтому после прерывания достаточно запустить команду ещё раз."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Сначала пометить все документы dirty (полная пересборка)")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **opts):
+        if opts["all"]:
+            marked = VariantSearch.objects.update(dirty=True)
+            self.stdout.write(self.style.NOTICE(f"Помечено к пересборке: {marked}"))
+
+        total = 0
+        while True:
+            ids = pending_ids(opts["batch_size"])
+            if not ids:
+                break
+            total += reindex_variants(ids)
+            self.stdout.write(f"  ... {total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Готово. Переиндексировано: {total}"))
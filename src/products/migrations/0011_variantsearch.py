@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:19
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.operations import UnaccentExtension
+from django.db import migrations, models
+
+
+# Конфиг lbs_ru: russian + unaccent перед стеммером (ё/е, латиница с диакритикой).
+# Только PostgreSQL — на sqlite поиск работает по title/body без tsvector.
+FORWARD_SQL = [
+    "CREATE TEXT SEARCH CONFIGURATION lbs_ru (COPY = pg_catalog.russian)",
+    "ALTER TEXT SEARCH CONFIGURATION lbs_ru "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, russian_stem",
+    "CREATE INDEX products_variantsearch_vector_gin "
+    "ON products_variantsearch USING gin (vector)",
+]
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS products_variantsearch_vector_gin",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS lbs_ru",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_brand_description'),
+    ]
+
+    operations = [
+        UnaccentExtension(),
+        migrations.CreateModel(
+            name='VariantSearch',
+            fields=[
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='products.variant')),
+                ('title', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('dirty', models.BooleanField(db_index=True, default=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.RunPython(_run(FORWARD_SQL), _run(BACKWARD_SQL)),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_variantsearch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantCard',
+            fields=[
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='products.variant')),
+                ('display_name', models.TextField(blank=True, default='')),
+                ('label', models.TextField(blank=True, default='')),
+                ('url_path', models.TextField(blank=True, default='')),
+                ('thumb_url', models.TextField(blank=True, default='')),
+                ('gallery', models.JSONField(blank=True, default=list)),
+                ('discount_percent', models.PositiveSmallIntegerField(default=0)),
+                ('dirty', models.BooleanField(db_index=True, default=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Карточка варианта',
+                'verbose_name_plural': 'Карточки вариантов',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_variantcard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attributevalue',
+            index=models.Index(fields=['attribute', 'value_text', 'variant'], name='attrvalue_attr_text_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attributevalue',
+            index=models.Index(fields=['attribute', 'value_number', 'variant'], name='attrvalue_attr_number_idx'),
+        ),
+    ]
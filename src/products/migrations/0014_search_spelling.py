@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+# ^@ (starts_with) по словарю — SP-GiST; опечатки — pg_trgm, если расширение есть
+# на сервере (без него resolve_query просто не исправляет опечатки). Только PostgreSQL.
+FORWARD_SQL = [
+    "CREATE INDEX products_searchterm_word_spgist ON products_searchterm USING spgist (word)",
+]
+TRGM_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX products_searchterm_word_trgm ON products_searchterm USING gin (word gin_trgm_ops)",
+]
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS products_searchterm_word_trgm",
+    "DROP INDEX IF EXISTS products_searchterm_word_spgist",
+]
+
+
+def forwards(apps, schema_editor):
+    # документы без keys — переиндексирует products.tasks.reindex_search_dirty
+    apps.get_model("products", "VariantSearch").objects.update(dirty=True)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    statements = list(FORWARD_SQL)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone():
+            statements += TRGM_SQL
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in BACKWARD_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_attributevalue_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('word', models.CharField(max_length=64, primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Слово поиска',
+                'verbose_name_plural': 'Словарь поиска',
+            },
+        ),
+        migrations.AddField(
+            model_name='variantsearch',
+            name='keys',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_search_spelling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=200, verbose_name='Запрос')),
+                ('results', models.PositiveIntegerField(verbose_name='Найдено')),
+                ('ms', models.PositiveIntegerField(verbose_name='Время, мс')),
+                ('created', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Поисковый запрос',
+                'verbose_name_plural': 'Журнал поиска',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_searchlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantViewDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Просмотры варианта за день',
+                'verbose_name_plural': 'Просмотры вариантов',
+            },
+        ),
+        migrations.AddField(
+            model_name='variant',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(models.OrderBy(models.Case(models.When(models.Q(('inventory__gt', 0)), then=models.Value(1)), default=models.Value(0), output_field=models.IntegerField()), descending=True), models.OrderBy(models.F('popularity'), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', True)), name='variant_pop_sort_idx'),
+        ),
+        migrations.AddField(
+            model_name='variantviewday',
+            name='variant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.variant'),
+        ),
+        migrations.AddConstraint(
+            model_name='variantviewday',
+            constraint=models.UniqueConstraint(fields=('variant', 'day'), name='uniq_variant_view_day'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Выражение скидки в float-выражениях — на sqlite целые цены делились нацело.
+# Выражение GeneratedField не меняется на месте: столбец (и индекс по нему) пересоздаются.
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_variant_discount'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='variant',
+            name='variant_discount_sort_idx',
+        ),
+        migrations.RemoveField(
+            model_name='variant',
+            name='discount',
+        ),
+        migrations.AddField(
+            model_name='variant',
+            name='discount',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('old_price__gt', 0), ('price__lt', models.F('old_price'))), then=django.db.models.functions.comparison.Cast(django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(models.Value(100), '-', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '*', models.Value(100.0), output_field=models.FloatField()), '/', models.F('old_price'), output_field=models.FloatField()), output_field=models.FloatField()), output_field=models.DecimalField()), models.IntegerField())), default=models.Value(0), output_field=models.IntegerField()), output_field=models.PositiveSmallIntegerField(), verbose_name='Скидка, %'),
+        ),
+        migrations.AddIndex(
+            model_name='variant',
+            index=models.Index(models.OrderBy(models.Case(models.When(models.Q(('inventory__gt', 0)), then=models.Value(1)), default=models.Value(0), output_field=models.IntegerField()), descending=True), models.OrderBy(models.F('discount'), descending=True), models.OrderBy(models.F('id'), descending=True), condition=models.Q(('is_active', True)), name='variant_discount_sort_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_variant_discount_decimal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatedvariant',
+            name='score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
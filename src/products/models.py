@@ -6,11 +6,32 @@ from django.utils.functional import cached_property
 from unidecode import unidecode
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db.models import Q, CheckConstraint, UniqueConstraint
+from django.db.models import Q, CheckConstraint, UniqueConstraint, Case, When, Value, IntegerField, F, DecimalField, FloatField
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast, Round
+from decimal import Decimal, ROUND_HALF_UP
+from django.contrib.postgres.search import SearchVectorField
 from functools import cached_property
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
 
+def category_url_path(category_id) -> str:
+    """
+    Путь категории для URL ("parts/tires") из кэша дерева (products.utils.category_tree);
+    категорию, которой в дереве воркера ещё нет, собираем обходом parent.
+    """
+    from products.utils.category_tree import get_tree
+    path = get_tree().path(category_id)
+    if path is not None:
+        return path
+    parts = []
+    node = Category.objects.filter(pk=category_id).first()
+    while node:
+        parts.append(node.slug)
+        node = node.parent
+    return "/".join(reversed(parts))  # от корня к листу
+
+
 class Category(models.Model):
     title = models.CharField('Название (основное)', max_length=50, db_index=True, unique=True)
     title_plural = models.CharField('Название (мн.ч.)', max_length=50, null=True, blank=True)
@@ -40,13 +61,7 @@ class Category(models.Model):
         verbose_name_plural = "Категории"
     
     def get_absolute_url(self):
-        parts = []
-        node = self
-        while node:
-            parts.append(node.slug)
-            node = node.parent
-        parts = reversed(parts)  # от корня к листу
-        return reverse("products:category", kwargs={"category_path": "/".join(parts)})
+        return reverse("products:category", kwargs={"category_path": category_url_path(self.pk)})
     
     @cached_property
     def variant_attrs(self):
@@ -157,6 +172,28 @@ class Product(models.Model):
 
 
 
+def has_stock_expression():
+    """1 — в наличии, 0 — нет. Первый ключ всех сортировок листинга; тот же вид — в индексе variant_pop_sort_idx."""
+    return Case(When(Q(inventory__gt=0), then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def discount_expression():
+    """
+    Скидка в % от старой цены, 0 — без скидки; как Variant.discount_percent.
+    Выражение столбца Variant.discount: его считает БД при любой записи цены.
+    """
+    # FloatField: для DecimalField sqlite оборачивает каждый шаг в CAST(… AS NUMERIC), и целые
+    # цены делились нацело (90 / 110 → 19 % вместо 18 %); в PG 100.0 — numeric, счёт точный
+    ratio = CombinedExpression(CombinedExpression(F('price'), '*', Value(100.0), output_field=FloatField()),
+                               '/', F('old_price'), output_field=FloatField())
+    percent = CombinedExpression(Value(100), '-', ratio, output_field=FloatField())
+    return Case(
+        When(Q(old_price__gt=0, price__lt=F('old_price')),
+             then=Cast(Round(percent, output_field=DecimalField()), IntegerField())),
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
 class Variant(models.Model):
     id  = models.UUIDField(primary_key=True, default=uuid.uuid4)
     product   = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
@@ -172,6 +209,12 @@ class Variant(models.Model):
     new = models.BooleanField('Бейджик NEW', default=True)
     rec = models.BooleanField('Показывать на главной', default=False)
     is_active = models.BooleanField('Активный', default=True, db_index=True)
+    # GENERATED ... STORED: правки в админке, импорт и синхронизация цен (bulk_update/update) — без кода;
+    # сортировка "discount" и фильтр on_sale
+    discount = models.GeneratedField(verbose_name='Скидка, %', expression=discount_expression(),
+                                     output_field=models.PositiveSmallIntegerField(), db_persist=True)
+    # x1000, пересчитывается products.utils.popularity; сортировка "по популярности"
+    popularity = models.PositiveIntegerField('Популярность', default=0, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
@@ -191,8 +234,10 @@ class Variant(models.Model):
 
     @property
     def discount_percent(self):
+        # discount — после чтения из БД; это же, но по текущим полям (до save, в форме)
         if self.old_price and self.old_price > 0 and self.price < self.old_price:
-            return int(round(100 - (self.price / self.old_price * 100)))
+            percent = 100 - Decimal(self.price) * 100 / Decimal(self.old_price)
+            return int(percent.quantize(Decimal(1), ROUND_HALF_UP))  # как ROUND в SQL
         return 0
 
     class Meta:
@@ -200,20 +245,30 @@ class Variant(models.Model):
         verbose_name_plural = 'Варианты'
         indexes = [
             models.Index(fields=['id']),
+            # ORDER BY has_stock DESC, popularity DESC, id DESC первой страницы листинга
+            models.Index(has_stock_expression().desc(), F('popularity').desc(), F('id').desc(),
+                         name='variant_pop_sort_idx', condition=Q(is_active=True)),
+            # то же для sort=discount; фильтр on_sale (discount > 0) — диапазон этого индекса
+            models.Index(has_stock_expression().desc(), F('discount').desc(), F('id').desc(),
+                         name='variant_discount_sort_idx', condition=Q(is_active=True)),
         ]
 
     def __str__(self):
         return f'{self.display_name()}'
     
-    def variant_label(self):
+    def variant_label(self, variant_attrs=None):
         """
         Собирает подпись из ВАРИАНТНЫХ атрибутов (в порядке sort_order категории).
         Примеры: '2.3', 'Kevlar 2.4', 'Черный / L'
+        variant_attrs — готовый список CategoryAttribute (пакетная сборка карточек).
         """
-        # значения атрибутов этого варианта
-        vals = {v.attribute_id: v for v in self.attribute_values.select_related('attribute')}
+        # значения атрибутов этого варианта (.all() — берёт prefetch, если он есть;
+        # тип значения смотрим у атрибута категории, а не у значения)
+        vals = {v.attribute_id: v for v in self.attribute_values.all()}
         parts = []
-        for ca in self.product.variant_attributes:
+        if variant_attrs is None:
+            variant_attrs = self.product.variant_attributes
+        for ca in variant_attrs:
             val = vals.get(ca.attribute_id)
             if not val:
                 continue
@@ -228,12 +283,12 @@ class Variant(models.Model):
 
         return ' '.join([p for p in parts if p])
 
-    def display_name(self):
+    def display_name(self, label=None):
         p = self.product
         category = (getattr(p.category, 'title_singular', None)) if p.category else ''
         brand    = getattr(p.brand, 'title', '').strip() if p.brand_id else ''
         base     = (p.base_name or '').strip()
-        tail     = self.variant_label().strip()
+        tail     = (self.variant_label() if label is None else label).strip()
 
         head = ' '.join(s for s in (category, brand, base) if s)
         if tail:
@@ -245,20 +300,27 @@ class Variant(models.Model):
         return img.thumb.url if img and img.image else self.product.imageURL
     
     def get_absolute_url(self):
-        category = self.product.category
-        parts = []
-        node = category
-        while node:
-            parts.append(node.slug)
-            node = node.parent
-        parts = reversed(parts)
+        category_id = self.product.category_id
         return reverse(
             "products:detail",
             kwargs={
-                "category_path": "/".join(parts),
+                "category_path": category_url_path(category_id) if category_id else "",
                 "slug": self.slug,
             },
         )
+
+    @cached_property
+    def card_view(self) -> "VariantCard":
+        """
+        Карточка для card.html и корзины: сохранённая (select_related('card')) или,
+        если её ещё нет либо она помечена dirty, собранная на лету.
+        """
+        from products.utils.cards import build_card
+        try:
+            card = self.card
+        except VariantCard.DoesNotExist:
+            card = None
+        return card if card is not None and not card.dirty else build_card(self)
     
     @cached_property
     def merged_attribute_values(self):
@@ -268,6 +330,111 @@ class Variant(models.Model):
         return sorted(prod.values(), key=lambda av: (av.attribute.name or "", av.attribute_id))
 
 
+class VariantSearch(models.Model):
+    """
+    Денормализованный поисковый документ варианта.
+    title — бренд, название, категория (вес A); body — атрибуты, артикулы, slug (вес B);
+    keys — ключи написания слов title и body (транслит, products.utils.search.spelling_key),
+    в vector с конфигом simple (вес D).
+    vector заполняется только на PostgreSQL (конфиг lbs_ru: unaccent + russian_stem),
+    GIN-индекс по нему создаётся миграцией 0011.
+    """
+    variant = models.OneToOneField(Variant, primary_key=True, on_delete=models.CASCADE, related_name='search')
+    title = models.TextField(blank=True, default='')
+    body = models.TextField(blank=True, default='')
+    keys = models.TextField(blank=True, default='')
+    vector = SearchVectorField(null=True, editable=False)
+    dirty = models.BooleanField(default=True, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = 'Поисковый индекс'
+
+    def __str__(self):
+        return f'{self.variant_id}'
+
+
+class SearchTerm(models.Model):
+    """
+    Словарь ключей написания из поисковых документов: по нему запрос выбирает раскладку
+    и исправляет опечатки (products.utils.search.resolve_query). Пополняется при индексации;
+    SP-GiST и триграммный GIN-индексы — миграция 0014, только PostgreSQL.
+    """
+    word = models.CharField(max_length=64, primary_key=True)
+
+    class Meta:
+        verbose_name = 'Слово поиска'
+        verbose_name_plural = 'Словарь поиска'
+
+    def __str__(self):
+        return self.word
+
+
+class SearchLog(models.Model):
+    """
+    Поиск с витрины: нормализованный запрос, число найденных, время ответа.
+    Пишется не запросом, а пачками из буфера в Redis (products.utils.search_log).
+    """
+    query = models.CharField('Запрос', max_length=200)
+    results = models.PositiveIntegerField('Найдено')
+    ms = models.PositiveIntegerField('Время, мс')
+    created = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Поисковый запрос'
+        verbose_name_plural = 'Журнал поиска'
+
+    def __str__(self):
+        return self.query
+
+
+class VariantViewDay(models.Model):
+    """Просмотры страницы варианта за день; пишутся пачками из буфера в Redis (products.utils.popularity)."""
+    variant = models.ForeignKey(Variant, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField(db_index=True)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Просмотры варианта за день'
+        verbose_name_plural = 'Просмотры вариантов'
+        constraints = [UniqueConstraint(fields=['variant', 'day'], name='uniq_variant_view_day')]
+
+    def __str__(self):
+        return f'{self.variant_id} {self.day}: {self.views}'
+
+
+class VariantCard(models.Model):
+    """
+    Денормализованная карточка варианта для листинга, главной и корзины: название,
+    подпись, URL, превью и скидка, которые card.html иначе добирает запросами на каждую
+    карточку. Пересобирается products.utils.cards (сигналы; бренды/категории — пометкой dirty).
+    """
+    variant = models.OneToOneField(Variant, primary_key=True, on_delete=models.CASCADE, related_name='card')
+    display_name = models.TextField(blank=True, default='')
+    label = models.TextField(blank=True, default='')
+    url_path = models.TextField(blank=True, default='')
+    thumb_url = models.TextField(blank=True, default='')
+    gallery = models.JSONField(default=list, blank=True)  # [[thumb_url, alt], ...] для свайпера карточки
+    discount_percent = models.PositiveSmallIntegerField(default=0)
+    dirty = models.BooleanField(default=True, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Карточка варианта'
+        verbose_name_plural = 'Карточки вариантов'
+
+    def __str__(self):
+        return self.display_name
+
+    @property
+    def product_name(self) -> str:
+        """Название без вариантной подписи — для карточки товара (листинг ?group=product)."""
+        if self.label and self.display_name.endswith(self.label):
+            return self.display_name[:-len(self.label)].rstrip()
+        return self.display_name
+
+
 class Image(models.Model):
     """
     Галерея изображений товара.
@@ -342,6 +509,11 @@ class AttributeValue(models.Model):
                 name="uniq_product_attribute_when_product",
             ),
         ]
+        indexes = [
+            # фильтры листинга (EXISTS по атрибуту): значение → варианты без чтения таблицы
+            models.Index(fields=["attribute", "value_text", "variant"], name="attrvalue_attr_text_idx"),
+            models.Index(fields=["attribute", "value_number", "variant"], name="attrvalue_attr_number_idx"),
+        ]
 
     def clean(self):
         if bool(self.product) == bool(self.variant):
@@ -380,6 +552,8 @@ class RelatedVariant(models.Model):
     position  = models.PositiveIntegerField(default=0)
     pinned    = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # итоговая оценка пары по products.utils.reco_variants (и у ручных связей); пишет пересборка
+    score     = models.FloatField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
 
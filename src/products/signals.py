@@ -0,0 +1,176 @@
+# products/signals.py
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from products.models import (
+    Variant, Product, Brand, Category, CategoryAttribute, AttributeValue, Image, RelatedVariant,
+)
+from products.utils import cards, category_tree, facet_snapshot, reco_variants
+from products.utils.catalog_index import record_changes
+from products.utils.search import reindex_variants, mark_dirty
+from products.utils.versions import CATALOG, bump_products, bump_version
+
+logger = logging.getLogger(__name__)
+
+
+def variants_changed(ids) -> None:
+    """
+    Сообщить, что варианты изменились. Внутри транзакции id копятся и
+    обрабатываются одной пачкой после коммита; вне транзакции — сразу.
+    """
+    ids = {i for i in ids if i}
+    if not ids:
+        return
+    conn = transaction.get_connection()
+    flush = getattr(conn, "_lbs_variants_flush", None)
+    # пачка ещё ждёт коммита (не откатилась вместе с savepoint'ом) — дописываем в неё
+    if (conn.in_atomic_block and flush is not None and not flush.done
+            and any(cb is flush for _, cb, _ in conn.run_on_commit)):
+        flush.ids.update(ids)
+        return
+
+    def flush():
+        flush.done = True
+        on_variants_changed(flush.ids)
+
+    flush.ids, flush.done = ids, False
+    conn._lbs_variants_flush = flush
+    transaction.on_commit(flush, robust=True)
+
+
+def on_variants_changed(ids) -> None:
+    reindex_variants(ids)
+    cards.refresh_cards(ids)
+    rows = list(Variant.objects.filter(id__in=ids).values_list("product_id", "product__category_id"))
+    bump_products(p for p, _ in rows)
+    facet_snapshot.touch(c for _, c in rows)
+    record_changes(ids)
+    bump_version(CATALOG)
+    reco_variants.touch_variants(ids)  # цена, категория, атрибуты, активность — оценки рекомендаций
+
+
+def catalog_changed() -> None:
+    """Правка, не привязанная к конкретным вариантам: после коммита поднять версию каталога."""
+    transaction.on_commit(lambda: bump_version(CATALOG), robust=True)
+    transaction.on_commit(facet_snapshot.touch_all, robust=True)
+
+
+def _product_variant_ids(product_id):
+    return Variant.objects.filter(product_id=product_id).values_list("id", flat=True)
+
+
+@receiver(post_save, sender=Variant)
+def _variant_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variants_changed([instance.pk])
+
+
+@receiver(post_delete, sender=Variant)
+def _variant_deleted(sender, instance, **kwargs):
+    variants_changed([instance.pk])
+    # удалённого варианта в пачке уже не найти — соседям сообщаем сами
+    product_id = instance.product_id
+    transaction.on_commit(lambda: bump_products([product_id]), robust=True)
+    transaction.on_commit(lambda: facet_snapshot.touch_products([product_id]), robust=True)
+
+
+@receiver(pre_save, sender=Product)
+def _product_moving(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    # новая категория узнает о вариантах в variants_changed, прежней сообщаем сами
+    old = Product.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+    if old != instance.category_id:
+        transaction.on_commit(lambda: facet_snapshot.touch([old]), robust=True)
+
+
+@receiver(post_delete, sender=Product)
+def _product_deleted(sender, instance, **kwargs):
+    # варианты удалены каскадом, товара после коммита уже нет — категорию берём отсюда
+    category_id = instance.category_id
+    transaction.on_commit(lambda: facet_snapshot.touch([category_id]), robust=True)
+
+
+@receiver(post_save, sender=Product)
+def _product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variants_changed(_product_variant_ids(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=AttributeValue)
+def _attribute_value_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.variant_id:
+        variants_changed([instance.variant_id])
+    elif instance.product_id:
+        variants_changed(_product_variant_ids(instance.product_id))
+
+
+@receiver([post_save, post_delete], sender=Image)
+def _image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # варианты товара без своих фото показывают в карточке фото товара; сам вариант
+    # пересоберётся в variants_changed (вне транзакции — сразу, поэтому пометка раньше)
+    cards.mark_dirty(Variant.objects.filter(product__variants=instance.variant_id))
+    variants_changed([instance.variant_id])
+
+
+@receiver(post_save, sender=Brand)
+def _brand_saved(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    # у бренда может быть много вариантов — только помечаем, добирает products.tasks.reindex_search_dirty
+    mark_dirty(Variant.objects.filter(product__brand=instance))
+    cards.mark_dirty(Variant.objects.filter(product__brand=instance))
+    # индексу каталога достаточно перечитать справочник брендов
+    transaction.on_commit(lambda: record_changes([]), robust=True)
+    # название и описание бренда — на странице варианта
+    product_ids = list(Product.objects.filter(brand=instance).values_list("id", flat=True))
+    transaction.on_commit(lambda: bump_products(product_ids), robust=True)
+    catalog_changed()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def _category_tree_changed(sender, instance, raw=False, **kwargs):
+    # свой процесс видит правку сразу, остальные воркеры — после коммита по новой версии
+    category_tree.invalidate(bump=False)
+    transaction.on_commit(category_tree.invalidate, robust=True)
+    catalog_changed()
+
+
+@receiver(post_save, sender=Category)
+def _category_saved(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    ids = category_tree.get_tree().descendant_ids(instance.pk)
+    mark_dirty(Variant.objects.filter(product__category_id__in=ids))
+    # название (title_singular) — только у своих, путь в URL — у всех потомков
+    cards.mark_dirty(Variant.objects.filter(product__category_id__in=ids))
+
+
+@receiver([post_save, post_delete], sender=CategoryAttribute)
+def _category_attribute_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # состав и порядок вариантных атрибутов меняет подпись и свотчи в карточке
+    cards.mark_dirty(Variant.objects.filter(product__category_id=instance.category_id))
+    product_ids = list(Product.objects.filter(category_id=instance.category_id).values_list("id", flat=True))
+    transaction.on_commit(lambda: bump_products(product_ids), robust=True)
+    catalog_changed()
+
+
+# только post_save: на post_delete Django перестал бы удалять AUTO-связи одним DELETE
+# при пересборке (reco_variants.build_category); удаление ручных связей — в RelatedVariantAdmin
+@receiver(post_save, sender=RelatedVariant)
+def _related_variant_saved(sender, instance, raw=False, **kwargs):
+    if raw or instance.source != RelatedVariant.Source.MANUAL:
+        return
+    from_id = instance.from_variant_id
+    transaction.on_commit(lambda: reco_variants.touch_variants([from_id]), robust=True)
@@ -10,17 +10,6 @@ document.addEventListener('click', (e) => {
   window.location.href = card.dataset.url;
 });
 
-// Доступность с клавиатуры
-document.querySelectorAll('.product-card[data-url]').forEach(card => {
-  card.setAttribute('role', 'link');
-  card.setAttribute('tabindex', '0');
-  card.addEventListener('keydown', (e) => {
-    if (e.key === 'Enter' || e.key === ' ') {
-      e.preventDefault();
-      window.location.href = card.dataset.url;
-    }
-  });
-});
 
 
 function addHoverZones(swiper) {
@@ -83,8 +72,26 @@ function addHoverStrip(swiper) {
   sync();
 }
 
-// Инициализация мини-галерей в карточках
-document.querySelectorAll('.product-card__swiper').forEach(swEl => {
+// Карточки внутри root: доступность с клавиатуры и мини-галереи.
+// Повторно — для карточек, дописанных бесконечной прокруткой (list.js)
+function initCards(root) {
+  const within = (sel) => [
+    ...(root.matches && root.matches(sel) ? [root] : []), ...root.querySelectorAll(sel)
+  ];
+  within('.product-card[data-url]').forEach(card => {
+    card.setAttribute('role', 'link');
+    card.setAttribute('tabindex', '0');
+    card.addEventListener('keydown', (e) => {
+      if (e.key === 'Enter' || e.key === ' ') {
+        e.preventDefault();
+        window.location.href = card.dataset.url;
+      }
+    });
+  });
+  within('.product-card__swiper').forEach(initCardSwiper);
+}
+
+function initCardSwiper(swEl) {
   const slides = swEl.querySelectorAll('.swiper-slide');
   if (slides.length <= 1) return;
 
@@ -103,4 +110,6 @@ document.querySelectorAll('.product-card__swiper').forEach(swEl => {
   if (!isTouch && typeof addHoverZones === 'function') {
     addHoverZones(sw);  // внутри зон оставляем только mouseenter (см. ниже)
   }
-});
\ No newline at end of file
+}
+
+initCards(document);
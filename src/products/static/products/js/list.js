@@ -141,6 +141,66 @@ function setupSortSync() {
   });
 }
 
+// Гистограммы цены и числовых атрибутов: клик по столбику — его границы в поля фильтра
+function setupHistograms() {
+  document.addEventListener('click', (e) => {
+    const bar = e.target.closest('.histogram__bar');
+    if (!bar || bar.classList.contains('histogram__bar--empty')) return;
+    const box = bar.closest('.histogram');
+    const form = bar.closest('form');
+    if (!box || !form) return;
+    const min = form.querySelector('[name="' + box.dataset.minName + '"]');
+    const max = form.querySelector('[name="' + box.dataset.maxName + '"]');
+    if (min) min.value = bar.dataset.min;
+    if (max) max.value = bar.dataset.max;
+  });
+}
+
+// Бесконечная прокрутка: следующая пачка карточек с /catalog/cards/ по курсору, без перезагрузки
+// страницы (фасеты и шапка не пересчитываются). Ссылки пагинации остаются для работы без JS
+function setupInfiniteScroll() {
+  const grid = document.querySelector('.product-grid[data-cards-url]');
+  if (!grid || !grid.dataset.next || !('IntersectionObserver' in window)) return;
+  const pager = document.querySelector('.pagination');
+  const sentinel = document.createElement('div');
+  sentinel.className = 'product-grid__sentinel';
+  grid.after(sentinel);
+  if (pager) pager.hidden = true;
+
+  let loading = false;
+  const observer = new IntersectionObserver(async (entries) => {
+    if (!entries.some(e => e.isIntersecting) || loading || !grid.dataset.next) return;
+    loading = true;
+    const url = grid.dataset.cardsUrl + (grid.dataset.cardsUrl.includes('?') ? '&' : '?') +
+        'cursor=' + encodeURIComponent(grid.dataset.next);
+    try {
+      const resp = await fetch(url, {headers: {'Accept': 'application/json'}});
+      if (!resp.ok) throw new Error(resp.status);
+      const data = await resp.json();
+      const box = document.createElement('div');
+      box.innerHTML = data.html;
+      const cards = Array.from(box.children);
+      cards.forEach(card => grid.appendChild(card));
+      cards.forEach(card => { if (typeof initCards === 'function') initCards(card); });
+      if (data.next) {
+        grid.dataset.next = data.next;
+      } else {
+        delete grid.dataset.next;
+        observer.disconnect();
+        sentinel.remove();
+      }
+    } catch (err) {
+      // не вышло — обратно к обычной пагинации
+      observer.disconnect();
+      sentinel.remove();
+      if (pager) pager.hidden = false;
+    } finally {
+      loading = false;
+    }
+  }, {rootMargin: '600px 0px'});
+  observer.observe(sentinel);
+}
+
 // При сабмите удаляем пустые price_* и possible duplicate page
 function cleanQueryOnSubmit() {
   const form = document.getElementById('filters-form');
@@ -169,5 +229,7 @@ document.addEventListener('DOMContentLoaded', () => {
   toggleSortControls();
   setupSortSync();
   cleanQueryOnSubmit();
+  setupHistograms();
+  setupInfiniteScroll();
   window.addEventListener('resize', toggleSortControls);
 });
@@ -1,6 +1,44 @@
 from celery import shared_task
 from products.integrations.sync_inventory import sync_inventory
+from products.utils import facet_snapshot, reco_variants
+from products.utils.cards import refresh_dirty
+from products.utils.popularity import flush_views, recompute as recompute_popularity_scores
+from products.utils.search import reindex_dirty
+from products.utils.search_log import flush as flush_search_log_buffer
+from products.utils.versions import CATALOG, bump_version
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
 def update_inventory_minutely(self):
-    return sync_inventory()
\ No newline at end of file
+    stats = sync_inventory()
+    return stats
+
+@shared_task(bind=True, max_retries=0)
+def reindex_search_dirty(self):
+    done = reindex_dirty()
+    if done:
+        bump_version(CATALOG)  # выдачу поиска в кэше (search_cache) строили по старым документам
+    return {"reindexed": done}
+
+@shared_task(bind=True, max_retries=0)
+def rebuild_cards_dirty(self):
+    return {"rebuilt": refresh_dirty()}
+
+@shared_task(bind=True, max_retries=0)
+def flush_search_log(self):
+    return {"written": flush_search_log_buffer()}
+
+@shared_task(bind=True, max_retries=0)
+def flush_variant_views(self):
+    return {"written": flush_views()}
+
+@shared_task(bind=True, max_retries=0)
+def recompute_popularity(self):
+    return {"changed": recompute_popularity_scores()}
+
+@shared_task(bind=True, max_retries=0)
+def rebuild_category_facets(self):
+    return {"rebuilt": facet_snapshot.rebuild()}
+
+@shared_task(bind=True, max_retries=0)
+def build_recommendations(self):
+    return {"categories": reco_variants.build_touched()}
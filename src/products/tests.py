@@ -0,0 +1,1174 @@
+import datetime as dt
+import re
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Max, Min
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from cart import signals_copurchase_variant as copurchase
+from cart.models import Order, OrderItem
+from products.models import (
+    Attribute, AttributeValue, Brand, Category, CategoryAttribute, CopurchaseVariantStat, Product, RelatedVariant,
+    SearchLog, SearchTerm, Variant, VariantCard, VariantSearch, VariantViewDay,
+)
+from products.utils import (
+    cards, catalog_index, category_tree, facet_snapshot, histogram, page_cache, popularity, reco_variants,
+    search_cache, search_log, suggest, swatches,
+)
+from products.utils.detail import variant_rows
+from products.utils.cursor import QuerySetSource, legacy_page_cursor, paginate_cursor, parse_ordering
+from products.utils.facets import category_facet, compute_facets, filterable_attributes
+from products.utils.list import (
+    FilterParams, apply_attr_filters, apply_scope, apply_text_search, attr_slug_map, base_qs,
+    effective_category_ids, faceting_base_qs, get_cat_brand_by_path, group_by_product, order_qs, ordering_for,
+)
+from products.utils.search import has_trigrams, resolve_query, search_tokens, spelling_key, swap_layout
+from products.utils.similarity import ContentSimilarity
+from products.utils.versions import CATALOG, bump_version, get_version
+
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# страницы рендерятся без collectstatic
+PLAIN_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class CatalogMixin:
+    """Маленький каталог: Покрышки (Запчасти) — Shimano/Maxxis, атрибуты Размер(number) и Цвет(text)."""
+
+    def make_catalog(self):
+        catalog_index.reset()  # индексы воркера переживают откат тестовой транзакции
+        suggest.reset()
+        bump_version(CATALOG)  # как и кэши по версии каталога (LOCMEM общий на процесс)
+        self.root = Category.objects.create(title="Запчасти", slug="parts")
+        self.tires = Category.objects.create(
+            title="Покрышки", title_plural="Покрышки", title_singular="Покрышка",
+            slug="tires", parent=self.root,
+        )
+        self.shimano = Brand.objects.create(title="Shimano", slug="shimano", image="b.png")
+        self.maxxis = Brand.objects.create(title="Maxxis", slug="maxxis", image="b.png")
+        self.size = Attribute.objects.create(name="Размер", slug="size", value_type=Attribute.NUMBER)
+        self.color = Attribute.objects.create(name="Цвет", slug="color", value_type=Attribute.TEXT)
+        CategoryAttribute.objects.create(category=self.tires, attribute=self.size, is_variant=True, sort_order=1)
+        CategoryAttribute.objects.create(category=self.tires, attribute=self.color, is_variant=True, sort_order=2)
+
+        self.p1 = Product.objects.create(base_name="Deore", category=self.tires, brand=self.shimano)
+        self.p2 = Product.objects.create(base_name="Holy Roller", category=self.tires, brand=self.maxxis)
+        self.v1 = self.make_variant(self.p1, "1000", size="2.3", color="Черный", seller_article="SH-001")
+        self.v2 = self.make_variant(self.p1, "1200", size="2.4", color="Красный", inventory=0)
+        self.v3 = self.make_variant(self.p2, "2500", size="2.4", color="Черный", wb_article="777123")
+
+    def make_variant(self, product, price, size=None, color=None, inventory=5, **fields):
+        v = Variant.objects.create(product=product, price=Decimal(price), inventory=inventory, **fields)
+        if size is not None:
+            AttributeValue.objects.create(variant=v, attribute=self.size, value_number=Decimal(size))
+        if color is not None:
+            AttributeValue.objects.create(variant=v, attribute=self.color, value_text=color)
+        v.save()  # slug из вариантных атрибутов
+        return v
+
+
+@override_settings(CACHES=LOCMEM)
+class TextSearchTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def search(self, q):
+        return set(apply_text_search(base_qs(), q).values_list("id", flat=True))
+
+    def test_tokens_are_normalized(self):
+        self.assertEqual(search_tokens('Покрышка 2,3" (Shimano)'), ["покрышка", "2.3", "shimano"])
+
+    def test_document_is_denormalized(self):
+        doc = VariantSearch.objects.get(variant=self.v1)
+        self.assertIn("shimano", doc.title)
+        self.assertIn("покрышка", doc.title)
+        for part in ("запчасти", "2.3", "черный", "sh-001"):
+            self.assertIn(part, doc.body)
+        self.assertFalse(doc.dirty)
+
+    def test_search_matches_every_token(self):
+        self.assertEqual(self.search("shimano"), {self.v1.id, self.v2.id})
+        self.assertEqual(self.search("shimano черный"), {self.v1.id})
+        self.assertEqual(self.search("777123"), {self.v3.id})
+        self.assertEqual(self.search("campagnolo"), set())
+
+    def test_spelling_keys(self):
+        for latin, cyrillic in (("Shimano", "шимано"), ("Maxxis", "максис"), ("Schwalbe", "швальбе"),
+                                ("Continental", "континенталь")):
+            self.assertEqual(spelling_key(latin), spelling_key(cyrillic))
+        self.assertEqual(swap_layout("ыршьфтщ"), "shimano")
+        self.assertEqual(swap_layout("gjrhsirf"), "покрышка")
+        self.assertIsNone(swap_layout("shimano покрышка"))
+
+    def test_transliteration_and_layout(self):
+        self.assertTrue(SearchTerm.objects.filter(word="maksis").exists())
+        self.assertEqual(self.search("шимано"), {self.v1.id, self.v2.id})
+        self.assertEqual(self.search("ыршьфтщ"), {self.v1.id, self.v2.id})  # Shimano в русской раскладке
+        self.assertEqual(self.search("максис черн"), {self.v3.id})
+        self.assertEqual(self.search("gjrhsirf ltjht"), {self.v1.id, self.v2.id})  # "покрышка деоре"
+        self.assertEqual(resolve_query("2,3 ыршьфтщ"), [("2.3", "2.3"), ("shimano", "shimano")])
+
+    @skipUnless(connection.vendor == "postgresql", "typo correction requires PostgreSQL")
+    def test_typos_are_corrected(self):
+        if not has_trigrams():
+            self.skipTest("pg_trgm is not installed")
+        self.assertEqual(resolve_query("shimamo"), [("shimano", "shimano")])
+        self.assertEqual(self.search("шимамо деоре"), {self.v1.id, self.v2.id})
+
+    def test_attribute_change_reindexes_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            av = AttributeValue.objects.get(variant=self.v3, attribute=self.color)
+            av.value_text = "Зеленый"
+            av.save()
+        self.assertEqual(self.search("зеленый"), {self.v3.id})
+
+    def test_brand_rename_marks_dirty_and_command_resumes(self):
+        self.shimano.title = "Shimano Japan"
+        self.shimano.save()
+        self.assertEqual(VariantSearch.objects.filter(dirty=True).count(), 2)
+
+        out = StringIO()
+        call_command("reindex_search", batch_size=1, stdout=out)
+        self.assertFalse(VariantSearch.objects.filter(dirty=True).exists())
+        self.assertIn("japan", VariantSearch.objects.get(variant=self.v1).title)
+
+
+@override_settings(CACHES=LOCMEM)
+class VariantCardTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def test_card_is_denormalized(self):
+        card = VariantCard.objects.get(variant=self.v1)
+        self.assertEqual(card.display_name, "Покрышка Shimano Deore 2.3 Черный")
+        self.assertEqual(card.label, "2.3 Черный")
+        self.assertEqual(card.url_path, self.v1.get_absolute_url())
+        self.assertFalse(card.dirty)
+
+    def test_listing_rows_need_no_extra_queries(self):
+        with self.assertNumQueries(1):
+            names = {v.card_view.display_name for v in base_qs()}
+        self.assertIn("Покрышка Maxxis Holy Roller 2.4 Черный", names)
+
+    def test_variant_attrs_change_marks_dirty(self):
+        CategoryAttribute.objects.filter(category=self.tires, attribute=self.color).delete()
+        self.assertEqual(VariantCard.objects.filter(dirty=True).count(), 3)
+        v1 = base_qs().get(pk=self.v1.pk)
+        self.assertEqual(v1.card_view.label, "2.3")  # dirty — собирается на лету
+
+        call_command("rebuild_cards", stdout=StringIO())
+        self.assertFalse(VariantCard.objects.filter(dirty=True).exists())
+        self.assertEqual(VariantCard.objects.get(variant=self.v1).display_name, "Покрышка Shimano Deore 2.3")
+
+
+def make_params(**kw):
+    base = dict(q="", page=1, sort="pop", price_min=None, price_max=None,
+                in_stock=False, brand_slugs=[], attr_params={})
+    base.update(kw)
+    return FilterParams(**base)
+
+
+@override_settings(CACHES=LOCMEM)
+class FacetTests(CatalogMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+
+    def params(self, **kw):
+        return make_params(**kw)
+
+    def test_single_pass_matches_per_attribute_queries(self):
+        compute_facets(self.tires, None, self.params())  # границы гистограмм — в кэше по версии каталога
+        for params in (self.params(), self.params(in_stock=True), self.params(brand_slugs=["maxxis"])):
+            fb = faceting_base_qs(self.tires, None, params)
+            legacy = [
+                (self.size.id, None, AttributeValue.objects.filter(attribute=self.size, variant__in=fb)
+                 .aggregate(min=Min("value_number"), max=Max("value_number"))),
+                (self.color.id, list(AttributeValue.objects.filter(attribute=self.color, variant__in=fb)
+                                     .values_list("value_text", flat=True).distinct().order_by("value_text")), None),
+            ]
+            with self.assertNumQueries(3):  # поддерево категории — из category_tree
+                facets = compute_facets(self.tires, None, params)
+            self.assertEqual(facets["price_range"], fb.aggregate(min=Min("price"), max=Max("price")))
+            self.assertEqual([b["product__brand__slug"] for b in facets["brand_facet"]],
+                             [slug for _, slug in sorted({(v.product.brand.title, v.product.brand.slug) for v in fb})])
+            self.assertEqual([(f["attribute"].id, f["values"], f["range"]) for f in facets["attr_facets"]], legacy)
+
+    def test_counts_exclude_own_dimension(self):
+        params = self.params(brand_slugs=["maxxis"], attr_params={"a_color": "Черный"})
+        compute_facets(self.tires, None, self.params())
+        with self.assertNumQueries(3):  # по-прежнему два сгруппированных запроса
+            facets = compute_facets(self.tires, None, params)
+        self.assertEqual({b["product__brand__slug"]: b["count"] for b in facets["brand_facet"]},
+                         {"shimano": 1, "maxxis": 1})
+        color = next(f for f in facets["attr_facets"] if f["attribute"] == self.color)
+        self.assertEqual(color["values"], ["Красный", "Черный"])
+        self.assertEqual(color["counts"], {"Красный": 0, "Черный": 1})
+
+    def test_histograms_exclude_own_dimension(self):
+        facets = compute_facets(self.tires, None, self.params(price_min=1100.0))
+        self.assertEqual(facets["price_range"], {"min": Decimal("1200"), "max": Decimal("2500")})
+        self.assertEqual([(b["min"], b["max"], b["count"]) for b in facets["price_histogram"]],
+                         [(Decimal("1000"), Decimal("1200"), 1), (Decimal("1200"), Decimal("2500"), 1),
+                          (Decimal("2500"), Decimal("2500"), 1)])
+        size = next(f for f in facets["attr_facets"] if f["attribute"] == self.size)
+        self.assertEqual([(b["min"], b["max"], b["count"]) for b in size["histogram"]],
+                         [(Decimal("2.3"), Decimal("2.4"), 0), (Decimal("2.4"), Decimal("2.4"), 2)])
+
+    def test_quantile_edges_survive_outliers(self):
+        prices = np.array([100 * p for p in range(1000, 2000, 10)] + [300000_00])
+        quantile = histogram.edges_of(prices, 2)
+        self.assertEqual(len(quantile), histogram.BUCKETS + 1)
+        self.assertEqual(quantile[-2:], [Decimal("1950"), Decimal("300000")])  # выброс — одна узкая корзина
+        with mock.patch.object(histogram, "QUANTILES", False):
+            linear = histogram.edges_of(prices, 2)
+        self.assertEqual(linear[:2], [Decimal("1000"), Decimal("15950")])  # все цены, кроме выброса, — в первой
+
+    def test_without_category_only_brands_and_price(self):
+        facets = compute_facets(None, self.shimano, self.params())
+        self.assertEqual(facets["attr_facets"], [])
+        self.assertEqual(facets["price_range"], {"min": Decimal("1000"), "max": Decimal("1200")})
+
+    def test_category_facet_rolls_up_tree(self):
+        brakes = Category.objects.create(title="Тормоза", slug="brakes", parent=self.root)
+        self.make_variant(Product.objects.create(base_name="XT", category=brakes, brand=self.shimano), "5000")
+        compute_facets(None, self.shimano, self.params())
+        with self.assertNumQueries(2):  # бренды с ценой + категории; дерево — из category_tree
+            facets = compute_facets(None, self.shimano, self.params())
+        self.assertEqual([(c["title"], c["depth"], c["count"], c["url"]) for c in facets["category_facet"]],
+                         [("Запчасти", 0, 3, "/catalog/parts/?brands=shimano"),
+                          ("Покрышки", 1, 2, "/catalog/parts/tires/?brands=shimano"),
+                          ("Тормоза", 1, 1, "/catalog/parts/brakes/?brands=shimano")])
+        facets = compute_facets(None, self.shimano, self.params(in_stock=True, price_max=2000.0))
+        self.assertEqual([(c["title"], c["count"]) for c in facets["category_facet"]],
+                         [("Запчасти", 1), ("Покрышки", 1)])
+        self.assertEqual(compute_facets(self.tires, None, self.params())["category_facet"], [])
+
+    def test_category_facet_keeps_query(self):
+        items = category_facet({self.tires.id: 2}, None,
+                               self.params(q="shimano", attr_params={"a_color": "Черный"}))
+        self.assertEqual([c["url"] for c in items], ["/catalog/parts/?q=shimano", "/catalog/parts/tires/?q=shimano"])
+
+
+@override_settings(CACHES=LOCMEM)
+class AttrFilterTests(CatalogMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+
+    def test_one_exists_per_attribute_without_distinct(self):
+        params = make_params(sort="price_asc",
+                             attr_params={"a_size_min": "2.35", "a_size_max": "2.5", "a_color": "Черный,Красный"})
+        qs = order_qs(apply_attr_filters(apply_scope(base_qs(), self.tires, None, params), params,
+                                         attr_slug_map(self.tires)), params.sort)
+        sql = str(qs.query).upper()
+        self.assertEqual(sql.count("EXISTS"), 2)
+        self.assertNotIn("DISTINCT", sql)
+        self.assertEqual([v.id for v in qs], [self.v3.id, self.v2.id])
+
+
+@override_settings(CACHES=LOCMEM)
+class CatalogIndexTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def sql_listing(self, cat, params):
+        qs = apply_scope(base_qs(), cat, None, params)
+        qs = apply_attr_filters(qs, params, attr_slug_map(cat))
+        return [v.id for v in order_qs(qs, params.sort)]
+
+    def index_listing(self, cat, params):
+        result = catalog_index.get_index().listing(cat, None, params, attr_slug_map(cat))
+        return [v.id for v in result[0:result.count()]]
+
+    def assertMatchesSql(self, cat=None, **kw):
+        params = make_params(**kw)
+        self.assertEqual(self.index_listing(cat, params), self.sql_listing(cat, params), kw)
+        facets = catalog_index.get_index().facets(cat, None, params)
+        expected = compute_facets(cat, None, params)
+        self.assertEqual(facets["price_range"], expected["price_range"])
+        self.assertEqual(facets["price_histogram"], expected["price_histogram"])
+        self.assertEqual(facets["brand_facet"], expected["brand_facet"])
+        self.assertEqual([(f["attribute"].id, f["values"], f["range"], f["counts"], f["histogram"])
+                          for f in facets["attr_facets"]],
+                         [(f["attribute"].id, f["values"], f["range"], f["counts"], f["histogram"])
+                          for f in expected["attr_facets"]])
+        self.assertEqual(facets["category_facet"], expected["category_facet"])
+
+    def test_matches_sql_path(self):
+        attrs = filterable_attributes(self.tires)
+        self.assertEqual(catalog_index.get_index().histogram_edges(self.tires, None, make_params(), attrs),
+                         histogram.sql_edges(self.tires, None, attrs))
+        for kw in ({}, {"in_stock": True}, {"brand_slugs": ["maxxis"]}, {"sort": "price_desc"},
+                   {"sort": "newest"}, {"price_min": 1100.0, "price_max": 2500.0},
+                   {"attr_params": {"a_color": "Черный,Синий"}}, {"attr_params": {"a_size_min": "2.35"}},
+                   {"attr_params": {"a_size": "2,4", "a_color": "Черный"}},
+                   {"brand_slugs": ["shimano"], "attr_params": {"a_color": "Красный", "a_size_max": "2.35"}},
+                   {"sort": "discount"}, {"on_sale": True, "sort": "price_asc"}):
+            self.assertMatchesSql(self.tires, **kw)
+        self.assertMatchesSql(None, sort="price_asc")
+        self.assertMatchesSql(None, in_stock=True, brand_slugs=["shimano"])
+
+    def add_discounts(self):
+        Variant.objects.filter(pk=self.v2.pk).update(old_price=Decimal("1500"))  # мимо сигналов, как импорт
+        Variant.objects.filter(pk=self.v3.pk).update(old_price=Decimal("2600"))
+        catalog_index.record_changes([self.v2.pk, self.v3.pk])
+
+    def test_discount_column_follows_prices(self):
+        self.add_discounts()
+        v2, v3 = Variant.objects.get(pk=self.v2.pk), Variant.objects.get(pk=self.v3.pk)
+        self.assertEqual((v2.discount, v2.discount_percent), (20, 20))
+        self.assertEqual((v3.discount, v3.discount_percent), (4, 4))  # 3.85 → 4
+        v3.price, v3.old_price = Decimal("99.50"), Decimal("100")
+        v3.save()
+        v3.refresh_from_db()
+        self.assertEqual((v3.discount, v3.discount_percent), (1, 1))  # половина — вверх, как ROUND в SQL
+        v3.price, v3.old_price = Decimal("90"), Decimal("110")
+        v3.save()
+        v3.refresh_from_db()
+        self.assertEqual((v3.discount, v3.discount_percent), (18, 18))  # 18.18; нацело вышло бы 19
+        Variant.objects.filter(pk=self.v2.pk).update(price=Decimal("1600"))
+        self.assertEqual(Variant.objects.get(pk=self.v2.pk).discount, 0)
+
+    def test_discount_sort_and_filter(self):
+        self.add_discounts()
+        self.assertMatchesSql(self.tires, sort="discount")
+        self.assertMatchesSql(self.tires, on_sale=True)
+        self.assertEqual(self.index_listing(self.tires, make_params(sort="discount")),
+                         [self.v3.id, self.v1.id, self.v2.id])  # сначала в наличии, внутри — по скидке
+        self.assertEqual(self.index_listing(self.tires, make_params(on_sale=True, in_stock=True)), [self.v3.id])
+
+    def test_page_reads_only_its_rows(self):
+        result = catalog_index.get_index().listing(self.tires, None, make_params(sort="price_asc"), {})
+        with self.assertNumQueries(0):
+            self.assertEqual(result.count(), 3)
+        self.assertEqual([v.id for v in result[1:3]], [self.v3.id, self.v2.id])  # сначала в наличии
+
+    def test_changes_are_applied_incrementally(self):
+        index = catalog_index.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.v2.inventory = 4
+            self.v2.save()
+            v4 = self.make_variant(self.p2, "900", size="2.6", color="Синий")
+            self.v1.delete()
+        # sync_inventory обходит сигналы и сообщает сам
+        Variant.objects.filter(pk=self.v3.pk).update(inventory=0)
+        catalog_index.record_changes([self.v3.pk])
+
+        fresh = catalog_index.get_index()
+        self.assertIsNot(fresh, index)
+        self.assertEqual(fresh.ids[:3], index.ids[:3])  # дельта, а не перестройка
+        self.assertEqual(self.index_listing(self.tires, make_params(in_stock=True, sort="price_asc")), [v4.id, self.v2.id])
+        self.assertMatchesSql(self.tires, attr_params={"a_color": "Синий"})
+        self.assertMatchesSql(self.tires, sort="price_asc")
+
+    def test_lost_delta_rebuilds(self):
+        index = catalog_index.get_index()
+        Variant.objects.filter(pk=self.v1.pk).update(is_active=False)
+        version = catalog_index.bump_version(catalog_index.VERSION)  # без записи дельты
+        fresh = catalog_index.get_index()
+        self.assertEqual(fresh.version, version)
+        self.assertNotIn(self.v1.id, self.index_listing(self.tires, make_params()))
+        self.assertEqual(len(index.ids), len(fresh.ids))
+
+    @override_settings(CATALOG_INDEX_ENABLED=False)
+    def test_switch_falls_back_to_sql(self):
+        self.assertIsNone(catalog_index.index_for(make_params()))
+
+    def test_text_query_uses_sql(self):
+        self.assertIsNone(catalog_index.index_for(make_params(q="shimano")))
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class SuggestTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def variants(self, q):
+        return suggest.get_index().variants(q)
+
+    def test_prefixes(self):
+        self.assertEqual(self.variants("shim"), [self.v1.id.hex, self.v2.id.hex])  # в наличии первым
+        self.assertEqual(self.variants("покр hol"), [self.v3.id.hex])
+        self.assertEqual(self.variants("sh-00"), [self.v1.id.hex])
+        self.assertEqual(self.variants("sh001"), [self.v1.id.hex])  # артикул без разделителей
+        self.assertEqual(self.variants("7771"), [self.v3.id.hex])
+        self.assertEqual(self.variants("campa"), [])
+        self.assertEqual(self.variants("шиман"), [self.v1.id.hex, self.v2.id.hex])
+        self.assertEqual(self.variants("ыршь"), [self.v1.id.hex, self.v2.id.hex])  # другая раскладка
+        index = suggest.get_index()
+        self.assertEqual([m.title for m in index.brand_matches("макс")], ["Maxxis"])
+        self.assertEqual([m.title for m in index.brand_matches("MAX")], ["Maxxis"])
+        self.assertEqual([m.url for m in index.category_matches("покрыш")], [self.tires.get_absolute_url()])
+
+    def test_changes_are_applied_incrementally(self):
+        index = suggest.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p2.base_name = "Minion"
+            self.p2.save()
+            self.v2.delete()
+            v4 = self.make_variant(self.p1, "900", seller_article="XT-8100")
+        fresh = suggest.get_index()
+        self.assertIsNot(fresh, index)
+        self.assertIs(fresh.terms, index.terms)  # дельта в overlay, а не перестройка
+        self.assertEqual(self.variants("holy"), [])
+        self.assertEqual(self.variants("minion"), [self.v3.id.hex])
+        self.assertEqual(self.variants("xt81"), [v4.id.hex])
+        self.assertEqual(set(self.variants("deore")), {self.v1.id.hex, v4.id.hex})
+
+    def test_full_rebuild_runs_in_background(self):
+        index = suggest.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tires.title_plural = "Шины"
+            self.tires.save()
+        spawned = []
+        with mock.patch.object(suggest, "_spawn", spawned.append):
+            self.assertIs(suggest.get_index(), index)  # пока строится — прежний индекс
+            self.assertIs(suggest.get_index(), index)
+        self.assertEqual(len(spawned), 1)  # одна пересборка на воркер
+        self.assertEqual(index.category_matches("шин"), [])
+        spawned[0]()
+        fresh = suggest.get_index()
+        self.assertIsNot(fresh, index)
+        self.assertEqual([m.title for m in fresh.category_matches("шин")], ["Шины"])
+        self.assertEqual(index.category_matches("шин"), [])  # опубликованный не менялся
+
+    def test_reread_tree_does_not_touch_published_index(self):
+        index = suggest.get_index()
+        tree, names = index.tree, index._category_names
+        category_tree.invalidate(bump=False)  # то же дерево той же версии, новый объект
+        fresh = suggest.get_index()
+        self.assertIsNot(fresh, index)
+        self.assertIsNot(fresh.tree, tree)
+        self.assertIs(fresh.terms, index.terms)
+        self.assertIs(index.tree, tree)
+        self.assertIs(index._category_names, names)
+
+    def test_view(self):
+        suggest.get_index()
+        with self.assertNumQueries(1):  # индекс в памяти, из БД — только варианты с карточками
+            data = self.client.get("/catalog/suggest/", {"q": "maxx"}).json()
+        self.assertEqual(data["brands"], [{"title": "Maxxis", "url": "/brand/maxxis/"}])
+        self.assertEqual([v["id"] for v in data["variants"]], [self.v3.id.hex])
+        self.assertEqual(data["variants"][0]["name"], "Покрышка Maxxis Holy Roller 2.4 Черный")
+        self.assertEqual(data["variants"][0]["price"], "2500.00")
+        self.assertEqual(self.client.get("/catalog/suggest/", {"q": ""}).json()["variants"], [])
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class CategoryTreeTests(CatalogMixin, TestCase):
+    def setUp(self):
+        self.make_catalog()
+        self.tubes = Category.objects.create(title="Камеры", slug="tubes", parent=self.tires)
+
+    def test_paths_and_descendants_without_queries(self):
+        category_tree.get_tree()
+        with self.assertNumQueries(0):
+            self.assertEqual(effective_category_ids(self.root), [self.root.id, self.tires.id, self.tubes.id])
+            self.assertEqual(self.tubes.get_absolute_url(), "/catalog/parts/tires/tubes/")
+            self.assertEqual(self.v1.get_absolute_url(), f"/catalog/parts/tires/p/{self.v1.slug}/")
+        with self.assertNumQueries(1):
+            cat, _ = get_cat_brand_by_path("parts/tires/tubes/", None)
+        self.assertEqual(cat, self.tubes)
+        with self.assertRaises(Http404):
+            get_cat_brand_by_path("tires", None)
+
+    def test_save_invalidates(self):
+        tree = category_tree.get_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tubes.parent = self.root
+            self.tubes.save()
+        self.assertGreater(category_tree.get_version(category_tree.VERSION), tree.version)
+        self.assertEqual(self.tubes.get_absolute_url(), "/catalog/parts/tubes/")
+        self.assertEqual(effective_category_ids(self.tires), [self.tires.id])
+
+    def test_breadcrumbs(self):
+        res = self.client.get(f"/catalog/parts/tires/p/{self.v1.slug}/")
+        self.assertEqual(res.context["breadcrumbs"][2:4],
+                         [("Запчасти", "/catalog/parts/"), ("Покрышки", "/catalog/parts/tires/")])
+
+
+@override_settings(CACHES=LOCMEM)
+class CursorPaginationTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+            # одинаковые цены и наличие — порядок решает id
+            for i in range(5):
+                self.make_variant(self.p2, "1200", size=f"2.{5 + i}", inventory=i % 2)
+
+    def sources(self, sort):
+        params = make_params(sort=sort)
+        ordering = parse_ordering(ordering_for(sort))
+        qs = order_qs(apply_scope(base_qs(), self.tires, None, params), sort)
+        index_list = catalog_index.get_index().listing(self.tires, None, params, {})
+        return ordering, [v.id for v in qs], (QuerySetSource(qs, ordering), index_list)
+
+    def walk(self, source, ordering, per_page=3):
+        forward, token, pages = [], None, []
+        while True:
+            page = paginate_cursor(source, ordering, token, per_page=per_page)
+            forward += [v.id for v in page.object_list]
+            pages.append([v.id for v in page.object_list])
+            if not page.has_next:
+                break
+            token = page.next_cursor
+        backward = [v.id for v in page.object_list]
+        while page.has_previous:
+            page = paginate_cursor(source, ordering, page.previous_cursor, per_page=per_page)
+            backward = [v.id for v in page.object_list] + backward
+        return forward, backward, pages
+
+    def test_every_sort_walks_both_ways(self):
+        for sort in ("pop", "price_asc", "price_desc", "newest"):
+            ordering, expected, sources = self.sources(sort)
+            for source in sources:
+                forward, backward, pages = self.walk(source, ordering)
+                self.assertEqual(forward, expected, (sort, source))
+                self.assertEqual(backward, expected, (sort, source))
+                self.assertEqual([len(p) for p in pages], [3, 3, 2])
+
+    def test_search_rank_ordering(self):
+        ordering = parse_ordering(ordering_for("pop", ranked=True))
+        qs = order_qs(apply_text_search(base_qs(), "покрышка"), "pop", ranked=True)
+        forward, backward, _ = self.walk(QuerySetSource(qs, ordering), ordering)
+        self.assertEqual(len(forward), 8)
+        self.assertEqual(forward, [v.id for v in qs])
+        self.assertEqual(backward, forward)
+
+    def test_offsets_and_count(self):
+        ordering, expected, (source, _) = self.sources("price_asc")
+        page = paginate_cursor(source, ordering, None, per_page=3)
+        page = paginate_cursor(source, ordering, page.next_cursor, per_page=3)
+        self.assertEqual((page.start_index(), page.end_index(), page.count), (4, 6, 8))
+        self.assertIsNone(page.previous_cursor)  # назад — на первую страницу, без курсора
+
+    def test_bad_or_foreign_token_is_first_page(self):
+        ordering, expected, (source, _) = self.sources("price_asc")
+        token = paginate_cursor(source, ordering, None, per_page=3).next_cursor
+        other = parse_ordering(ordering_for("newest"))
+        for token, ordering in ((token + "x", ordering), (token, other)):
+            self.assertFalse(paginate_cursor(source, ordering, token, per_page=3).has_previous)
+
+    def test_legacy_page_number(self):
+        ordering, expected, (source, index_list) = self.sources("price_desc")
+        for src in (source, index_list):
+            page = paginate_cursor(src, ordering, legacy_page_cursor(src, ordering, 3, per_page=3), per_page=3)
+            self.assertEqual([v.id for v in page.object_list], expected[6:])
+            self.assertEqual(page.start_index(), 7)
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class GroupByProductTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+            self.p3 = Product.objects.create(base_name="Minion", category=self.tires, brand=self.maxxis)
+            self.v4 = self.make_variant(self.p3, "1100", size="2.5", color="Красный", inventory=0)
+            self.v5 = self.make_variant(self.p3, "1800", size="2.6", color="Черный", inventory=0)
+
+    def grouped(self, sort="pop", **kw):
+        params = make_params(sort=sort, **kw)
+        qs = apply_attr_filters(apply_scope(base_qs(), self.tires, None, params), params, attr_slug_map(self.tires))
+        return order_qs(group_by_product(qs, sort), sort)
+
+    def test_one_row_per_product(self):
+        rows = list(self.grouped("price_asc"))
+        # сначала в наличии; у товара — его первый вариант в этом порядке
+        self.assertEqual([v.id for v in rows], [self.v1.id, self.v3.id, self.v4.id])
+        self.assertEqual([(v.min_price, v.max_price, v.variant_count, v.has_stock) for v in rows],
+                         [(Decimal("1000"), Decimal("1200"), 2, 1), (Decimal("2500"), Decimal("2500"), 1, 1),
+                          (Decimal("1100"), Decimal("1800"), 2, 0)])
+        self.assertEqual([v.id for v in self.grouped("price_desc")], [self.v3.id, self.v1.id, self.v5.id])
+
+    def test_filters_apply_to_variants(self):
+        rows = list(self.grouped("price_asc", attr_params={"a_color": "Красный"}))
+        self.assertEqual([(v.id, v.min_price, v.max_price, v.variant_count) for v in rows],
+                         [(self.v4.id, Decimal("1100"), Decimal("1100"), 1),
+                          (self.v2.id, Decimal("1200"), Decimal("1200"), 1)])
+
+    def test_keyset_pages(self):
+        for sort in ("pop", "price_asc", "price_desc", "newest"):
+            qs = self.grouped(sort)
+            ordering = parse_ordering(ordering_for(sort))
+            source, seen, token = QuerySetSource(qs, ordering), [], None
+            while True:
+                page = paginate_cursor(source, ordering, token, per_page=1)
+                self.assertEqual(page.count, 3)
+                seen += [v.id for v in page.object_list]
+                if not page.has_next:
+                    break
+                token = page.next_cursor
+            self.assertEqual(seen, [v.id for v in qs], sort)
+
+    def test_view(self):
+        res = self.client.get("/catalog/parts/tires/", {"group": "product", "sort": "price_asc"})
+        self.assertEqual([v.id for v in res.context["variants"]], [self.v1.id, self.v3.id, self.v4.id])
+        self.assertContains(res, "1\xa0000 – 1\xa0200 ₽")
+        self.assertContains(res, "вариантов: 2")
+        self.assertContains(res, 'name="group" value="product" checked')
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class FacetSnapshotTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def summary(self, facets):
+        return (facets["price_range"], facets["brand_facet"],
+                [(f["attribute"].id, f["values"], f["range"], f["counts"]) for f in facets["attr_facets"]])
+
+    def test_serves_unfiltered_until_catalog_changes(self):
+        self.assertIsNone(facet_snapshot.get(self.tires, None, make_params()))
+        self.assertEqual(facet_snapshot.rebuild(), 2)
+        self.assertEqual(facet_snapshot.rebuild(), 0)  # каталог не менялся
+        with self.assertNumQueries(0):
+            facets = facet_snapshot.get(self.tires, None, make_params(sort="price_asc"))
+        self.assertEqual(self.summary(facets), self.summary(compute_facets(self.tires, None, make_params())))
+        self.assertEqual(facet_snapshot.get(self.root, None, make_params())["brand_facet"],
+                         facets["brand_facet"])  # с подкатегориями
+        self.assertIsNone(facet_snapshot.get(self.tires, None, make_params(in_stock=True)))
+        self.assertIsNone(facet_snapshot.get(self.tires, self.shimano, make_params()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_variant(self.p2, "3000", size="2.6", color="Синий")
+        self.assertIsNone(facet_snapshot.get(self.tires, None, make_params()))
+        self.assertEqual(facet_snapshot.rebuild(), 2)  # покрышки и родитель
+        color = next(f for f in facet_snapshot.get(self.tires, None, make_params())["attr_facets"]
+                     if f["attribute"] == self.color)
+        self.assertEqual(color["counts"], {"Красный": 1, "Синий": 1, "Черный": 2})
+
+    def test_only_changed_categories_are_rebuilt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tools = Category.objects.create(title="Инструменты", slug="tools")
+        self.assertEqual(facet_snapshot.rebuild(), 3)
+        bump_version(CATALOG)  # как sync_inventory: остатки фасетам без фильтров безразличны
+        self.assertIsNotNone(facet_snapshot.get(self.tires, None, make_params()))
+        self.assertEqual(facet_snapshot.rebuild(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_variant(self.p2, "3000", size="2.6", color="Синий")
+        with mock.patch.object(facet_snapshot, "compute_facets", wraps=compute_facets) as computed, \
+                mock.patch.object(facet_snapshot, "index_for", return_value=None):
+            self.assertEqual(facet_snapshot.rebuild(), 2)
+        self.assertEqual({c.args[0] for c in computed.call_args_list}, {self.tires, self.root})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p2.category = tools
+            self.p2.save()
+        self.assertEqual(facet_snapshot.rebuild(), 3)  # прежняя категория с родителем и новая
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shimano.save()  # бренды — в фасетах всех категорий
+        self.assertIsNone(facet_snapshot.get(self.tires, None, make_params()))
+
+    def test_landing_page_skips_facet_queries(self):
+        facet_snapshot.rebuild(force=True)
+        with mock.patch("products.views.compute_facets") as sql, \
+                mock.patch.object(catalog_index.CatalogIndex, "facets") as indexed:
+            res = self.client.get("/catalog/parts/tires/", {"sort": "price_asc"})
+            self.assertEqual(res.status_code, 200)
+            sql.assert_not_called()
+            indexed.assert_not_called()
+        self.assertContains(res, "Maxxis")
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class ListViewTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def test_search_page_ranks_in_stock_first(self):
+        res = self.client.get("/catalog/search/", {"q": "shimano"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([v.id for v in res.context["variants"]], [self.v1.id, self.v2.id])
+        self.assertContains(res, '<a href="/catalog/parts/tires/?q=shimano">Покрышки</a>')
+
+    def test_query_without_words_does_not_crash(self):
+        for url in ("/catalog/search/", "/catalog/cards/"):
+            for params in ({"q": "!!!"}, {"q": "-", "group": "product"}, {"q": "&"}):
+                with self.subTest(url=url, **params):
+                    self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_page_number_redirects_to_cursor(self):
+        res = self.client.get("/catalog/parts/tires/", {"page": "1", "a_color": "Черный"})
+        self.assertRedirects(res, "/catalog/parts/tires/?a_color=%D0%A7%D0%B5%D1%80%D0%BD%D1%8B%D0%B9",
+                             status_code=301)
+
+    def test_category_page(self):
+        res = self.client.get("/catalog/parts/tires/", {"a_color": "Черный"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({v.id for v in res.context["variants"]}, {self.v1.id, self.v3.id})
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class CardsEndpointTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+            for i in range(25):
+                self.make_variant(self.p2, str(3000 + i), size=f"3.{i:02d}")
+
+    def test_next_batch_matches_listing_page(self):
+        page = self.client.get("/catalog/parts/tires/", {"sort": "price_asc"})
+        token = page.context["page_obj"].next_cursor
+        self.assertEqual(page.context["cards_url"], "/catalog/cards/?path=parts%2Ftires&sort=price_asc")
+        expected = self.client.get("/catalog/parts/tires/", {"sort": "price_asc", "cursor": token}).context["variants"]
+        with mock.patch("products.views.compute_facets") as sql, \
+                mock.patch.object(catalog_index.CatalogIndex, "facets") as indexed:
+            data = self.client.get(f'{page.context["cards_url"]}&cursor={token}').json()
+            sql.assert_not_called()
+            indexed.assert_not_called()
+        self.assertEqual((data["count"], data["end"], data["next"]), (28, 28, None))
+        urls = re.findall(r'data-url="([^"]+)"', data["html"])
+        self.assertEqual(urls, [v.card_view.url_path for v in expected])
+
+    def test_fragments_are_cached(self):
+        self.client.get("/catalog/cards/", {"brand": "shimano"})
+        with mock.patch("products.utils.cards.get_template") as loaded:
+            loaded.return_value.render.side_effect = AssertionError("фрагмент не из кэша")
+            data = self.client.get("/catalog/cards/", {"brand": "shimano", "sort": "price_desc"}).json()
+        self.assertEqual(len(re.findall(r'class="product-card ', data["html"])), 2)
+
+
+@override_settings(CACHES=LOCMEM)
+class SwatchTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+        category_tree.get_tree()
+
+    def test_siblings_in_one_query(self):
+        with self.assertNumQueries(1):
+            sets = swatches.build([self.p1.id, self.p2.id])
+        self.assertNotIn(self.p2.id, sets)  # один вариант — показывать нечего
+        v1_url, v2_url = self.v1.get_absolute_url(), self.v2.get_absolute_url()
+        self.assertEqual(sets[self.p1.id]["rows"], [
+            ("Размер", [("2.3", v1_url), ("2.4", v2_url)]),
+            ("Цвет", [("Красный", v2_url), ("Черный", v1_url)]),
+        ])
+        self.assertEqual(sets[self.p1.id]["picked"][self.v2.id.hex], ("2.4", "Красный"))
+
+    def test_repeat_render_is_cached_until_product_changes(self):
+        variants = list(base_qs())
+        swatches.for_cards(variants)
+        bump_version(CATALOG)  # версия каталога наборы не сбрасывает
+        with self.assertNumQueries(0):
+            rows = swatches.for_cards(variants)[self.v1.id]
+        self.assertEqual([[i["text"] for i in r["items"] if i["active"]] for r in rows], [["2.3"], ["Черный"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AttributeValue.objects.filter(variant=self.v2, attribute=self.color).update(value_text="Синий")
+            self.v2.save()
+        rows = swatches.for_cards(variants)[self.v1.id]
+        self.assertEqual([i["text"] for i in rows[1]["items"]], ["Синий", "Черный"])
+
+    def test_card_links_to_siblings(self):
+        html = cards.render_cards(list(base_qs().filter(pk=self.v1.pk)))[0]
+        self.assertIn(f'class="card-swatch" href="{self.v2.get_absolute_url()}"', html)
+        self.assertIn(f'class="card-swatch is-active" href="{self.v1.get_absolute_url()}"', html)
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class VariantMatrixTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+            self.v4 = self.make_variant(self.p1, "1300", size="2.4", color="Черный")
+        category_tree.get_tree()
+
+    def items(self, variant):
+        return [[(i["text"], i["url"], i["active"], i["disabled"]) for i in row["items"]]
+                for row in variant_rows(Variant.objects.get(pk=variant.pk))]
+
+    def test_rows_link_combinations(self):
+        url = lambda v: v.get_absolute_url()  # noqa: E731
+        self.assertEqual(self.items(self.v2), [
+            [("2.3", url(self.v1), False, True), ("2.4", url(self.v2), True, False)],
+            [("Красный", url(self.v2), True, False), ("Черный", url(self.v4), False, False)],
+        ])
+        self.assertEqual(self.items(self.v1)[0], [("2.3", url(self.v1), True, False), ("2.4", url(self.v4), False, False)])
+        # 2.3 Красный нет — ближайший вариант с красным
+        self.assertEqual(self.items(self.v1)[1][0], ("Красный", url(self.v2), False, True))
+
+    def test_matrix_is_cached_per_product_version(self):
+        self.items(self.v1)
+        variant = Variant.objects.get(pk=self.v2.pk)
+        with self.assertNumQueries(0):
+            variant_rows(variant)
+        with self.captureOnCommitCallbacks(execute=True):
+            av = AttributeValue.objects.get(variant=self.v4, attribute=self.color)
+            av.value_text = "Синий"
+            av.save()
+        self.assertEqual([i[0] for i in self.items(self.v2)[1]], ["Красный", "Синий", "Черный"])
+
+    def test_detail_page(self):
+        response = self.client.get(self.v1.get_absolute_url())
+        self.assertEqual(response.context["rows"][0]["label"], "Размер")
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class ListPageCacheTests(CatalogMixin, TestCase):
+    url = "/catalog/parts/tires/"
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def test_repeat_hit_skips_pipeline(self):
+        before = page_cache.stats()
+        first = self.client.get(self.url, {"brands": "shimano,maxxis"})
+        second = self.client.get(self.url, {"brands": "maxxis,shimano"})  # тот же нормализованный ключ
+        self.assertEqual(first.content, second.content)
+        after = page_cache.stats()
+        self.assertEqual((after["hits"] - before["hits"], after["misses"] - before["misses"]), (1, 1))
+        self.assertContains(second, 'name="brands" id="brands" value="maxxis,shimano"')
+
+    def test_catalog_edit_bumps_version(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.v3.price = Decimal("3333")
+            self.v3.save()
+        self.assertContains(self.client.get(self.url), "3\xa0333 ₽")
+
+    def test_shared_with_logged_in_users(self):
+        from django.contrib.auth import get_user_model
+        self.client.get(self.url)
+        user = get_user_model().objects.create_user("u@example.com")
+        self.client.force_login(user)
+        hits = page_cache.stats()["hits"]
+        self.client.get(self.url)
+        self.assertEqual(page_cache.stats()["hits"], hits + 1)
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class DetailPageCacheTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+        self.url = self.v1.get_absolute_url()
+
+    def test_repeat_hit_skips_render(self):
+        before = page_cache.stats(page_cache.DETAIL)
+        first = self.client.get(self.url)
+        with mock.patch("products.views.render_page", side_effect=AssertionError("страница не из кэша")), \
+                mock.patch("core.context_processors.Variant") as variants:
+            second = self.client.get(self.url)
+            variants.objects.select_related.assert_not_called()  # крошки — из view
+        self.assertEqual(first.content, second.content)
+        after = page_cache.stats(page_cache.DETAIL)
+        self.assertEqual((after["hits"] - before["hits"], after["misses"] - before["misses"]), (1, 1))
+        self.assertEqual(second.context["breadcrumbs"][2:],
+                         [("Запчасти", "/catalog/parts/"), ("Покрышки", "/catalog/parts/tires/"), (str(self.v1), None)])
+
+    def test_sibling_and_brand_edits_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            av = AttributeValue.objects.get(variant=self.v2, attribute=self.color)
+            av.value_text = "Синий"
+            av.save()
+        self.assertContains(self.client.get(self.url), "Синий")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shimano.description = "Японские компоненты"
+            self.shimano.save()
+        self.assertContains(self.client.get(self.url), "Японские компоненты")
+
+    def test_other_products_stay_cached(self):
+        self.client.get(self.v3.get_absolute_url())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.v1.price = Decimal("1111")
+            self.v1.save()
+        with mock.patch("products.views.render_page", side_effect=AssertionError("страница не из кэша")):
+            self.client.get(self.v3.get_absolute_url())
+
+    def test_recommendations_show_stock_at_render_time(self):
+        RelatedVariant.objects.create(from_variant=self.v1, to_variant=self.v3, weight=5)
+        self.assertIn(self.v3, self.client.get(self.url).context["related_variants"])
+        Variant.objects.filter(pk=self.v3.pk).update(inventory=0)  # как sync_inventory: мимо сигналов
+        self.assertNotIn(self.v3, self.client.get(self.url).context["related_variants"])
+
+
+@override_settings(CACHES=LOCMEM)
+class RecommendationBuilderTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+        CopurchaseVariantStat.objects.create(variant_min=min(self.v1, self.v3, key=lambda v: v.id),
+                                             variant_max=max(self.v1, self.v3, key=lambda v: v.id), count=4)
+        reco_variants.build_all()
+
+    def test_links_are_precomputed(self):
+        links = RelatedVariant.objects.filter(from_variant=self.v1, source=RelatedVariant.Source.AUTO)
+        self.assertEqual([rl.to_variant_id for rl in links.order_by("position")], [self.v3.id, self.v2.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(reco_variants.related_variants(self.v1), [self.v3])  # v2 не в наличии
+
+    def test_manual_link_is_kept_and_pinned_first(self):
+        # у пары уже есть AUTO-связь — ручной она становится правкой той же строки
+        RelatedVariant.objects.update_or_create(from_variant=self.v3, to_variant=self.v2, defaults={
+            "source": RelatedVariant.Source.MANUAL, "weight": 1.0, "pinned": True})
+        Variant.objects.filter(pk=self.v2.pk).update(inventory=3)
+        reco_variants.build_all()
+        self.assertEqual(reco_variants.related_variants(self.v3), [self.v2, self.v1])
+        self.assertEqual(RelatedVariant.objects.filter(from_variant=self.v3).count(), 2)
+
+    def test_curated_link_keeps_its_place_against_strong_auto(self):
+        # v3 ко-покупают с v1 — сильный AUTO-кандидат; ручная связь v1 → v2 весит больше (3.6 против 3.2)
+        # при сопоставимой похожести: одной ручной долей (без похожести и надбавок) она бы проиграла
+        RelatedVariant.objects.update_or_create(from_variant=self.v1, to_variant=self.v2, defaults={
+            "source": RelatedVariant.Source.MANUAL, "weight": 1.2})
+        Variant.objects.filter(pk=self.v2.pk).update(inventory=3)
+        reco_variants.build_all()
+        expected = [other for _, _, _, other in reco_variants.score_category(self.tires.id)[self.v1.id]]
+        self.assertEqual(expected, [self.v2.id, self.v3.id])
+        self.assertEqual(reco_variants.related_variants(self.v1), [self.v2, self.v3])
+
+    def test_only_touched_categories_are_rebuilt(self):
+        reco_variants.build_touched()
+        with mock.patch.object(reco_variants, "build_category", return_value=0) as build:
+            self.assertEqual(reco_variants.build_touched(), 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.v3.price = Decimal("900")
+                self.v3.save()
+            self.assertEqual(reco_variants.build_touched(), 1)
+        build.assert_called_once_with(self.tires.id)
+
+
+@override_settings(CACHES=LOCMEM)
+class CopurchaseStatsTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+        self.v1, self.v2, self.v3 = sorted((self.v1, self.v2, self.v3), key=lambda v: v.id)
+
+    def counts(self):
+        return {(s.variant_min_id, s.variant_max_id): s.count for s in CopurchaseVariantStat.objects.all()}
+
+    def test_checkout_only_queues_task_after_commit(self):
+        with mock.patch("cart.tasks.record_copurchases.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertNumQueries(0):
+                    copurchase.bump_copurchases_variants([self.v2.id, self.v1.id, self.v2.id])
+                delay.assert_not_called()
+        delay.assert_called_once_with([str(self.v1.id), str(self.v2.id)])
+
+    def test_pairs_are_upserted(self):
+        self.assertEqual(copurchase.record([self.v1.id, self.v2.id, self.v3.id]), 3)
+        self.assertEqual(copurchase.record([str(self.v3.id), self.v2.id, self.v3.id]), 1)
+        self.assertEqual(self.counts(), {(self.v1.id, self.v2.id): 1, (self.v1.id, self.v3.id): 1,
+                                         (self.v2.id, self.v3.id): 2})
+
+    def test_task_retries_transient_db_errors(self):
+        from cart.tasks import record_copurchases
+
+        with mock.patch.object(copurchase, "record", side_effect=[OperationalError("deadlock detected"), 1]) as rec:
+            result = record_copurchases.apply(args=([str(self.v1.id), str(self.v2.id)],))
+        self.assertEqual((result.get(), rec.call_count), ({"pairs": 1}, 2))
+
+    def test_backfill_recounts_from_order_items(self):
+        for variants in ((self.v1, self.v2), (self.v2, self.v1, self.v2), (self.v3,)):
+            order = Order.objects.create(user_name="Тест", contact_phone="+70000000000")
+            OrderItem.objects.bulk_create([OrderItem(order=order, variant=v, price=Decimal(100), quantity=1,
+                                                     amount=Decimal(100)) for v in variants])
+        copurchase.record([self.v1.id, self.v2.id, self.v3.id])
+        self.assertEqual(copurchase.backfill(), 1)
+        # пары вне истории заказов не трогаются
+        self.assertEqual(self.counts(), {(self.v1.id, self.v2.id): 2, (self.v1.id, self.v3.id): 1,
+                                         (self.v2.id, self.v3.id): 1})
+
+
+class ContentSimilarityTests(SimpleTestCase):
+    def setUp(self):
+        rnd = np.random.default_rng(7)
+        self.variants = [
+            SimpleNamespace(id=i, price=float(rnd.choice([0, 990, 1500, 2500])),
+                            product=SimpleNamespace(category_id=rnd.choice([None, 1, 2]),
+                                                    brand_id=rnd.choice([None, 10, 11])))
+            for i in range(40)
+        ]
+        self.sig_map = {v.id: {f"a{a}=v{rnd.integers(3)}" for a in range(rnd.integers(4))} for v in self.variants}
+        self.engine = ContentSimilarity.from_variants(self.variants, self.sig_map)
+
+    def reference(self, a, b):
+        return reco_variants._content_similarity(a, b, self.sig_map)
+
+    def test_matches_per_pair_formula(self):
+        expected = [[self.reference(a, b) for b in self.variants] for a in self.variants]
+        with mock.patch("products.utils.similarity.MAX_CELLS", 300):  # несколько пачек
+            self.assertEqual(self.engine.block(range(40)).tolist(), expected)
+            self.assertEqual(self.engine.pairs([0, 5, 5, 39], [1, 2, 39, 0]).tolist(),
+                             [expected[0][1], expected[5][2], expected[5][39], expected[39][0]])
+
+    def test_top_k(self):
+        with mock.patch("products.utils.similarity.MAX_CELLS", 300):
+            top = self.engine.top_k(5)
+        for a, (cols, sims) in zip(self.variants, top):
+            others = sorted((self.reference(a, b) for b in self.variants if b is not a), reverse=True)
+            self.assertNotIn(a.id, cols.tolist())
+            self.assertEqual(sims.tolist(), others[:5])
+
+
+@override_settings(CACHES=LOCMEM)
+class SearchCacheTests(CatalogMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def source(self, q, **kw):
+        params = make_params(q=q, **kw)
+        ordering = parse_ordering(ordering_for(params.sort, ranked=True))
+        qs = order_qs(apply_scope(base_qs(), None, None, params), params.sort, ranked=True)
+        cached = search_cache.CachedSearch(search_cache.search_key("/catalog/search/", params), ordering,
+                                           lambda: QuerySetSource(qs, ordering))
+        return cached, QuerySetSource(qs, ordering), ordering
+
+    def pages(self, source, ordering, per_page=24):
+        ids, token, page = [], None, None
+        while page is None or page.has_next:
+            page = paginate_cursor(source, ordering, token, per_page)
+            ids += [v.id for v in page.object_list]
+            token = page.next_cursor
+        return ids, page
+
+    def test_repeat_search_reads_only_page_rows(self):
+        cached, sql, ordering = self.source("покрышка")
+        expected, _ = self.pages(sql, ordering)
+        self.assertEqual(self.pages(cached, ordering)[0], expected)
+        again, _, _ = self.source("  ПОКРЫШКА! ")  # тот же нормализованный запрос
+        with self.assertNumQueries(1):
+            ids, page = self.pages(again, ordering)
+        self.assertEqual((ids, page.count), (expected, 3))
+
+    def test_pages_beyond_cached_rows_fall_back_to_sql(self):
+        with mock.patch.object(search_cache, "MAX_ROWS", 2):
+            cached, sql, ordering = self.source("покрышка", sort="price_desc")
+            expected, _ = self.pages(sql, ordering, per_page=1)
+            ids, last = self.pages(cached, ordering, per_page=1)
+            self.assertEqual(ids, expected)
+            self.assertEqual(last.count, 3)
+            back = paginate_cursor(cached, ordering, last.previous_cursor, 1)
+            self.assertEqual([v.id for v in back.object_list], expected[1:2])
+
+    def test_catalog_edit_invalidates(self):
+        self.assertEqual(self.source("deore")[0].count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.v2.delete()
+        self.assertEqual(self.source("deore")[0].count(), 1)
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class SearchLogTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()  # буфер журнала — общий locmem процесса
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def test_searches_are_buffered_and_flushed(self):
+        for q in ("Shimano", "shimano!", "campagnolo"):
+            self.client.get("/catalog/search/", {"q": q})
+        self.client.get("/catalog/search/", {"q": "shimano", "cursor": "x"})  # листание — не новый поиск
+        self.assertFalse(SearchLog.objects.exists())
+
+        self.assertEqual(search_log.flush(), 3)
+        self.assertEqual(search_log.flush(), 0)
+        report = search_log.report()
+        self.assertEqual([(r["query"], r["n"]) for r in report["top"]], [("shimano", 2), ("campagnolo", 1)])
+        self.assertEqual([r["query"] for r in report["zero"]], ["campagnolo"])
+        self.assertEqual(report["zero_ratio"], 33.3)
+
+    def test_unfinished_tail_waits_for_next_flush(self):
+        search_log.record("deore", 2, 5)
+        cache.add(search_log.BUFFER.seq, 0, None)
+        cache.incr(search_log.BUFFER.seq)  # INCR уже прошёл, SET ещё нет
+        search_log.record("holy", 1, 5)
+        self.assertEqual(search_log.flush(), 1)
+        cache.set(search_log.BUFFER.entry_key(2), ("maxxis", 1, 5, timezone.now().timestamp()), 60)
+        self.assertEqual(search_log.flush(), 2)
+        self.assertEqual(sorted(SearchLog.objects.values_list("query", flat=True)), ["deore", "holy", "maxxis"])
+
+
+@override_settings(CACHES=LOCMEM, STORAGES=PLAIN_STORAGES)
+class PopularityTests(CatalogMixin, TestCase):
+    def setUp(self):
+        cache.clear()  # буфер просмотров — общий locmem процесса
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_catalog()
+
+    def order(self, variant, quantity, status="paid", days_ago=0):
+        order = Order.objects.create(user_name="Покупатель", contact_phone="+7 (999) 000-00-00", status=status)
+        OrderItem.objects.create(order=order, variant=variant, price=variant.price, quantity=quantity,
+                                 amount=variant.price * quantity)
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(date_ordered=timezone.now() - dt.timedelta(days=days_ago))
+
+    def test_views_are_buffered_per_day(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.v1.get_absolute_url()).status_code, 200)
+        self.assertFalse(VariantViewDay.objects.exists())
+        self.assertEqual(popularity.flush_views(), 2)
+        popularity.record_view(self.v1.id)
+        self.assertEqual(popularity.flush_views(), 1)
+        self.assertEqual(list(VariantViewDay.objects.values_list("variant_id", "day", "views")),
+                         [(self.v1.id, timezone.localdate(), 3)])
+
+    def test_recompute_ranks_pop_sort(self):
+        self.order(self.v3, 2)
+        self.order(self.v1, 100, status="canceled")
+        self.order(self.v2, 5, days_ago=2 * popularity.HALF_LIFE_DAYS)
+        a, b = sorted([self.v1.id, self.v2.id])
+        CopurchaseVariantStat.objects.create(variant_min_id=a, variant_max_id=b, count=1)
+        for _ in range(3):
+            popularity.record_view(self.v1.id)
+        popularity.flush_views()
+
+        self.assertEqual(popularity.recompute(), 3)
+        self.assertEqual(popularity.recompute(), 0)
+        pop = dict(Variant.objects.values_list("id", "popularity"))
+        self.assertEqual(pop[self.v3.id], 20000)   # 2 шт. сегодня, отменённый заказ не в счёт
+        self.assertEqual(pop[self.v1.id], 300 + 693)  # 3 просмотра + ln(2) за ко-покупку
+        self.assertEqual(pop[self.v2.id], 12500 + 693)  # 5 шт. две полужизни назад
+
+        qs = order_qs(apply_scope(base_qs(), self.tires, None, make_params()), "pop")
+        self.assertEqual([v.id for v in qs], [self.v3.id, self.v1.id, self.v2.id])  # сначала в наличии
+        result = catalog_index.get_index().listing(self.tires, None, make_params(), {})
+        self.assertEqual([v.id for v in result[0:result.count()]], [self.v3.id, self.v1.id, self.v2.id])
+
+    def test_recompute_refreshes_only_popularity(self):
+        index = catalog_index.get_index()
+        before = index.listing(self.tires, None, make_params(), {})
+        # в наличии v1 и v3; при равной популярности порядок по id — заказываем тот, что позади
+        behind = max((self.v1, self.v3), key=lambda v: [r.id for r in before[0:before.count()]].index(v.id))
+        listing = page_cache.body_key("/catalog/parts/tires/", make_params(sort="price_asc"), None)
+        by_pop = page_cache.body_key("/catalog/parts/tires/", make_params(), None)
+        catalog = (get_version(CATALOG), get_version(catalog_index.VERSION))
+        self.order(behind, 1)
+        self.assertEqual(popularity.recompute(), 1)
+
+        # ни версии каталога (кэши карточек, поиска, страниц с другой сортировкой), ни дельты индекса
+        self.assertEqual((get_version(CATALOG), get_version(catalog_index.VERSION)), catalog)
+        self.assertEqual(page_cache.body_key("/catalog/parts/tires/", make_params(sort="price_asc"), None), listing)
+        self.assertNotEqual(page_cache.body_key("/catalog/parts/tires/", make_params(), None), by_pop)
+        with mock.patch.object(catalog_index.CatalogIndex, "build") as build:
+            fresh = catalog_index.get_index()
+            build.assert_not_called()
+        self.assertIsNot(fresh, index)
+        self.assertEqual(int(index.popularity[index.pos_of[behind.id.hex]]), 0)  # опубликованный не меняется
+        result = fresh.listing(self.tires, None, make_params(), {})
+        self.assertEqual([v.id for v in result[0:result.count()]][0], behind.id)
@@ -7,6 +7,8 @@ urlpatterns = [
     re_path(r"^catalog/$", views.catalog, name="catalog"),
     re_path(r"^brands/$", views.brands, name="brands"),
     re_path(r"^catalog/search/$", views.list, name="search"),
+    re_path(r"^catalog/suggest/$", views.suggest, name="suggest"),
+    re_path(r"^catalog/cards/$", views.cards, name="cards"),
 
     re_path(
         r"^catalog/(?P<category_path>.+)/p/(?P<slug>[-\w\.]+)/$",
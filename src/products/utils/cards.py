@@ -0,0 +1,124 @@
+# products/utils/cards.py
+"""
+Карточки вариантов (VariantCard): всё, что card.html, главная и корзина показывают
+о варианте помимо цены и остатка. Собираются пачкой (несколько запросов на пачку, а не
+на карточку), пишутся upsert'ом; массовые правки (бренд, категория) только помечают dirty,
+добирает products.tasks.rebuild_cards_dirty.
+
+Готовый HTML card.html (render_cards) кэшируется по версии каталога на карточку: одна
+и та же карточка попадает в листинги с разными фильтрами и в пачки бесконечной прокрутки.
+Свотчи соседей (products.utils.swatches) добираются пачкой только для промахов.
+"""
+from collections import defaultdict
+from typing import Dict, List
+
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+from django.template.loader import get_template
+from django.utils.safestring import SafeString, mark_safe
+
+from products.models import CategoryAttribute, Variant, VariantCard
+from products.utils import swatches
+from products.utils.versions import CATALOG, get_version
+
+BATCH_SIZE = 500
+FRAGMENT_TTL = 3600
+
+
+def _variant_attrs(category_ids) -> Dict[int, List[CategoryAttribute]]:
+    by_cat = defaultdict(list)
+    for ca in (CategoryAttribute.objects
+               .filter(category_id__in=set(category_ids), is_variant=True)
+               .select_related("attribute")
+               .order_by("sort_order", "id")):
+        by_cat[ca.category_id].append(ca)
+    return by_cat
+
+
+def build_card(v: Variant, variant_attrs=None) -> VariantCard:
+    label = v.variant_label(variant_attrs).strip()
+    gallery = [[img.thumb.url, img.alt] for img in v.images.all() if img.image]
+    return VariantCard(
+        variant_id=v.id,
+        display_name=str(v.display_name(label)),
+        label=label,
+        url_path=v.get_absolute_url(),
+        # как Variant.main_image_url: своё первое фото, иначе фото товара
+        thumb_url=gallery[0][0] if gallery else v.product.imageURL,
+        gallery=gallery,
+        discount_percent=v.discount_percent,
+        dirty=False,
+    )
+
+
+def build_cards(variant_ids) -> List[VariantCard]:
+    variants = list(
+        Variant.objects.filter(id__in=list(variant_ids))
+        .select_related("product", "product__brand", "product__category")
+        .prefetch_related("attribute_values", "images")
+    )
+    by_cat = _variant_attrs(v.product.category_id for v in variants)
+    return [build_card(v, by_cat.get(v.product.category_id, [])) for v in variants]
+
+
+def refresh_cards(variant_ids) -> int:
+    cards = build_cards(variant_ids)
+    VariantCard.objects.bulk_create(
+        cards, update_conflicts=True, unique_fields=["variant"],
+        update_fields=["display_name", "label", "url_path", "thumb_url", "gallery",
+                       "discount_percent", "dirty", "updated"],
+    )
+    return len(cards)
+
+
+def mark_dirty(variants: QuerySet) -> int:
+    return VariantCard.objects.filter(variant__in=variants).update(dirty=True)
+
+
+def pending_ids(limit: int) -> List:
+    return list(
+        Variant.objects
+        .filter(Q(card__isnull=True) | Q(card__dirty=True))
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def refresh_dirty(batch_size: int = BATCH_SIZE, max_batches=None) -> int:
+    """Карточки без строки или с dirty=True, пачками; прерванный прогон продолжается со следующей."""
+    done = batches = 0
+    while True:
+        ids = pending_ids(batch_size)
+        if not ids:
+            break
+        done += refresh_cards(ids)
+        batches += 1
+        if max_batches and batches >= max_batches:
+            break
+    return done
+
+
+def _fragment_key(version: int, v: Variant, group: bool) -> str:
+    if group:
+        # карточка товара зависит ещё и от фильтров — через диапазон цен и число вариантов
+        return f"catalog:card:{version}:{v.id.hex}:g:{v.min_price}:{v.max_price}:{v.variant_count}"
+    return f"catalog:card:{version}:{v.id.hex}"
+
+
+def render_cards(variants: List[Variant], group: bool = False) -> List[SafeString]:
+    """HTML card.html по строкам листинга (base_qs; group — из list.group_by_product), в том же порядке."""
+    version = get_version(CATALOG)
+    keys = [_fragment_key(version, v, group) for v in variants]
+    cached = cache.get_many(keys)
+    missing = [v for v, key in zip(variants, keys) if key not in cached]
+    # свотчи нужны только промахам: один запрос (или ни одного) на всю пачку
+    sets = swatches.for_cards(missing) if missing else {}
+    template, fresh, out = get_template("products/card.html"), {}, []
+    for v, key in zip(variants, keys):
+        html = cached.get(key)
+        if html is None:
+            html = fresh[key] = str(template.render({"v": v, "group": group, "swatches": sets.get(v.id)}))
+        out.append(mark_safe(html))
+    if fresh:
+        cache.set_many(fresh, FRAGMENT_TTL)
+    return out
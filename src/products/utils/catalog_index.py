@@ -0,0 +1,579 @@
+# products/utils/catalog_index.py
+"""
+In-process индекс каталога для листинга и фасетов без текстового запроса.
+
+Каждый вариант — позиция в наборе NumPy-колонок (категория, бренд, цена в копейках,
+наличие, популярность, скидка, дата создания, id); значения атрибутов вариантов — по колонке на атрибут
+(позиции + значения). Фильтры сводятся к булевым маскам, сортировка — к np.lexsort,
+из БД читается только страница вариантов (IndexedList).
+
+Индекс свой у каждого воркера и строится лениво при первом запросе. Изменения
+(сигналы products.signals, sync_inventory) записываются через record_changes:
+счётчик версии "catalog_index" поднимается, а id изменённых вариантов кладутся
+в кэш под номером версии. Воркер с устаревшим индексом дочитывает из БД только
+эти варианты; если дельта потерялась или она слишком большая — перестраивается целиком.
+
+Пересчёт популярности (products.utils.popularity) дельтой не идёт — он меняет колонку
+почти у всех вариантов: поднимает свою версию POPULARITY, и воркер перечитывает из БД
+только колонку popularity (id, число) в копию индекса.
+
+CATALOG_INDEX_ENABLED = False возвращает листинг на SQL-путь (apply_scope/apply_attr_filters).
+"""
+import calendar
+import threading
+from dataclasses import replace
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from products.models import Attribute, AttributeValue, Brand, Category, Variant
+from products.utils import histogram
+from products.utils.facets import (
+    BRAND, TEXT_VALUES_LIMIT, category_facet, filter_slug_map, filterable_attributes,
+)
+from products.utils.histogram import NUMBER_SCALE, PRICE, PRICE_SCALE, Edges
+from products.utils.list import (
+    SORT_MAP, AttrCondition, FilterParams, base_qs, compile_attr_filters, effective_category_ids, group_by_attribute,
+)
+from products.utils.versions import POPULARITY, bump_version, get_versions
+
+VERSION = "catalog_index"
+DELTA_TTL = 24 * 3600
+MAX_DELTA_VERSIONS = 500
+MAX_DELTA_IDS = 20000  # больше — дешевле перечитать всё
+
+_NONE = -1  # категория/бренд не заданы
+
+
+def _delta_key(version: int) -> str:
+    return f"catalog_index:delta:{version}"
+
+
+def _hex(value) -> str:
+    # id варианта без дефисов: так uuid хранится в SQLite, а PostgreSQL отдаёт его через Cast с дефисами
+    return str(value).replace("-", "")
+
+
+def _cents(value: Decimal) -> int:
+    return int(value.scaleb(2))
+
+
+def _milli(value: Decimal) -> int:
+    return int(value.scaleb(3))
+
+
+def _micros(dt) -> int:
+    return calendar.timegm(dt.utctimetuple()) * 1_000_000 + dt.microsecond
+
+
+def _threshold(value: float, scale: int) -> float:
+    # параметры фильтров — float; сравниваем с целыми копейками/тысячными без дрейфа
+    return round(value * scale, 6)
+
+
+class _AttrColumn:
+    """Значения одного атрибута: pos — позиции вариантов, val — значение (у text — код в vocab)."""
+
+    def __init__(self, value_type: str, pos, val, vocab=None):
+        self.value_type = value_type
+        self.pos = pos
+        self.val = val
+        self.vocab: List[str] = vocab if vocab is not None else []
+        self.code_of: Dict[str, int] = {v: i for i, v in enumerate(self.vocab)}
+
+    def select(self, op: str, value) -> np.ndarray:
+        """Позиции вариантов, удовлетворяющих условию."""
+        if self.value_type == Attribute.TEXT:
+            codes = [self.code_of[v] for v in value if v in self.code_of]
+            return self.pos[np.isin(self.val, codes)]
+        if self.value_type == Attribute.BOOL:
+            return self.pos[self.val == bool(value)]
+        thr = _threshold(value, 1000)
+        if op == "gte":
+            return self.pos[self.val >= thr]
+        if op == "lte":
+            return self.pos[self.val <= thr]
+        return self.pos[self.val == thr]
+
+
+# id читаем строкой (Cast): uuid.UUID на каждую из сотен тысяч строк — основная цена полной сборки
+
+def _value_rows(ids=None):
+    qs = AttributeValue.objects.filter(variant__isnull=False)
+    if ids is not None:
+        qs = qs.filter(variant_id__in=ids)
+    return qs.annotate(key=Cast("variant_id", CharField())).values_list("key", "attribute_id", "attribute__value_type",
+                          "value_text", "value_number", "value_bool")
+
+
+def _variant_rows(ids=None):
+    qs = Variant.objects.all()
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    return qs.annotate(key=Cast("id", CharField())).values_list("key", "product__category_id", "product__brand_id",
+                          "price", "inventory", "is_active", "created", "popularity", "discount")
+
+
+class CatalogIndex:
+    COLUMNS = ("alive", "active", "category", "brand", "price", "in_stock", "popularity", "discount", "created",
+               "id_hi", "id_lo")
+    SORT_COLUMNS = {"has_stock": "in_stock", "price": "price", "created": "created", "popularity": "popularity",
+                    "discount": "discount"}
+
+    def __init__(self, version: int):
+        self.version = version
+        self.popularity_version = 0  # версия POPULARITY, по которой прочитана колонка popularity
+        self.ids: List[str] = []  # позиция -> hex id варианта
+        self.pos_of: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)      # вариант есть в БД
+        self.active = np.zeros(0, dtype=bool)
+        self.category = np.zeros(0, dtype=np.int64)
+        self.brand = np.zeros(0, dtype=np.int64)
+        self.price = np.zeros(0, dtype=np.int64)  # копейки
+        self.in_stock = np.zeros(0, dtype=np.int8)
+        self.popularity = np.zeros(0, dtype=np.int64)
+        self.discount = np.zeros(0, dtype=np.int64)  # %
+        self.created = np.zeros(0, dtype=np.int64)
+        # UUID как два uint64: порядок тот же, что у uuid в PostgreSQL и hex-строк в SQLite
+        self.id_hi = np.zeros(0, dtype=np.uint64)
+        self.id_lo = np.zeros(0, dtype=np.uint64)
+        self.attrs: Dict[int, _AttrColumn] = {}
+        self.brands: Dict[int, tuple] = {}
+        self.brand_by_slug: Dict[str, int] = {}
+
+    # ---------- построение ----------
+
+    @classmethod
+    def build(cls, version: int, popularity_version: int = 0) -> "CatalogIndex":
+        index = cls(version)
+        index.popularity_version = popularity_version
+        index._set_variants([(_hex(r[0]),) + r[1:] for r in _variant_rows()])
+        index._set_values(list(_value_rows()), touched=None)
+        index._load_brands()
+        return index
+
+    def _load_brands(self):
+        self.brands = {bid: (slug, title) for bid, slug, title in Brand.objects.values_list("id", "slug", "title")}
+        self.brand_by_slug = {slug: bid for bid, (slug, _) in self.brands.items()}
+
+    def _set_variants(self, rows):
+        """Обновляет/добавляет строки вариантов; новые id получают позиции в конце колонок."""
+        new = [r for r in rows if r[0] not in self.pos_of]
+        if new:
+            for r in new:
+                self.pos_of[r[0]] = len(self.ids)
+                self.ids.append(r[0])
+            grow = len(new)
+            for name in self.COLUMNS:
+                col = getattr(self, name)
+                setattr(self, name, np.concatenate([col, np.zeros(grow, dtype=col.dtype)]))
+        if not rows:
+            return
+        pos = np.fromiter((self.pos_of[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        self.alive[pos] = True
+        self.active[pos] = [r[5] for r in rows]
+        self.category[pos] = [_NONE if r[1] is None else r[1] for r in rows]
+        self.brand[pos] = [_NONE if r[2] is None else r[2] for r in rows]
+        self.price[pos] = [_cents(r[3]) for r in rows]
+        self.in_stock[pos] = [1 if r[4] > 0 else 0 for r in rows]
+        self.created[pos] = [_micros(r[6]) for r in rows]
+        self.popularity[pos] = [r[7] for r in rows]
+        self.discount[pos] = [r[8] for r in rows]
+        self.id_hi[pos] = [int(r[0][:16], 16) for r in rows]
+        self.id_lo[pos] = [int(r[0][16:], 16) for r in rows]
+
+    def _set_values(self, rows, touched: Optional[np.ndarray]):
+        """
+        Пересобирает колонки атрибутов: у touched-позиций старые значения выкидываются
+        и заменяются rows (touched=None — полная сборка).
+        """
+        grouped: Dict[int, tuple] = {}
+        for variant_id, attr_id, value_type, text, number, flag in rows:
+            pos = self.pos_of.get(_hex(variant_id))
+            if pos is None:
+                continue
+            if value_type == Attribute.TEXT:
+                if not text:
+                    continue
+                value = text
+            elif value_type == Attribute.NUMBER:
+                if number is None:
+                    continue
+                value = _milli(number)
+            else:
+                if flag is None:
+                    continue
+                value = flag
+            grouped.setdefault(attr_id, (value_type, [], []))
+            grouped[attr_id][1].append(pos)
+            grouped[attr_id][2].append(value)
+
+        attrs = dict(self.attrs) if touched is not None else {}
+        for attr_id in set(attrs) | set(grouped):
+            old = attrs.get(attr_id)
+            value_type, add_pos, add_val = grouped.get(attr_id, (old.value_type if old else None, [], []))
+            vocab = list(old.vocab) if old else []
+            if old is not None and old.value_type != value_type:
+                old, vocab = None, []  # сменили тип атрибута — старые значения не годятся
+            if value_type == Attribute.TEXT:
+                code_of = {v: i for i, v in enumerate(vocab)}
+                for v in add_val:
+                    if v not in code_of:
+                        code_of[v] = len(vocab)
+                        vocab.append(v)
+                add_val = [code_of[v] for v in add_val]
+                dtype = np.int32
+            elif value_type == Attribute.NUMBER:
+                dtype = np.int64
+            else:
+                dtype = bool
+            pos = np.array(add_pos, dtype=np.int64)
+            val = np.array(add_val, dtype=dtype)
+            if old is not None:
+                keep = ~np.isin(old.pos, touched)
+                pos = np.concatenate([old.pos[keep], pos])
+                val = np.concatenate([old.val[keep], val])
+            attrs[attr_id] = _AttrColumn(value_type, pos, val, vocab)
+        self.attrs = attrs
+
+    # ---------- инкрементальное обновление ----------
+
+    def copy(self, version: int) -> "CatalogIndex":
+        # копия при записи: запросы, уже держащие старый индекс, дочитают его целым
+        other = CatalogIndex(version)
+        other.popularity_version = self.popularity_version
+        other.ids = list(self.ids)
+        other.pos_of = dict(self.pos_of)
+        for name in self.COLUMNS:
+            setattr(other, name, getattr(self, name).copy())
+        other.attrs = dict(self.attrs)
+        return other
+
+    def apply(self, ids, version: int) -> "CatalogIndex":
+        """Новый индекс версии version с перечитанными из БД вариантами ids."""
+        index = self.copy(version)
+        ids = [_hex(i) for i in ids]
+        rows = [(_hex(r[0]),) + r[1:] for r in _variant_rows(ids)] if ids else []
+        found = {r[0] for r in rows}
+        gone = [index.pos_of[i] for i in ids if i not in found and i in index.pos_of]
+        index.alive[gone] = False
+        index._set_variants(rows)
+        touched = np.array([index.pos_of[i] for i in ids if i in index.pos_of], dtype=np.int64)
+        index._set_values(list(_value_rows(ids)) if ids else [], touched=touched)
+        index._load_brands()
+        return index
+
+    def with_popularity(self, popularity_version: int) -> "CatalogIndex":
+        """Копия с колонкой popularity, перечитанной из БД; новые варианты придут дельтой."""
+        index = self.copy(self.version)
+        index.brands, index.brand_by_slug = self.brands, self.brand_by_slug
+        index.popularity_version = popularity_version
+        rows = [(self.pos_of[_hex(key)], p)
+                for key, p in Variant.objects.annotate(key=Cast("id", CharField())).values_list("key", "popularity")
+                if _hex(key) in self.pos_of]
+        if rows:
+            pos, values = (np.array(col, dtype=np.int64) for col in zip(*rows))
+            index.popularity[pos] = values
+        return index
+
+    # ---------- запросы ----------
+
+    def supports_sort(self, sort: str) -> bool:
+        fields = SORT_MAP.get(sort, SORT_MAP["pop"])
+        return all(f.lstrip("-") in self.SORT_COLUMNS or f.lstrip("-") == "id" for f in fields)
+
+    def scope_mask(self, cat: Optional[Category], br: Optional[Brand], params: FilterParams,
+                   active_only: bool = True) -> np.ndarray:
+        """Аналог apply_scope (без q) в виде булевой маски по позициям."""
+        mask = self.alive.copy()
+        if active_only:
+            mask &= self.active
+        cat_ids = effective_category_ids(cat)
+        if cat_ids:
+            mask &= np.isin(self.category, cat_ids)
+        if br:
+            mask &= self.brand == br.id
+        if params.in_stock:
+            mask &= self.in_stock == 1
+        if params.on_sale:
+            mask &= self.discount > 0
+        mask &= self.price_mask(params)
+        if params.brand_slugs and not br:
+            wanted = [self.brand_by_slug[s] for s in params.brand_slugs if s in self.brand_by_slug]
+            mask &= np.isin(self.brand, wanted)
+        return mask
+
+    def price_mask(self, params: FilterParams) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        if params.price_min is not None:
+            mask &= self.price >= _threshold(params.price_min, 100)
+        if params.price_max is not None:
+            mask &= self.price <= _threshold(params.price_max, 100)
+        return mask
+
+    def attr_mask(self, conds: List[AttrCondition]) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for a, op, value in conds:
+            col = self.attrs.get(a.id)
+            hit = np.zeros(len(self.ids), dtype=bool)
+            if col is not None:
+                hit[col.select(op, value)] = True
+            mask &= hit
+        return mask
+
+    def _sort_columns(self, name: str, positions: np.ndarray) -> List[np.ndarray]:
+        if name == "id":
+            return [self.id_hi[positions], self.id_lo[positions]]
+        return [getattr(self, self.SORT_COLUMNS[name])[positions].astype(np.int64)]
+
+    @staticmethod
+    def _sort_values(name: str, value) -> List[int]:
+        """Значение ключа курсора (products.utils.cursor) в представлении колонок."""
+        if name == "id":
+            return [value.int >> 64, value.int & 0xFFFFFFFFFFFFFFFF]
+        if name == "price":
+            return [_cents(value)]
+        if name == "created":
+            return [_micros(value)]
+        return [int(value)]
+
+    def order(self, positions: np.ndarray, sort: str) -> np.ndarray:
+        keys = []
+        for field in SORT_MAP.get(sort, SORT_MAP["pop"]):
+            desc, name = field.startswith("-"), field.lstrip("-")
+            for col in self._sort_columns(name, positions):
+                keys.append((~col if col.dtype == np.uint64 else -col) if desc else col)
+        # lexsort: главный ключ — последний
+        return positions[np.lexsort(keys[::-1])]
+
+    def beyond_key(self, positions: np.ndarray, sort: str, key: list, backwards: bool = False) -> np.ndarray:
+        """Маска позиций строго после key в порядке sort (backwards — строго до)."""
+        beyond = np.zeros(len(positions), dtype=bool)
+        equal = np.ones(len(positions), dtype=bool)
+        for field, value in zip(SORT_MAP.get(sort, SORT_MAP["pop"]), key):
+            desc, name = field.startswith("-"), field.lstrip("-")
+            for col, v in zip(self._sort_columns(name, positions), self._sort_values(name, value)):
+                beyond |= equal & ((col < v) if desc != backwards else (col > v))
+                equal &= col == v
+        return beyond
+
+    def listing(self, cat: Optional[Category], br: Optional[Brand], params: FilterParams,
+                by_slug: Dict[str, Attribute]) -> "IndexedList":
+        mask = self.scope_mask(cat, br, params) & self.attr_mask(compile_attr_filters(params, by_slug))
+        return IndexedList(self, self.order(np.flatnonzero(mask), params.sort), params.sort)
+
+    def facets(self, cat: Optional[Category], br: Optional[Brand], params: FilterParams) -> dict:
+        """
+        Та же структура, что у compute_facets; база — как у faceting_base_qs, счётчики —
+        по активным вариантам, прошедшим все фильтры, кроме фильтра своего измерения.
+        """
+        base = self.scope_mask(cat, br, replace(params, brand_slugs=[], price_min=None, price_max=None),
+                               active_only=False)
+        mask = base & self.price_mask(params)
+        price = {"min": None, "max": None}
+        if mask.any():
+            prices = self.price[mask]
+            price = {"min": Decimal(int(prices.min())).scaleb(-2), "max": Decimal(int(prices.max())).scaleb(-2)}
+
+        attrs = filterable_attributes(cat)
+        edges = histogram.cached_edges(cat, br, lambda: self.histogram_edges(cat, br, params, attrs))
+        passes = {}  # измерение -> маска вариантов, прошедших его фильтр (кроме цены — она в mask)
+        if params.brand_slugs and not br:
+            wanted = [self.brand_by_slug[s] for s in params.brand_slugs if s in self.brand_by_slug]
+            passes[BRAND] = np.isin(self.brand, wanted)
+        conds = compile_attr_filters(params, filter_slug_map(cat, attrs, params))
+        for attr_id, group in group_by_attribute(conds).items():
+            passes[attr_id] = self.attr_mask(group)
+        countable = mask & self.active
+
+        def counted(dim) -> np.ndarray:
+            m = (base & self.active) if dim == PRICE else countable.copy()
+            for other, passed in passes.items():
+                if other != dim:
+                    m &= passed
+            return m
+
+        price_histogram = histogram.bars(
+            edges[PRICE], histogram.buckets_of(self.price[counted(PRICE)], edges[PRICE], PRICE_SCALE))
+
+        brand_counts = dict(zip(*np.unique(self.brand[counted(BRAND)], return_counts=True)))
+        brand_ids = [int(b) for b in np.unique(self.brand[mask]) if b != _NONE and b in self.brands]
+        brands = sorted(
+            ({"product__brand__slug": self.brands[b][0], "product__brand__title": self.brands[b][1],
+              "count": int(brand_counts.get(b, 0))}
+             for b in brand_ids),
+            key=lambda b: (b["product__brand__title"], b["product__brand__slug"]),
+        )
+
+        items = []
+        for a in attrs:
+            item = {"attribute": a, "values": None, "range": None, "counts": None, "histogram": None}
+            col = self.attrs.get(a.id)
+            hit = mask[col.pos] if col is not None else None
+            if a.value_type == Attribute.TEXT:
+                item["values"], item["counts"] = [], {}
+                if col is not None:
+                    values = sorted(col.vocab[c] for c in np.unique(col.val[hit]))
+                    item["values"] = values[:TEXT_VALUES_LIMIT]
+                    item["counts"] = dict.fromkeys(values, 0)
+                    codes, ns = np.unique(col.val[counted(a.id)[col.pos]], return_counts=True)
+                    item["counts"].update((col.vocab[c], int(n)) for c, n in zip(codes, ns))
+            elif a.value_type == Attribute.BOOL:
+                item["values"] = [{"label": "Да", "value": "1"}, {"label": "Нет", "value": "0"}]
+                item["counts"] = {"1": 0, "0": 0}
+                if col is not None:
+                    vals = col.val[counted(a.id)[col.pos]]
+                    item["counts"] = {"1": int(vals.sum()), "0": int((~vals).sum())}
+            else:
+                item["range"] = {"min": None, "max": None}
+                if col is not None and hit.any():
+                    vals = col.val[hit]
+                    item["range"] = {"min": Decimal(int(vals.min())).scaleb(-3),
+                                     "max": Decimal(int(vals.max())).scaleb(-3)}
+                if col is not None:
+                    vals = col.val[counted(a.id)[col.pos]]
+                    item["histogram"] = histogram.bars(
+                        edges.get(a.id, []), histogram.buckets_of(vals, edges.get(a.id, []), NUMBER_SCALE))
+            items.append(item)
+
+        categories = []
+        if cat is None:
+            codes, ns = np.unique(self.category[counted(None)], return_counts=True)
+            categories = category_facet({int(c): int(n) for c, n in zip(codes, ns) if c != _NONE}, br, params)
+        return {"price_range": price, "price_histogram": price_histogram, "brand_facet": brands,
+                "attr_facets": items, "category_facet": categories}
+
+    def histogram_edges(self, cat: Optional[Category], br: Optional[Brand], params: FilterParams,
+                        attrs: List[Attribute]) -> Edges:
+        """Границы гистограмм по активным вариантам области (как histogram.sql_edges, без запросов)."""
+        scope = self.scope_mask(cat, br, replace(params, in_stock=False, on_sale=False, price_min=None, price_max=None,
+                                                 brand_slugs=[]))
+        edges: Edges = {PRICE: histogram.edges_of(self.price[scope], PRICE_SCALE)}
+        for a in histogram.number_attributes(attrs):
+            col = self.attrs.get(a.id)
+            edges[a.id] = histogram.edges_of(col.val[scope[col.pos]], NUMBER_SCALE) if col is not None else []
+        return edges
+
+
+class IndexedList:
+    """
+    Упорядоченный результат индекса: count() без запросов, строки Variant (base_qs)
+    читаются только для запрошенного среза. Годится и для Paginator, и как
+    источник keyset-пагинации (seek/at, см. products.utils.cursor).
+    """
+
+    def __init__(self, index: CatalogIndex, positions: np.ndarray, sort: str):
+        self._index = index
+        self._positions = positions
+        self._sort = sort
+
+    def count(self) -> int:
+        return len(self._positions)
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def _rows(self, positions: np.ndarray) -> list:
+        ids = [self._index.ids[p] for p in positions]
+        rows = {v.id.hex: v for v in base_qs().filter(id__in=ids)}
+        return [rows[i] for i in ids if i in rows]
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        return self._rows(self._positions[k])
+
+    def at(self, offset: int):
+        rows = self[offset:offset + 1]
+        return rows[0] if rows else None
+
+    def seek(self, key: Optional[list], backwards: bool, limit: int) -> list:
+        positions = self._positions
+        if key is not None:
+            positions = positions[self._index.beyond_key(positions, self._sort, key, backwards)]
+        return self._rows(positions[-limit:] if backwards else positions[:limit])
+
+
+# ---------- состояние воркера ----------
+
+_lock = threading.Lock()
+_index: Optional[CatalogIndex] = None
+
+
+def changes_between(old: int, current: int) -> Optional[set]:
+    """
+    id вариантов, изменённых после версии old до current включительно (для всех
+    in-process индексов по версии "catalog_index"). None — дельту не собрать, перестраивать целиком.
+    """
+    if current - old > MAX_DELTA_VERSIONS:
+        return None
+    keys = [_delta_key(v) for v in range(old + 1, current + 1)]
+    deltas = cache.get_many(keys)
+    if len(deltas) != len(keys):
+        # дельта истекла (или ещё не записана после INCR) — надёжнее перечитать всё
+        return None
+    ids = {i for key in keys for i in deltas[key]}
+    return ids if len(ids) <= MAX_DELTA_IDS else None
+
+
+def _catch_up(index: CatalogIndex, current: int, popularity_version: int) -> CatalogIndex:
+    ids = changes_between(index.version, current)
+    if ids is None:
+        return CatalogIndex.build(current, popularity_version)
+    return index.apply(ids, current)
+
+
+def get_index() -> Optional[CatalogIndex]:
+    """Актуальный индекс воркера; None, если индекс выключен (CATALOG_INDEX_ENABLED)."""
+    global _index
+    if not settings.CATALOG_INDEX_ENABLED:
+        return None
+    versions = get_versions([VERSION, POPULARITY])
+    current, popularity = versions[VERSION], versions[POPULARITY]
+    index = _index
+    if index is not None and index.version == current and index.popularity_version == popularity:
+        return index
+    with _lock:
+        index = _index
+        if index is None or index.version > current:
+            # версии ещё нет (или счётчик сброшен вместе с Redis) — строим с нуля
+            index = CatalogIndex.build(current, popularity)
+        elif index.version < current:
+            index = _catch_up(index, current, popularity)
+        if index.popularity_version != popularity:
+            index = index.with_popularity(popularity)
+        _index = index
+    return index
+
+
+def index_for(params: FilterParams) -> Optional[CatalogIndex]:
+    """Индекс, если этот запрос листинга можно ответить из него; иначе None — SQL-путь."""
+    if params.q or params.group:
+        return None  # поиск и карточки по товарам — только SQL
+    index = get_index()
+    if index is None or not index.supports_sort(params.sort):
+        return None
+    return index
+
+
+def record_changes(ids) -> None:
+    """Сообщить воркерам, что варианты ids изменились (в т.ч. удалены). Пустой список — только версия."""
+    version = bump_version(VERSION)
+    cache.set(_delta_key(version), [str(i) for i in ids], DELTA_TTL)
+
+
+def record_popularity() -> None:
+    """Сообщить воркерам, что Variant.popularity пересчитана: перечитать только эту колонку."""
+    bump_version(POPULARITY)
+
+
+def reset() -> None:
+    """Забыть индекс воркера (тесты, ручная отладка)."""
+    global _index
+    with _lock:
+        _index = None
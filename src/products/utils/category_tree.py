@@ -0,0 +1,97 @@
+# products/utils/category_tree.py
+"""
+Дерево категорий в памяти процесса: материализованные пути ("parts/tires"),
+потомки, цепочки предков. Строится одним запросом и живёт, пока не сменится
+счётчик версии "category_tree" в кэше (Redis) — его поднимает любая правка
+категорий (products.signals). Версию воркер сверяет не чаще раза в CHECK_INTERVAL.
+"""
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from products.models import Category
+from products.utils.versions import bump_version, get_version
+
+VERSION = "category_tree"
+CHECK_INTERVAL = 1.0  # сек.
+
+
+class CategoryNode(NamedTuple):
+    id: int
+    parent_id: Optional[int]
+    slug: str
+    title: str
+    title_plural: Optional[str]
+    title_singular: Optional[str]
+
+
+class CategoryTree:
+    def __init__(self, version: int, nodes: List[CategoryNode]):
+        self.version = version
+        self.nodes: Dict[int, CategoryNode] = {n.id: n for n in nodes}
+        self.children: Dict[Optional[int], List[int]] = {}
+        for n in nodes:
+            self.children.setdefault(n.parent_id, []).append(n.id)
+        self.paths: Dict[int, str] = {}
+        for n in nodes:
+            self.paths[n.id] = "/".join(self.nodes[i].slug for i in self.ancestor_ids(n.id))
+        self.by_path: Dict[str, int] = {p: i for i, p in self.paths.items()}
+
+    @classmethod
+    def build(cls, version: int) -> "CategoryTree":
+        rows = Category.objects.values_list("id", "parent_id", "slug", "title", "title_plural", "title_singular")
+        return cls(version, [CategoryNode(*r) for r in rows])
+
+    def ancestor_ids(self, cat_id: int) -> List[int]:
+        """Цепочка от корня до cat_id включительно (цикл в данных обрывается)."""
+        chain, seen = [], set()
+        node = self.nodes.get(cat_id)
+        while node and node.id not in seen:
+            seen.add(node.id)
+            chain.append(node.id)
+            node = self.nodes.get(node.parent_id)
+        return chain[::-1]
+
+    def ancestors(self, cat_id: int) -> List[CategoryNode]:
+        return [self.nodes[i] for i in self.ancestor_ids(cat_id)]
+
+    def descendant_ids(self, cat_id: int, include_self: bool = True) -> List[int]:
+        ids = [cat_id] if include_self else []
+        frontier = [cat_id]
+        while frontier:
+            frontier = [c for i in frontier for c in self.children.get(i, ())]
+            ids.extend(frontier)
+        return ids
+
+    def path(self, cat_id: int) -> Optional[str]:
+        return self.paths.get(cat_id)
+
+    def resolve(self, path: str) -> Optional[int]:
+        return self.by_path.get(path.strip("/"))
+
+
+_lock = threading.Lock()
+_tree: Optional[CategoryTree] = None
+_checked = 0.0
+
+
+def get_tree() -> CategoryTree:
+    global _tree, _checked
+    tree, now = _tree, time.monotonic()
+    if tree is not None and now - _checked < CHECK_INTERVAL:
+        return tree
+    current = get_version(VERSION)
+    with _lock:
+        if _tree is None or _tree.version != current:
+            _tree = CategoryTree.build(current)
+        _checked = now
+        return _tree
+
+
+def invalidate(bump: bool = True) -> None:
+    """Сбросить дерево этого процесса; bump — заодно у остальных воркеров (после коммита)."""
+    global _tree
+    with _lock:
+        _tree = None
+    if bump:
+        bump_version(VERSION)
@@ -0,0 +1,169 @@
+# products/utils/cursor.py
+"""
+Keyset-пагинация листинга. Страница — «строки строго после ключа последней
+показанной строки» в порядке SORT_MAP (id — последний ключ, так что порядок полный);
+ключ уезжает в query string подписанным токеном ?cursor=…
+
+Источник строк — QuerySetSource (SQL: WHERE по ключу вместо OFFSET) либо
+catalog_index.IndexedList; у обоих seek()/at()/count().
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+
+PER_PAGE = 24
+COUNT_TTL = 120  # сек.; общее число для «из N» может чуть отставать
+SALT = "products.cursor"
+
+# как поднять значение ключа из токена
+FIELD_TYPES = {
+    "has_stock": int,
+    "price": Decimal,
+    "created": datetime.fromisoformat,
+    "id": uuid.UUID,
+    "search_rank": float,
+    "popularity": int,
+    "discount": int,
+}
+
+Ordering = List[Tuple[str, bool]]  # (поле, по убыванию)
+
+
+def parse_ordering(order_by: List[str]) -> Ordering:
+    return [(f.lstrip("-"), f.startswith("-")) for f in order_by]
+
+
+def _dump(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    return value
+
+
+@dataclass(frozen=True)
+class Cursor:
+    key: list
+    offset: int      # позиция первой строки страницы, на которую ведёт токен (для «25–48 из N»)
+    backwards: bool  # страница до ключа, а не после
+
+
+def encode_cursor(obj, ordering: Ordering, offset: int, backwards: bool = False) -> str:
+    return signing.dumps({
+        "f": [name for name, _ in ordering],
+        "k": [_dump(getattr(obj, name)) for name, _ in ordering],
+        "o": offset,
+        "b": int(backwards),
+    }, salt=SALT)
+
+
+def decode_cursor(token: str, ordering: Ordering) -> Optional[Cursor]:
+    """Битый, чужой или от другой сортировки токен — None (первая страница)."""
+    try:
+        data = signing.loads(token, salt=SALT)
+        if data["f"] != [name for name, _ in ordering]:
+            return None
+        key = [FIELD_TYPES[name](value) for (name, _), value in zip(ordering, data["k"])]
+        return Cursor(key, max(0, int(data["o"])), bool(data["b"]))
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def keyset_q(ordering: Ordering, key: list, backwards: bool = False) -> Q:
+    """(a, b, id) после (x, y, z): a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)."""
+    q, equal = Q(), {}
+    for (name, desc), value in zip(ordering, key):
+        op = "lt" if desc != backwards else "gt"
+        q |= Q(**equal, **{f"{name}__{op}": value})
+        equal[name] = value
+    return q
+
+
+class QuerySetSource:
+    """Упорядоченный queryset листинга (order_qs); count кэшируется по count_key."""
+
+    def __init__(self, qs: QuerySet, ordering: Ordering, count_key: Optional[str] = None):
+        self.qs = qs
+        self.ordering = ordering
+        self.count_key = count_key
+
+    def seek(self, key: Optional[list], backwards: bool, limit: int) -> list:
+        qs = self.qs
+        if key is not None:
+            qs = qs.filter(keyset_q(self.ordering, key, backwards))
+        if backwards:
+            return list(qs.reverse()[:limit])[::-1]
+        return list(qs[:limit])
+
+    def at(self, offset: int):
+        rows = list(self.qs[offset:offset + 1])
+        return rows[0] if rows else None
+
+    def count(self) -> int:
+        if self.count_key is None:
+            return self.qs.count()
+        total = cache.get(self.count_key)
+        if total is None:
+            total = self.qs.count()
+            cache.set(self.count_key, total, COUNT_TTL)
+        return total
+
+
+@dataclass
+class CursorPage:
+    object_list: list
+    count: int
+    offset: int
+    has_next: bool
+    has_previous: bool
+    next_cursor: Optional[str]
+    previous_cursor: Optional[str]  # None при has_previous — предыдущая страница первая, ссылка без cursor
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def start_index(self) -> int:
+        return self.offset + 1 if self.object_list else 0
+
+    def end_index(self) -> int:
+        return self.offset + len(self.object_list)
+
+
+def paginate_cursor(source, ordering: Ordering, token: Optional[str], per_page: int = PER_PAGE) -> CursorPage:
+    cur = decode_cursor(token, ordering) if token else None
+    if cur is None:
+        rows = source.seek(None, False, per_page + 1)
+        has_previous, has_next = False, len(rows) > per_page
+        rows, offset = rows[:per_page], 0
+    elif not cur.backwards:
+        rows = source.seek(cur.key, False, per_page + 1)
+        has_previous, has_next = True, len(rows) > per_page
+        rows, offset = rows[:per_page], cur.offset
+    else:
+        rows = source.seek(cur.key, True, per_page + 1)
+        has_previous, has_next = len(rows) > per_page, True
+        rows = rows[-per_page:]
+        offset = max(0, cur.offset - len(rows)) if has_previous else 0
+
+    next_cursor = encode_cursor(rows[-1], ordering, offset + len(rows)) if has_next and rows else None
+    previous_cursor = None
+    if has_previous and rows and offset > per_page:
+        previous_cursor = encode_cursor(rows[0], ordering, offset, backwards=True)
+    return CursorPage(rows, source.count(), offset, has_next, has_previous, next_cursor, previous_cursor)
+
+
+def legacy_page_cursor(source, ordering: Ordering, page: int, per_page: int = PER_PAGE) -> Optional[str]:
+    """Токен, ведущий на ту же страницу, что старый ?page=N (одно OFFSET-чтение). None — первая страница."""
+    if page <= 1:
+        return None
+    offset = (page - 1) * per_page
+    last = source.at(offset - 1)
+    return encode_cursor(last, ordering, offset) if last is not None else None
@@ -1,10 +1,17 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from django.core.cache import cache
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.db.models import Prefetch
+from django.template.defaultfilters import striptags, truncatechars
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
 from products.models import (
-    Variant, Image, AttributeValue, Attribute
+    Variant, Image, AttributeValue, Attribute, Product
 )
+from products.utils import category_tree
+from products.utils.versions import for_product, get_versions
 
 # ---------- selectors ----------
 
@@ -40,28 +47,37 @@ def get_variant_or_404(slug) -> Variant:
         slug=slug,
     )
 
+def get_variant_head_or_404(slug) -> Variant:
+    """Лёгкая выборка для кэшированной страницы: ключ кэша, просмотр, рекомендации."""
+    variant = (Variant.objects.select_related("product")
+               .only("id", "slug", "price", "product__id", "product__category_id", "product__brand_id")
+               .filter(slug=slug).first())
+    if variant is None:
+        raise Http404
+    return variant
+
 def get_sibling_variants_qs(product_id):
     return (
         Variant.objects.filter(product_id=product_id)
-        .select_related("product", "product__brand", "product__category")
+        .select_related("product")
         .prefetch_related(
             Prefetch("attribute_values",
                      queryset=AttributeValue.objects.select_related("attribute")),
-            Prefetch("images",
-                     queryset=Image.objects.order_by("sort", "id")),
         )
         .order_by("id")
     )
 
 # ---------- formatting ----------
 
+def format_value(value_type: str, value_text, value_number, value_bool) -> str:
+    if value_type == Attribute.TEXT:
+        return value_text
+    if value_type == Attribute.NUMBER:
+        return str(value_number).rstrip("0").rstrip(".")
+    return "Да" if value_bool else "Нет"
+
 def fmt_value(pav: AttributeValue) -> str:
-    a = pav.attribute
-    if a.value_type == Attribute.TEXT:
-        return pav.value_text
-    if a.value_type == Attribute.NUMBER:
-        return str(pav.value_number).rstrip("0").rstrip(".")
-    return "Да" if pav.value_bool else "Нет"
+    return format_value(pav.attribute.value_type, pav.value_text, pav.value_number, pav.value_bool)
 
 # ---------- domain ----------
 
@@ -94,22 +110,6 @@ def build_variants_index(variants_qs, attr_ids: List[int]):
 
     return variants_data, values_by_attr, first_by_attr_val
 
-def current_values_map(variant: Variant, attr_ids: List[int]) -> Dict[int, str]:
-    pavs = {p.attribute_id: p for p in variant.attribute_values.all()}
-    out = {}
-    for aid in attr_ids:
-        pav = pavs.get(aid)
-        if pav:
-            out[aid] = fmt_value(pav)
-    return out
-
-def find_variant_for(variants_data, selection: Dict[int, str]):
-    for item in variants_data:
-        attrs = item["attrs"]
-        if all(attrs.get(aid) == val for aid, val in selection.items()):
-            return item["obj"]
-    return None
-
 def number_aware_sort_key(s: str):
     from decimal import Decimal, InvalidOperation
     try:
@@ -117,33 +117,86 @@ def number_aware_sort_key(s: str):
     except (InvalidOperation, TypeError):
         return (1, str(s))
 
-def build_rows(attrs: List[Attribute],
-               attr_ids: List[int],
-               values_by_attr: Dict[int, List[str]],
-               first_by_attr_val: Dict[int, Dict[str, Variant]],
-               variants_data,
-               current_values: Dict[int, str]):
-    rows = []
-    for a in attrs:
-        aid = a.id
-        items = []
-        for val in sorted(values_by_attr.get(aid, []), key=number_aware_sort_key):
-            desired = dict(current_values); desired[aid] = val
-            match = find_variant_for(variants_data, desired)
-            if match:
-                items.append({
-                    "text": val,
-                    "url": match.get_absolute_url(),
-                    "active": current_values.get(aid) == val,
-                    "disabled": False,
-                })
-            else:
-                fb = first_by_attr_val[aid].get(val)
+# ---------- matrix ----------
+# Строки выбора (Размер: 2.3 / 2.4, Цвет: …) для каждого варианта товара сразу.
+# Комбинация значений -> вариант — словари по «маске» заданных атрибутов, а не
+# перебор вариантов на каждое значение; для недоступной комбинации ссылка ведёт на
+# ближайший вариант: с этим значением и наибольшим числом совпадений с текущим.
+# Матрица кэшируется по счётчику товара (versions.for_product) и версии дерева категорий.
+
+MATRIX_TTL = 24 * 3600
+
+Key = Tuple[Optional[str], ...]  # значения вариантных атрибутов варианта по порядку, None — не задано
+
+def build_matrix(product: Product) -> Dict[str, List[dict]]:
+    """{variant.id.hex: rows} по всем вариантам товара."""
+    attrs = [ca.attribute for ca in product.variant_attributes]
+    attr_ids = [a.id for a in attrs]
+    variants_data, values_by_attr, _ = build_variants_index(get_sibling_variants_qs(product.pk), attr_ids)
+    keys: List[Key] = [tuple(d["attrs"].get(aid) for aid in attr_ids) for d in variants_data]
+    urls = [d["obj"].get_absolute_url() for d in variants_data]
+    values = [sorted(values_by_attr[aid], key=number_aware_sort_key) for aid in attr_ids]
+
+    by_mask: Dict[Tuple[int, ...], Dict[Key, int]] = {}
+    def find(desired: Key) -> Optional[int]:
+        # первый вариант, у которого совпадают все заданные в desired атрибуты
+        mask = tuple(j for j, x in enumerate(desired) if x is not None)
+        index = by_mask.get(mask)
+        if index is None:
+            index = by_mask[mask] = {}
+            for n, k in enumerate(keys):
+                index.setdefault(tuple(k[j] for j in mask), n)
+        return index.get(tuple(desired[j] for j in mask))
+
+    having = [{} for _ in attr_ids]  # i -> {значение: [номера вариантов]}
+    for n, k in enumerate(keys):
+        for i, val in enumerate(k):
+            if val is not None:
+                having[i].setdefault(val, []).append(n)
+
+    def nearest(current: Key, i: int, val: str) -> int:
+        return max(having[i][val], key=lambda n: sum(
+            1 for j, x in enumerate(current) if j != i and x is not None and keys[n][j] == x))
+
+    matrix = {}
+    for d, current in zip(variants_data, keys):
+        rows = []
+        for i, a in enumerate(attrs):
+            items = []
+            for val in values[i]:
+                match = find(current[:i] + (val,) + current[i + 1:])
                 items.append({
                     "text": val,
-                    "url": fb.get_absolute_url() if fb else "#",
-                    "active": False,
-                    "disabled": True,
+                    "url": urls[match if match is not None else nearest(current, i, val)],
+                    "active": match is not None and current[i] == val,
+                    "disabled": match is None,
                 })
-        rows.append({"label": a.name, "items": items})
-    return rows
\ No newline at end of file
+            rows.append({"label": a.name, "items": items})
+        matrix[d["obj"].id.hex] = rows
+    return matrix
+
+def variant_rows(variant: Variant) -> List[dict]:
+    """Строки выбора для страницы варианта: из кэша или build_matrix по всему товару."""
+    pid = variant.product_id
+    versions = get_versions([category_tree.VERSION, for_product(pid)])
+    key = f"catalog:matrix:{versions[category_tree.VERSION]}:{versions[for_product(pid)]}:{pid}"
+    matrix = cache.get(key)
+    if matrix is None or variant.id.hex not in matrix:
+        matrix = build_matrix(variant.product)
+        cache.set(key, matrix, MATRIX_TTL)
+    return matrix.get(variant.id.hex, [])
+
+# ---------- page ----------
+
+def render_page(slug) -> dict:
+    """Всё кэшируемое о странице варианта (page_cache.detail_key): заголовки, крошка, тело."""
+    variant = get_variant_or_404(slug)
+    description = mark_safe(variant.product.description) or variant.display_name
+    return {
+        "title": str(variant.display_name),
+        "description": truncatechars(striptags(description), 155),
+        "url": variant.get_absolute_url(),
+        "crumb": str(variant),
+        "body": render_to_string("products/partials/detail_body.html",
+                                 {"variant": variant, "rows": variant_rows(variant)}),
+    }
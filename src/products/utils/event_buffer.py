@@ -0,0 +1,60 @@
+# products/utils/event_buffer.py
+"""
+Буфер событий в кэше (Redis) вместо записи в БД из запроса: push — INCR счётчика
+и SET записи под его номером; drain из периодической задачи забирает записи
+по порядку номеров пачками и отдаёт их обработчику (обычно bulk_create).
+Используется журналом поиска (search_log) и счётчиком просмотров (popularity).
+"""
+from typing import Callable, List
+
+from django.core.cache import cache
+
+ENTRY_TTL = 24 * 3600  # не перенесённое за сутки теряется
+LAG = 100              # хвост, где запись ещё может дописываться после INCR
+BATCH_SIZE = 1000
+
+
+class EventBuffer:
+    def __init__(self, name: str):
+        self.seq = f"{name}:seq"          # номер последней записи
+        self.flushed = f"{name}:flushed"  # номер последней перенесённой
+        self.lock = f"{name}:lock"
+        self.prefix = name
+
+    def entry_key(self, seq: int) -> str:
+        return f"{self.prefix}:{seq}"
+
+    def push(self, item) -> None:
+        cache.add(self.seq, 0, None)
+        seq = cache.incr(self.seq)
+        cache.set(self.entry_key(seq), item, ENTRY_TTL)
+
+    def drain(self, handle: Callable[[List], None], batch_size: int = BATCH_SIZE) -> int:
+        """Отдаёт накопленное в handle пачками; параллельный запуск просто выходит."""
+        if not cache.add(self.lock, 1, 300):
+            return 0
+        try:
+            last, done, handled = cache.get(self.seq) or 0, cache.get(self.flushed) or 0, 0
+            while done < last:
+                seqs = range(done + 1, min(last, done + batch_size) + 1)
+                found = cache.get_many([self.entry_key(i) for i in seqs])
+                items, upto = [], seqs[-1]
+                for i in seqs:
+                    item = found.get(self.entry_key(i))
+                    if item is None:
+                        if last - i < LAG:
+                            upto = i - 1  # ещё пишется — заберём следующим запуском
+                            break
+                        continue          # истекла
+                    items.append(item)
+                if items:
+                    handle(items)
+                cache.delete_many([self.entry_key(i) for i in range(done + 1, upto + 1)])
+                cache.set(self.flushed, upto, None)
+                handled += len(items)
+                if upto < seqs[-1]:
+                    break
+                done = upto
+            return handled
+        finally:
+            cache.delete(self.lock)
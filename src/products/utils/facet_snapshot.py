@@ -0,0 +1,92 @@
+# products/utils/facet_snapshot.py
+"""
+Готовые фасеты «голой» страницы категории (без фильтров и поиска): бренды, значения
+атрибутов со счётчиками, диапазоны и гистограммы — то же, что compute_facets(cat, None, …)
+по категории с подкатегориями. Самый частый вход в каталог отвечает ими без
+сгруппированных запросов.
+
+Снимок на категорию лежит в Redis вместе с версией, по которой собран: счётчик категории
+(for_category — правки вариантов её товаров, поднимается и у предков) и общий ALL (бренды,
+дерево категорий, атрибуты категорий). Версия каталога (CATALOG) снимки не сбрасывает:
+её поднимают и правки, фасетам безразличные (остатки из sync_inventory). Между правкой и
+пересборкой листинг этой категории считает фасеты сам. Пересобирает
+products.tasks.rebuild_category_facets — только категории, чья версия ушла вперёд.
+"""
+from typing import Iterable, Optional, Tuple
+
+from django.core.cache import cache
+
+from products.models import Brand, Category, Product
+from products.utils.catalog_index import index_for
+from products.utils.category_tree import get_tree
+from products.utils.facets import compute_facets
+from products.utils.list import FilterParams
+from products.utils.versions import bump_version, for_category, get_versions
+
+ALL = "facets"                  # правки, меняющие фасеты всех категорий
+BUILT = "catalog:facets:built"  # {id категории: версия её снимка}
+
+UNFILTERED = FilterParams("", 1, "pop", None, None, False, [], {})
+
+
+def _key(cat_id: int) -> str:
+    return f"catalog:facets:{cat_id}"
+
+
+def unfiltered(params: FilterParams) -> bool:
+    """Запрос без фильтров и поиска (сортировка и курсор на фасеты не влияют)."""
+    return not (params.q or params.in_stock or params.on_sale or params.brand_slugs or params.attr_params
+                or params.price_min is not None or params.price_max is not None)
+
+
+def _version(versions: dict, cat_id: int) -> Tuple[int, int]:
+    return versions[ALL], versions[for_category(cat_id)]
+
+
+def touch(category_ids: Iterable[Optional[int]]) -> None:
+    """Снимки категорий (и их предков — там фасеты с подкатегориями) устарели."""
+    tree = get_tree()
+    for cat_id in {a for c in category_ids if c for a in tree.ancestor_ids(c)}:
+        bump_version(for_category(cat_id))
+
+
+def touch_products(product_ids: Iterable) -> None:
+    touch(Product.objects.filter(id__in=set(product_ids)).values_list("category_id", flat=True))
+
+
+def touch_all() -> None:
+    bump_version(ALL)
+
+
+def get(cat: Optional[Category], br: Optional[Brand], params: FilterParams) -> Optional[dict]:
+    """Фасеты из снимка или None — считать как обычно."""
+    if cat is None or br is not None or not unfiltered(params):
+        return None
+    snapshot = cache.get(_key(cat.id))
+    if snapshot is None or snapshot[0] != _version(get_versions([ALL, for_category(cat.id)]), cat.id):
+        return None
+    return snapshot[1]
+
+
+def rebuild(force: bool = False) -> int:
+    """Пересобирает снимки категорий, чья версия сменилась (force — всех); возвращает их число."""
+    ids = list(get_tree().nodes)
+    versions = get_versions([ALL] + [for_category(i) for i in ids])
+    built = cache.get(BUILT) or {}
+    stale = [i for i in ids if force or built.get(i) != _version(versions, i)]
+    if stale:
+        index = index_for(UNFILTERED)
+        snapshots = {}
+        for cat in Category.objects.filter(id__in=stale):
+            facets = index.facets(cat, None, UNFILTERED) if index is not None else compute_facets(cat, None, UNFILTERED)
+            snapshots[_key(cat.id)] = (_version(versions, cat.id), facets)
+            built[cat.id] = _version(versions, cat.id)
+        # правка во время сборки поднимет версию — такие снимки не отдадутся, следующий запуск пересоберёт;
+        # без срока: снимок устаревает по версии, а не по времени
+        cache.set_many(snapshots, None)
+    gone = set(built) - set(ids)  # удалённые категории
+    if gone:
+        cache.delete_many([_key(i) for i in gone])
+    if stale or gone:
+        cache.set(BUILT, {i: v for i, v in built.items() if i not in gone}, None)
+    return len(stale)
@@ -0,0 +1,238 @@
+# products/utils/facets.py
+from functools import reduce
+from operator import add
+from typing import Dict, List, Optional, Tuple
+
+from dataclasses import replace
+
+from django.db.models import Case, Count, IntegerField, Min, Max, Q, QuerySet, Value, When
+from django.urls import reverse
+
+from products.models import AttributeValue, Attribute, Category, CategoryAttribute, Brand
+from products.utils import histogram
+from products.utils.category_tree import get_tree
+from products.utils.histogram import PRICE, Edges
+from products.utils.list import (
+    AttrCondition, FilterParams, attr_exists, attr_slug_map, canonical_query, compile_attr_filters,
+    faceting_base_qs, group_by_attribute,
+)
+
+TEXT_VALUES_LIMIT = 200
+BRAND = "brand"  # измерение фильтра по брендам; у атрибутов измерение — attribute_id
+
+
+def filterable_attributes(cat: Optional[Category]) -> List[Attribute]:
+    if not cat:
+        return []
+    return [ca.attribute for ca in
+            CategoryAttribute.objects.filter(category=cat, is_filterable=True)
+            .select_related("attribute").order_by("sort_order", "id")]
+
+
+def filter_slug_map(cat: Optional[Category], attrs: List[Attribute], params: FilterParams) -> Dict[str, Attribute]:
+    """То же, что attr_slug_map, но без лишнего запроса, когда атрибуты категории уже прочитаны."""
+    if cat:
+        return {a.slug: a for a in attrs}
+    return attr_slug_map(None) if params.attr_params else {}
+
+
+class Signature:
+    """
+    Какие из выбранных фильтров строка НЕ проходит — битовая маска в одном столбце
+    сгруппированного запроса. Бит 0 — неактивный вариант (не считается никогда),
+    дальше по биту на диапазон цен, на бренды и на каждый фильтруемый атрибут (EXISTS, как в
+    apply_attr_filters). Счётчик значения в измерении D — сумма строк без битов, кроме бита D
+    («исключить своё измерение»: выбранный Shimano не обнуляет Maxxis).
+    Цена — фильтр базы фасетов (in_base), битом она только ради своей гистограммы.
+    """
+
+    def __init__(self, params: FilterParams, by_slug: Dict[str, Attribute], br: Optional[Brand] = None):
+        self.brand_slugs = [] if br else params.brand_slugs  # на странице бренда ?brands= не действует
+        self.price_min, self.price_max = params.price_min, params.price_max
+        self.dims: Dict[object, int] = {}
+        self.groups: List[Tuple[List[AttrCondition], int]] = []
+        bit = 2
+        if self.price_min is not None or self.price_max is not None:
+            self.dims[PRICE] = bit
+            bit <<= 1
+        if self.brand_slugs:
+            self.dims[BRAND] = bit
+            bit <<= 1
+        for attr_id, conds in group_by_attribute(compile_attr_filters(params, by_slug)).items():
+            self.groups.append((conds, bit))
+            self.dims[attr_id] = bit
+            bit <<= 1
+
+    def expression(self, prefix: str = ""):
+        """prefix "" — строки Variant, "variant__" — строки AttributeValue."""
+        parts = [Case(When(Q(**{f"{prefix}is_active": True}), then=Value(0)), default=Value(1))]
+        if PRICE in self.dims:
+            bounds = {f"{prefix}price__gte": self.price_min, f"{prefix}price__lte": self.price_max}
+            parts.append(Case(When(Q(**{k: v for k, v in bounds.items() if v is not None}), then=Value(0)),
+                              default=Value(self.dims[PRICE])))
+        if self.brand_slugs:
+            parts.append(Case(When(Q(**{f"{prefix}product__brand__slug__in": self.brand_slugs}), then=Value(0)),
+                              default=Value(self.dims[BRAND])))
+        for conds, bit in self.groups:
+            passed = attr_exists(conds, "variant_id" if prefix else "pk")
+            parts.append(Case(When(passed, then=Value(0)), default=Value(bit)))
+        return reduce(add, parts)
+
+    def counts(self, sig: int, dim) -> bool:
+        """Учитывать ли строку с маской sig в счётчиках измерения dim."""
+        return sig & ~self.dims.get(dim, 0) == 0
+
+    def in_base(self, sig: int) -> bool:
+        """Строка в базе фасетов (списки значений, диапазоны): проходит фильтр цены."""
+        return sig & self.dims.get(PRICE, 0) == 0
+
+
+def brand_price_facets(fb: QuerySet, sig: Signature,
+                       edges: List = ()) -> Tuple[List[dict], Dict[str, Optional[float]], Optional[List[dict]]]:
+    """
+    Бренды (со счётчиками), диапазон цен и гистограмма цен одним GROUP BY по (бренд, маска, корзина).
+    fb — без фильтра цены: он в маске, гистограмма его не учитывает.
+    """
+    rows = list(
+        fb.annotate(sig=sig.expression(), bucket=histogram.bucket_expression("price", edges))
+          .values("product__brand__slug", "product__brand__title", "sig", "bucket")
+          .annotate(min=Min("price"), max=Max("price"), n=Count("id"))
+          .order_by("product__brand__title", "product__brand__slug")
+    )
+    hist = [0] * max(len(edges) - 1, 0)
+    for r in rows:
+        if hist and sig.counts(r["sig"], PRICE):
+            hist[r["bucket"]] += r["n"]
+    rows = [r for r in rows if sig.in_base(r["sig"])]
+    mins = [r["min"] for r in rows if r["min"] is not None]
+    maxs = [r["max"] for r in rows if r["max"] is not None]
+    price = {"min": min(mins) if mins else None, "max": max(maxs) if maxs else None}
+    brands: Dict[str, dict] = {}
+    for r in rows:
+        if r["product__brand__slug"] is None:
+            continue
+        b = brands.setdefault(r["product__brand__slug"], {
+            "product__brand__slug": r["product__brand__slug"],
+            "product__brand__title": r["product__brand__title"],
+            "count": 0,
+        })
+        if sig.counts(r["sig"], BRAND):
+            b["count"] += r["n"]
+    return list(brands.values()), price, histogram.bars(edges, hist)
+
+
+def attribute_facets(attrs: List[Attribute], fb: QuerySet, sig: Signature, edges: Edges = None) -> List[dict]:
+    """
+    Все атрибуты одним GROUP BY (attribute_id, value_text, value_bool, маска, корзина):
+    у текстовых — строка на значение, у числовых value_text пуст и min/max по value_number,
+    у булевых — строка на Да/Нет. Диапазоны и списки значений — по всей базе фасетов,
+    счётчики (counts, гистограммы числовых по границам edges) — с учётом остальных фильтров.
+    """
+    edges = {a.id: edges.get(a.id, []) for a in histogram.number_attributes(attrs)} if edges else {}
+    values: Dict[int, List[str]] = {a.id: [] for a in attrs}
+    counts: Dict[int, Dict[str, int]] = {a.id: {} for a in attrs}
+    ranges: Dict[int, dict] = {}
+    hists: Dict[int, List[int]] = {aid: [0] * max(len(e) - 1, 0) for aid, e in edges.items()}
+    if attrs:
+        bucket = Case(*[When(attribute_id=aid, then=histogram.bucket_expression("value_number", e))
+                        for aid, e in edges.items() if len(e) > 2],
+                      default=Value(None), output_field=IntegerField())
+        rows = (
+            AttributeValue.objects
+            .filter(attribute_id__in=[a.id for a in attrs], variant__in=fb.values("id"))
+            .annotate(sig=sig.expression("variant__"), bucket=bucket)
+            .values("attribute_id", "value_text", "value_bool", "sig", "bucket")
+            .annotate(min=Min("value_number"), max=Max("value_number"), n=Count("id"))
+            .order_by("attribute_id", "value_text")
+        )
+        for r in rows:
+            aid = r["attribute_id"]
+            if r["bucket"] is not None and sig.counts(r["sig"], aid):
+                hists[aid][r["bucket"]] += r["n"]
+            if not sig.in_base(r["sig"]):
+                continue
+            key = r["value_text"] or ("" if r["value_bool"] is None else ("1" if r["value_bool"] else "0"))
+            if key:
+                if r["value_text"] and key not in counts[aid]:
+                    values[aid].append(key)
+                counts[aid].setdefault(key, 0)
+                if sig.counts(r["sig"], aid):
+                    counts[aid][key] += r["n"]
+            rng = ranges.setdefault(aid, {"min": None, "max": None})
+            if r["min"] is not None and (rng["min"] is None or r["min"] < rng["min"]):
+                rng["min"] = r["min"]
+            if r["max"] is not None and (rng["max"] is None or r["max"] > rng["max"]):
+                rng["max"] = r["max"]
+
+    items = []
+    for a in attrs:
+        item = {"attribute": a, "values": None, "range": None, "counts": None, "histogram": None}
+        if a.value_type == Attribute.TEXT:
+            item["values"] = values[a.id][:TEXT_VALUES_LIMIT]
+            item["counts"] = counts[a.id]
+        elif a.value_type == Attribute.BOOL:
+            item["values"] = [{"label": "Да", "value": "1"}, {"label": "Нет", "value": "0"}]
+            item["counts"] = {"1": counts[a.id].get("1", 0), "0": counts[a.id].get("0", 0)}
+        else:
+            item["range"] = ranges.get(a.id, {"min": None, "max": None})
+            item["histogram"] = histogram.bars(edges.get(a.id, []), hists.get(a.id, ()))
+        items.append(item)
+    return items
+
+
+def category_counts(fb: QuerySet, sig: Signature) -> Dict[int, int]:
+    """Найденные варианты (активные, прошли все фильтры) по категориям — один GROUP BY."""
+    rows = (fb.annotate(sig=sig.expression()).filter(sig=0)
+            .values("product__category_id").annotate(n=Count("id")).order_by())
+    return {r["product__category_id"]: r["n"] for r in rows if r["product__category_id"] is not None}
+
+
+def category_facet(counts: Dict[int, int], br: Optional[Brand], params: FilterParams) -> List[dict]:
+    """
+    Фасет-дерево категорий для страниц бренда и поиска: counts (категория -> вариантов
+    в ней самой) сводятся вверх по дереву из get_tree(), пустые ветки не показываются.
+    Порядок — обход дерева, соседи по названию; depth — уровень вложенности.
+    Ссылка — страница категории с тем же запросом, брендом и фильтрами (кроме атрибутов:
+    они у каждой категории свои).
+    """
+    tree = get_tree()
+    total: Dict[int, int] = {}
+    for cat_id, n in counts.items():
+        for i in tree.ancestor_ids(cat_id):
+            total[i] = total.get(i, 0) + n
+    query = canonical_query(replace(params, brand_slugs=[br.slug] if br else params.brand_slugs, attr_params={}))
+
+    def title(i: int) -> str:
+        return tree.nodes[i].title_plural or tree.nodes[i].title
+
+    items = []
+    stack = [(i, 0) for i in sorted((i for i in tree.children.get(None, ()) if i in total), key=title, reverse=True)]
+    while stack:
+        i, depth = stack.pop()
+        url = reverse("products:category", kwargs={"category_path": tree.path(i)})
+        items.append({"id": i, "title": title(i), "depth": depth, "count": total[i],
+                      "url": f"{url}?{query}" if query else url})
+        kids = sorted((c for c in tree.children.get(i, ()) if c in total), key=title, reverse=True)
+        stack.extend((c, depth + 1) for c in kids)
+    return items
+
+
+def compute_facets(cat: Optional[Category], br: Optional[Brand], params: FilterParams) -> dict:
+    """
+    Фасеты листинга в той же структуре, что прежние запросы по атрибуту (legacy_facets в scripts/bench_facets.py)
+    (плюс счётчики: brand["count"], item["counts"], гистограммы price_histogram / item["histogram"]),
+    но за 2 сгруппированных запроса (+ список фильтруемых атрибутов и границы гистограмм
+    из кэша) вместо 2 + N. Без категории (бренд, поиск) — ещё один на фасет-дерево категорий.
+    """
+    fb = faceting_base_qs(cat, br, replace(params, price_min=None, price_max=None))
+    attrs = filterable_attributes(cat)
+    sig = Signature(params, filter_slug_map(cat, attrs, params), br)
+    edges = histogram.cached_edges(cat, br, lambda: histogram.sql_edges(cat, br, attrs))
+    brands, price, price_histogram = brand_price_facets(fb, sig, edges[PRICE])
+    return {
+        "price_range": price,
+        "price_histogram": price_histogram,
+        "brand_facet": brands,
+        "attr_facets": attribute_facets(attrs, fb, sig, edges),
+        "category_facet": category_facet(category_counts(fb, sig), br, params) if cat is None else [],
+    }
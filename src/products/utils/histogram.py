@@ -0,0 +1,160 @@
+# products/utils/histogram.py
+"""
+Гистограммы для фильтров цены и числовых атрибутов.
+
+Границы корзин зависят только от области листинга (категория с подкатегориями и бренд
+из пути) и считаются по её активным вариантам: квантили (QUANTILES, по умолчанию — одна
+рама за 300 000 не сжимает остальные цены в первую корзину) или равные интервалы
+от min до max. Границы кэшируются по версии каталога. Счётчики корзин — по текущим
+фильтрам, кроме фильтра своего измерения, как у остальных фасетов: в SQL это
+width_bucket в тех же сгруппированных запросах (products.utils.facets), в индексе
+каталога — np.searchsorted по колонке.
+
+Границы — список [e0, e1, …, ek]: корзина i — [e(i), e(i+1)), последняя включает ek (максимум).
+"""
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.db.models import (
+    Aggregate, Case, DecimalField, F, Func, IntegerField, Max, Min, QuerySet, Value, When,
+)
+
+from products.models import Attribute, AttributeValue, Brand, Category, Variant
+from products.utils.list import effective_category_ids
+from products.utils.search import is_postgres
+from products.utils.versions import CATALOG, get_version
+
+BUCKETS = 20
+QUANTILES = True
+TTL = 3600
+PRICE = "price"
+PRICE_SCALE = 2    # знаков после запятой: цена в копейках
+NUMBER_SCALE = 3   # value_number — в тысячных, как в индексе каталога
+
+Edges = Dict[object, List[Decimal]]  # PRICE / attribute_id -> границы
+
+
+def _numbers() -> ArrayField:
+    return ArrayField(DecimalField(max_digits=15, decimal_places=NUMBER_SCALE))
+
+
+def _fractions() -> List[float]:
+    return [i / BUCKETS for i in range(BUCKETS)]
+
+
+def _finish(lower, hi: int, scale: int) -> List[Decimal]:
+    lower = sorted({int(x) for x in lower})
+    return [Decimal(x).scaleb(-scale) for x in lower + [int(hi)]]
+
+
+def edges_of(values: np.ndarray, scale: int) -> List[Decimal]:
+    """Границы по целым значениям (копейки/тысячные) в любом порядке."""
+    if not len(values):
+        return []
+    values = np.sort(values)
+    lo, hi = int(values[0]), int(values[-1])
+    if QUANTILES:
+        # как percentile_disc: первое значение, чья позиция не меньше доли
+        idx = np.maximum(np.ceil(np.array(_fractions()) * len(values)).astype(np.int64) - 1, 0)
+        return _finish(values[idx], hi, scale)
+    return _finish((lo + (hi - lo) * i // BUCKETS for i in range(BUCKETS)), hi, scale)
+
+
+def _scaled(value: Decimal, scale: int) -> int:
+    return int(value.scaleb(scale))
+
+
+class _Quantiles(Aggregate):
+    function = "percentile_disc"
+    template = "%(function)s(ARRAY[%(fractions)s]::float8[]) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+
+def _quantiles(field: str) -> _Quantiles:
+    return _Quantiles(field, fractions=",".join(repr(f) for f in _fractions()),
+                      output_field=_numbers())
+
+
+def _edges_by(qs: QuerySet, field: str, scale: int, by: Optional[str] = None) -> Dict[object, List[Decimal]]:
+    """Границы по значениям field в qs — одним запросом; by — поле группировки (None — одна группа)."""
+    if QUANTILES and not is_postgres():
+        # sqlite/dev: все значения в память
+        groups: Dict[object, list] = {}
+        for key, value in qs.values_list(by or "pk", field):
+            groups.setdefault(key if by else None, []).append(_scaled(value, scale))
+        return {key: edges_of(np.array(values, dtype=np.int64), scale) for key, values in groups.items()}
+    bounds = {"q": _quantiles(field)} if QUANTILES else {"lo": Min(field)}
+    rows = (qs.values(by).annotate(hi=Max(field), **bounds).order_by() if by
+            else [qs.aggregate(hi=Max(field), **bounds)])
+    edges = {}
+    for r in rows:
+        if r["hi"] is None:
+            continue
+        lower = r["q"] if QUANTILES else [r["lo"]]
+        values = np.array([_scaled(v, scale) for v in lower] + [_scaled(r["hi"], scale)], dtype=np.int64)
+        edges[r[by] if by else None] = (_finish(values[:-1], values[-1], scale) if QUANTILES
+                                        else edges_of(values, scale))
+    return edges
+
+
+def number_attributes(attrs: List[Attribute]) -> List[Attribute]:
+    return [a for a in attrs if a.value_type == Attribute.NUMBER]
+
+
+def sql_edges(cat: Optional[Category], br: Optional[Brand], attrs: List[Attribute]) -> Edges:
+    scope = Variant.objects.filter(is_active=True)
+    cat_ids = effective_category_ids(cat)
+    if cat_ids:
+        scope = scope.filter(product__category_id__in=cat_ids)
+    if br:
+        scope = scope.filter(product__brand=br)
+    edges: Edges = {PRICE: _edges_by(scope, "price", PRICE_SCALE).get(None, [])}
+    numbers = number_attributes(attrs)
+    if numbers:
+        values = AttributeValue.objects.filter(attribute_id__in=[a.id for a in numbers], variant__in=scope,
+                                               value_number__isnull=False)
+        found = _edges_by(values, "value_number", NUMBER_SCALE, by="attribute_id")
+        edges.update((a.id, found.get(a.id, [])) for a in numbers)
+    return edges
+
+
+def cached_edges(cat: Optional[Category], br: Optional[Brand], compute: Callable[[], Edges]) -> Edges:
+    key = (f"catalog:hist:{get_version(CATALOG)}:{cat.id if cat else 0}:{br.id if br else 0}"
+           f":{BUCKETS}:{int(QUANTILES)}")
+    edges = cache.get(key)
+    if edges is None:
+        edges = compute()
+        cache.set(key, edges, TTL)
+    return edges
+
+
+def bucket_expression(field: str, edges: List[Decimal]):
+    """Номер корзины значения field (0…k-1) — как np.searchsorted(порогов, side="right")."""
+    thresholds = edges[1:-1]
+    if not thresholds:
+        return Value(0)
+    if is_postgres():
+        return Func(F(field), Value(thresholds, output_field=_numbers()),
+                    function="width_bucket", output_field=IntegerField())
+    return Case(*[When(**{f"{field}__lt": t}, then=Value(i)) for i, t in enumerate(thresholds)],
+                default=Value(len(thresholds)), output_field=IntegerField())
+
+
+def buckets_of(values: np.ndarray, edges: List[Decimal], scale: int) -> np.ndarray:
+    """Счётчики корзин по целым значениям (индекс каталога)."""
+    if not edges:
+        return np.zeros(0, dtype=np.int64)
+    thresholds = np.array([_scaled(e, scale) for e in edges[1:-1]], dtype=np.int64)
+    return np.bincount(np.searchsorted(thresholds, values, side="right"), minlength=len(edges) - 1)
+
+
+def bars(edges: List[Decimal], counts) -> Optional[List[dict]]:
+    """Корзины для шаблона: границы, счётчик и высота столбика в % от самого высокого; одна корзина — None."""
+    if len(edges) < 3:
+        return None
+    counts = [int(c) for c in counts]
+    top = max(counts) or 1
+    return [{"min": edges[i], "max": edges[i + 1], "count": n, "height": round(100 * n / top)}
+            for i, n in enumerate(counts)]
@@ -1,72 +1,35 @@
 # views/products.py
+import hashlib
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
 
-from django.core.paginator import Paginator
-from django.db.models import Q, Case, When, IntegerField, Exists, OuterRef, Value, Prefetch, Min, Max, QuerySet
-from django.db.models.functions import Cast
-from django.db.models import CharField
+from django.db.models import Count, Exists, F, OuterRef, Min, Max, QuerySet, Subquery, Window
+from django.db.models.functions import RowNumber
 
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 
 from products.models import (
-    Variant, AttributeValue, CategoryAttribute,
-    Category, Brand, Attribute
+    Variant, AttributeValue,
+    Category, Brand, Attribute, has_stock_expression,
 )
+from products.utils.category_tree import get_tree
+from products.utils.search import filter_search
 
 SORT_MAP = {
-    'pop':  ['-has_stock', '-id'],
+    'pop':  ['-has_stock', '-popularity', '-id'],
     'price_asc':  ['-has_stock', 'price', '-id'],
     'price_desc': ['-has_stock', '-price', '-id'],
     'newest':     ['-has_stock', '-created', '-id'],
+    'discount':   ['-has_stock', '-discount', '-id'],
 }
 
 
 def apply_text_search(qs, q: str):
-    tokens = [t for t in (q or "").split() if t]
-    if not tokens:
-        return qs
-
-    def attr_exists(tok: str):
-        sub = (AttributeValue.objects
-               .filter(variant_id=OuterRef('pk'))
-               .annotate(vn_str=Cast('value_number', output_field=CharField()))
-               .filter(Q(value_text__icontains=tok) | Q(vn_str__icontains=tok)))
-        return Exists(sub)
-
-    for tok in tokens:
-        qs = qs.filter(
-            Q(product__base_name__icontains=tok) |
-            Q(product__brand__title__icontains=tok) |
-            Q(product__category__title_plural__icontains=tok) |
-            Q(product__category__title_singular__icontains=tok) |
-            attr_exists(tok) |
-            Q(slug__icontains=tok) |
-            Q(wb_article__icontains=tok) |
-            Q(ozon_article__icontains=tok)
-        )
-
-    rank = (
-        Case(
-            When(product__base_name__istartswith=tokens[0], then=Value(4)),
-            default=Value(0), output_field=IntegerField()
-        )
-        + Case(
-            When(product__brand__title__istartswith=tokens[0], then=Value(3)),
-            default=Value(0), output_field=IntegerField()
-        )
-        + Case(
-            When(product__base_name__icontains=" ".join(tokens), then=Value(2)),
-            default=Value(0), output_field=IntegerField()
-        )
-        + Case(
-            When(product__brand__title__icontains=" ".join(tokens), then=Value(1)),
-            default=Value(0), output_field=IntegerField()
-        )
-    )
-
-    return qs.annotate(search_rank=rank).order_by('-search_rank')
+    # полнотекстовый поиск по денормализованному документу VariantSearch (tsvector + GIN);
+    # аннотирует search_rank (ts_rank), по которому сортирует order_qs
+    return filter_search(qs, q)
 
 def _parse_decimal(s: Optional[str]):
     try:
@@ -86,10 +49,15 @@ class FilterParams:
     in_stock: bool
     brand_slugs: List[str]
     attr_params: Dict[str, str]
+    group: bool = False  # ?group=product: карточка на товар, а не на вариант
+    on_sale: bool = False  # только со скидкой (Variant.discount > 0)
 
 def parse_params(request) -> FilterParams:
     q = (request.GET.get("q") or "").strip()
-    page = int(request.GET.get("page", 1))
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
     sort = request.GET.get("sort") or "pop"
     price_min = _parse_decimal(request.GET.get("price_min"))
     price_max = _parse_decimal(request.GET.get("price_max"))
@@ -97,19 +65,17 @@ def parse_params(request) -> FilterParams:
     brands_raw = (request.GET.get("brands") or "").strip()
     brand_slugs = [s for s in brands_raw.split(",") if s] if brands_raw else []
     attr_params = {k: v for k, v in request.GET.items() if k.startswith("a_")}
-    return FilterParams(q, page, sort, price_min, price_max, in_stock, brand_slugs, attr_params)
+    group = request.GET.get("group") == "product"
+    on_sale = request.GET.get("on_sale") == "1"
+    return FilterParams(q, page, sort, price_min, price_max, in_stock, brand_slugs, attr_params, group, on_sale)
 
 def get_cat_brand_by_path(category_path: Optional[str], brand_slug: Optional[str]) -> Tuple[Optional[Category], Optional[Brand]]:
     cat = None
     if category_path:
-        parts = category_path.strip("/").split("/")
-        parent = None
-        for slug in parts:
-            try:
-                parent = Category.objects.get(parent=parent, slug=slug)
-            except Category.DoesNotExist:
-                raise Http404("Категория не найдена")
-        cat = parent
+        cat_id = get_tree().resolve(category_path)
+        cat = Category.objects.filter(pk=cat_id).first() if cat_id else None
+        if cat is None:
+            raise Http404("Категория не найдена")
     br = get_object_or_404(Brand, slug=brand_slug) if brand_slug else None
     return cat, br
 
@@ -117,25 +83,9 @@ def base_qs() -> QuerySet:
     return (
         Variant.objects
         .filter(is_active=True)
-        .select_related("product", "product__brand", "product__category")
-        .prefetch_related(
-            "images",
-            Prefetch(
-                "attribute_values",
-                queryset=AttributeValue.objects.select_related("attribute")
-            ),
-            Prefetch(
-                "product__category__category_attributes",
-                queryset=CategoryAttribute.objects.select_related("attribute").order_by("sort_order", "id")
-            ),
-        )
-        .annotate(
-            has_stock=Case(
-                When(Q(inventory__gt=0), then=Value(1)),
-                default=Value(0),
-                output_field=IntegerField(),
-            )
-        )
+        # всё для card.html — в VariantCard, страница листинга читается одним запросом
+        .select_related("card", "product", "product__brand", "product__category")
+        .annotate(has_stock=has_stock_expression())
     )
 
 def apply_scope(qs: QuerySet, cat: Optional[Category], br: Optional[Brand], params: FilterParams) -> QuerySet:
@@ -148,6 +98,8 @@ def apply_scope(qs: QuerySet, cat: Optional[Category], br: Optional[Brand], para
         qs = apply_text_search(qs, params.q)
     if params.in_stock:
         qs = qs.filter(has_stock=1)
+    if params.on_sale:
+        qs = qs.filter(discount__gt=0)
     if params.price_min is not None:
         qs = qs.filter(price__gte=params.price_min)
     if params.price_max is not None:
@@ -163,52 +115,104 @@ def attr_slug_map(cat: Optional[Category]) -> Dict[str, Attribute]:
     attrs = Attribute.objects.all()
     return {a.slug: a for a in attrs}
 
-def apply_attr_filters(qs: QuerySet, params: FilterParams, by_slug: Dict[str, Attribute]) -> QuerySet:
+class AttrCondition(NamedTuple):
+    """Одно условие по атрибуту: op — "in" (text), "eq", "gte", "lte"."""
+    attribute: Attribute
+    op: str
+    value: object
+
+
+def compile_attr_filters(params: FilterParams, by_slug: Dict[str, Attribute]) -> List[AttrCondition]:
+    """Разбор a_* параметров в условия; неизвестные слаги и кривые значения молча пропускаются."""
+    conds = []
     for key, val in params.attr_params.items():
         if not key.startswith("a_"):
             continue
         body = key[2:]
         if body.endswith("_min") or body.endswith("_max"):
-            slug = body[:-4]
-            a = by_slug.get(slug)
+            a = by_slug.get(body[:-4])
             if not a or a.value_type != Attribute.NUMBER:
                 continue
             num = _parse_decimal(val)
             if num is None:
                 continue
-            if body.endswith("_min"):
-                qs = qs.filter(attribute_values__attribute__slug=slug,
-                               attribute_values__value_number__gte=num)
-            else:
-                qs = qs.filter(attribute_values__attribute__slug=slug,
-                               attribute_values__value_number__lte=num)
+            conds.append(AttrCondition(a, "gte" if body.endswith("_min") else "lte", num))
         else:
-            slug = body
-            a = by_slug.get(slug)
+            a = by_slug.get(body)
             if not a:
                 continue
             if a.value_type == Attribute.TEXT:
                 values = [s for s in val.split(",") if s]
                 if values:
-                    qs = qs.filter(attribute_values__attribute__slug=slug,
-                                   attribute_values__value_text__in=values)
+                    conds.append(AttrCondition(a, "in", values))
             elif a.value_type == Attribute.BOOL:
                 if val in ("0", "1"):
-                    qs = qs.filter(attribute_values__attribute__slug=slug,
-                                   attribute_values__value_bool=(val == "1"))
+                    conds.append(AttrCondition(a, "eq", val == "1"))
             elif a.value_type == Attribute.NUMBER:
                 num = _parse_decimal(val)
                 if num is not None:
-                    qs = qs.filter(attribute_values__attribute__slug=slug,
-                                   attribute_values__value_number=num)
+                    conds.append(AttrCondition(a, "eq", num))
+    return conds
+
+_VALUE_FIELD = {Attribute.TEXT: "value_text", Attribute.NUMBER: "value_number", Attribute.BOOL: "value_bool"}
+_LOOKUP = {"in": "__in", "eq": "", "gte": "__gte", "lte": "__lte"}
+
+def attr_lookup(a: Attribute, op: str) -> str:
+    """Поле AttributeValue для условия: value_text__in, value_number__gte, value_bool…"""
+    return f"{_VALUE_FIELD[a.value_type]}{_LOOKUP[op]}"
+
+def group_by_attribute(conds: List[AttrCondition]) -> Dict[int, List[AttrCondition]]:
+    """Условия по attribute_id: a_size_min и a_size_max одного атрибута — одна группа."""
+    groups: Dict[int, List[AttrCondition]] = {}
+    for cond in conds:
+        groups.setdefault(cond.attribute.id, []).append(cond)
+    return groups
+
+def attr_exists(conds: List[AttrCondition], ref: str = "pk") -> Exists:
+    """
+    EXISTS по значениям одного атрибута варианта OuterRef(ref): все условия группы —
+    на одной строке AttributeValue (индексы (attribute, value_text|value_number, variant)).
+    """
+    lookups = {attr_lookup(a, op): value for a, op, value in conds}
+    return Exists(AttributeValue.objects.filter(
+        variant_id=OuterRef(ref), attribute_id=conds[0].attribute.id, **lookups,
+    ))
+
+def apply_attr_filters(qs: QuerySet, params: FilterParams, by_slug: Dict[str, Attribute]) -> QuerySet:
+    """По EXISTS на атрибут вместо JOIN на каждый параметр: строки не размножаются, DISTINCT не нужен."""
+    for conds in group_by_attribute(compile_attr_filters(params, by_slug)).values():
+        qs = qs.filter(attr_exists(conds))
     return qs
 
-def order_qs(qs: QuerySet, sort: str) -> QuerySet:
+def ordering_for(sort: str, ranked: bool = False) -> List[str]:
     order_by = SORT_MAP.get(sort, SORT_MAP["pop"])
-    return qs.order_by(*order_by).distinct()
+    if ranked and order_by is SORT_MAP["pop"]:
+        # поиск: по умолчанию сортируем по релевантности (ts_rank)
+        order_by = ["-has_stock", "-search_rank", "-id"]
+    return order_by
 
-def paginate_qs(qs: QuerySet, page: int, per_page: int = 24):
-    return Paginator(qs, per_page).get_page(page)
+def order_qs(qs: QuerySet, sort: str, ranked: bool = False) -> QuerySet:
+    # все фильтры листинга — по FK/one-to-one или EXISTS, дублей строк нет
+    return qs.order_by(*ordering_for(sort, ranked))
+
+def group_by_product(qs: QuerySet, sort: str, ranked: bool = False) -> QuerySet:
+    """
+    Режим ?group=product: из отфильтрованных вариантов qs — по одному на товар, первый
+    в порядке сортировки (ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY …)), плюс
+    по прошедшим фильтры вариантам товара min_price, max_price и variant_count.
+    Наличие — has_stock представителя (все сортировки начинаются с -has_stock).
+    Представители — строки Variant со своими ключами сортировки, так что order_qs и
+    keyset-курсор работают поверх как обычно; фильтры остаются на уровне вариантов.
+    """
+    order = [F(f[1:]).desc() if f.startswith("-") else F(f).asc() for f in ordering_for(sort, ranked)]
+    firsts = (qs.annotate(product_rank=Window(RowNumber(), partition_by=F("product_id"), order_by=order))
+              .filter(product_rank=1).values("id"))
+    siblings = qs.filter(product_id=OuterRef("product_id")).order_by().values("product_id")
+    return qs.filter(id__in=firsts).annotate(
+        min_price=Subquery(siblings.annotate(v=Min("price")).values("v")),
+        max_price=Subquery(siblings.annotate(v=Max("price")).values("v")),
+        variant_count=Subquery(siblings.annotate(v=Count("id")).values("v")),
+    )
 
 # ---------- фасеты ----------
 
@@ -217,14 +221,13 @@ def _params_without_brands(p: FilterParams) -> FilterParams:
         q=p.q, page=p.page, sort=p.sort,
         price_min=p.price_min, price_max=p.price_max,
         in_stock=p.in_stock, brand_slugs=[],  # ключевая строка
-        attr_params=p.attr_params
+        attr_params=p.attr_params, group=p.group, on_sale=p.on_sale,
     )
 
 def faceting_base_qs(cat, br, params):
     qs = (Variant.objects
           .select_related("product", "product__brand", "product__category")
-          .annotate(has_stock=Case(When(Q(inventory__gt=0), then=Value(1)),
-                                   default=Value(0), output_field=IntegerField())))
+          .annotate(has_stock=has_stock_expression()))
     cat_ids = effective_category_ids(cat)
     if cat_ids:
         qs = qs.filter(product__category_id__in=cat_ids)
@@ -232,74 +235,64 @@ def faceting_base_qs(cat, br, params):
     # важно: убираем бренды из GET-параметров, но сохраняем br из пути
     return apply_scope(qs, None, br, _params_without_brands(params))
 
-def price_range_facet(qs: QuerySet) -> Dict[str, Optional[float]]:
-    return qs.aggregate(min=Min("price"), max=Max("price"))
-
-def brand_facet(qs: QuerySet) -> List[Dict[str, str]]:
-    return list(
-        qs.values("product__brand__slug", "product__brand__title")
-          .exclude(product__brand__slug__isnull=True)
-          .distinct()
-          .order_by("product__brand__title")
-    )
-
-def attr_facets(cat: Optional[Category], base_for_facets: QuerySet) -> List[dict]:
-    if not cat:
-        return []
-    items = []
-    for ca in cat.category_attributes.select_related("attribute").filter(is_filterable=True):
-        a = ca.attribute
-        item = {"attribute": a, "values": None, "range": None}
-        if a.value_type == Attribute.TEXT:
-            vals = (
-                AttributeValue.objects
-                .filter(attribute=a, variant__in=base_for_facets)
-                .exclude(value_text="")
-                .values_list("value_text", flat=True)
-                .distinct().order_by("value_text")[:200]
-            )
-            
-            item["values"] = list(vals)
-        elif a.value_type == Attribute.BOOL:
-            item["values"] = [{"label": "Да", "value": "1"}, {"label": "Нет", "value": "0"}]
-        else:
-            rng = (
-                AttributeValue.objects
-                .filter(attribute=a, variant__in=base_for_facets)
-                .aggregate(min=Min("value_number"), max=Max("value_number"))
-            )
-            item["range"] = rng
-        items.append(item)
-    return items
-
 def selected_dict(request, params: FilterParams) -> dict:
     return {
         "q": params.q,
         "sort": params.sort,
         "in_stock": params.in_stock,
-        "price_min": request.GET.get("price_min") or "",
-        "price_max": request.GET.get("price_max") or "",
-        "brands": params.brand_slugs,
+        "on_sale": params.on_sale,
+        "price_min": _num_str(params.price_min),
+        "price_max": _num_str(params.price_max),
+        "brands": sorted(params.brand_slugs),  # тело кэшируется по canonical_query — порядок как там
         "attrs": params.attr_params,
+        "group": params.group,
     }
 
+def _num_str(value: Optional[float]) -> str:
+    return "" if value is None else f"{value:.6f}".rstrip("0").rstrip(".")
+
+def canonical_query(params: FilterParams) -> str:
+    """
+    Query string фильтров, собранный из FilterParams (без page/cursor): бренды и
+    значения атрибутов отсортированы, пустое и лишнее отброшено.
+    """
+    items = []
+    if params.q:
+        items.append(("q", params.q))
+    if params.sort != "pop":
+        items.append(("sort", params.sort))
+    if params.price_min is not None:
+        items.append(("price_min", _num_str(params.price_min)))
+    if params.price_max is not None:
+        items.append(("price_max", _num_str(params.price_max)))
+    if params.in_stock:
+        items.append(("in_stock", "1"))
+    if params.on_sale:
+        items.append(("on_sale", "1"))
+    if params.brand_slugs:
+        items.append(("brands", ",".join(sorted(params.brand_slugs))))
+    for key in sorted(params.attr_params):
+        value = ",".join(sorted(s for s in params.attr_params[key].split(",") if s))
+        if value:
+            items.append((key, value))
+    if params.group:
+        items.append(("group", "product"))
+    return urlencode(items)
+
 def qs_without_page(request) -> str:
     qs_params = request.GET.copy()
     qs_params.pop("page", None)
+    qs_params.pop("cursor", None)
     return qs_params.urlencode()
 
+def listing_cache_key(request, prefix: str, ignore=("page", "cursor"), path: Optional[str] = None) -> str:
+    """Ключ кэша по пути (по умолчанию request.path) и нормализованным (отсортированным) GET-параметрам."""
+    items = sorted((k, v) for k, vs in request.GET.lists() if k not in ignore for v in vs)
+    raw = (path or request.path) + "?" + urlencode(items)
+    return f"{prefix}:{hashlib.md5(raw.encode()).hexdigest()}"
+
 
 def effective_category_ids(cat, include_self=True):
     if not cat:
         return None
-    ids = [cat.id] if include_self else []
-    frontier = [cat.id]
-    while frontier:
-        children = list(
-            Category.objects.filter(parent_id__in=frontier).values_list("id", flat=True)
-        )
-        if not children:
-            break
-        ids.extend(children)
-        frontier = children
-    return ids
\ No newline at end of file
+    return get_tree().descendant_ids(cat.id, include_self)
@@ -0,0 +1,70 @@
+# products/utils/page_cache.py
+"""
+Кэш тела страницы листинга (products/partials/list_body.html: фильтры, сетка, пагинация).
+
+Ключ — версия каталога + путь + canonical_query(FilterParams) (бренды и значения
+атрибутов отсортированы) + курсор, так что ?brands=a,b и ?brands=b,a попадают
+в одну запись, а ссылки внутри тела строятся из того же canonical_query. Версию "catalog" поднимают products.signals и sync_inventory;
+старые записи просто дожидаются TTL. Страницы с сортировкой по популярности — ещё и по версии
+"popularity" (ежечасный пересчёт не сбрасывает остальные).
+
+В теле нет ничего персонального (шапка, корзина, пользователь — в core/base.html
+вокруг него), поэтому кэш общий для гостей и залогиненных.
+
+Так же кэшируется страница варианта (products/partials/detail_body.html и заголовки):
+ключ detail_key — slug, счётчик товара (versions.for_product: правки варианта, соседей,
+значений, фото, остатки из sync_inventory) и версия дерева категорий (пути в ссылках).
+Рекомендации и крошки в тело не входят — их view добавляет сам.
+"""
+import hashlib
+import json
+from typing import Callable, Optional, Tuple, TypeVar
+
+from django.core.cache import cache
+
+from products.utils import category_tree
+from products.utils.list import FilterParams, canonical_query, ordering_for
+from products.utils.versions import CATALOG, POPULARITY, for_product, get_version, get_versions
+
+TTL = 3600
+T = TypeVar("T")
+HITS, MISSES = "catalog:list:hits", "catalog:list:misses"
+LISTING = (HITS, MISSES)
+DETAIL = ("catalog:detail:hits", "catalog:detail:misses")
+
+
+def body_key(path: str, params: FilterParams, cursor: Optional[str]) -> str:
+    raw = json.dumps([path, canonical_query(params), cursor or ""], ensure_ascii=False)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    if "-popularity" not in ordering_for(params.sort, ranked=bool(params.q)):
+        return f"catalog:list:{get_version(CATALOG)}:{digest}"
+    versions = get_versions([CATALOG, POPULARITY])
+    return f"catalog:list:{versions[CATALOG]}:p{versions[POPULARITY]}:{digest}"
+
+
+def detail_key(slug: str, product_id) -> str:
+    versions = get_versions([category_tree.VERSION, for_product(product_id)])
+    return f"catalog:detail:{versions[category_tree.VERSION]}:{versions[for_product(product_id)]}:{slug}"
+
+
+def _count(key: str) -> None:
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def cached_body(key: str, render: Callable[[], T], counters: Tuple[str, str] = LISTING) -> T:
+    html = cache.get(key)
+    if html is not None:
+        _count(counters[0])
+        return html
+    _count(counters[1])
+    html = render()
+    cache.set(key, html, TTL)
+    return html
+
+
+def stats(counters: Tuple[str, str] = LISTING) -> dict:
+    values = cache.get_many(counters)
+    hits, misses = values.get(counters[0], 0), values.get(counters[1], 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "ratio": round(100 * hits / total, 1) if total else None}
@@ -0,0 +1,154 @@
+# products/utils/popularity.py
+"""
+Популярность варианта для сортировки "pop": Variant.popularity (x SCALE), индекс
+variant_pop_sort_idx отдаёт первую страницу листинга без сортировки в памяти.
+
+    score = ORDER_WEIGHT * Σ штук в заказах * decay + VIEW_WEIGHT * Σ просмотров * decay
+          + COPURCHASE_WEIGHT * ln(1 + число вариантов, купленных вместе с этим)
+
+decay = 0.5 ** (возраст в днях / HALF_LIFE_DAYS), учитываются последние WINDOW_DAYS.
+Возраст считается в целых днях, поэтому между полуночами ежечасный пересчёт меняет
+только варианты с новыми заказами и просмотрами.
+
+Просмотры страницы варианта идут через буфер в Redis (record_view, как журнал поиска)
+и пачками складываются в VariantViewDay. recompute() — несколько агрегирующих
+запросов, сложение в NumPy и запись только изменившихся строк (UPDATE ... FROM unnest);
+воркерам сообщает версия POPULARITY (catalog_index.record_popularity), а не версия каталога.
+"""
+import datetime as dt
+import uuid
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import CharField, Count, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from products.models import CopurchaseVariantStat, Variant, VariantViewDay
+from products.utils.catalog_index import record_popularity
+from products.utils.event_buffer import BATCH_SIZE, EventBuffer
+from products.utils.search import is_postgres
+
+HALF_LIFE_DAYS = 14
+WINDOW_DAYS = 90
+ORDER_WEIGHT = 10.0      # за штуку в заказе
+VIEW_WEIGHT = 0.1        # за просмотр страницы
+COPURCHASE_WEIGHT = 1.0  # за ln(1 + степень) в графе ко-покупок
+SCALE = 1000
+MAX_SCORE = 2 ** 31 - 1  # PositiveIntegerField
+NOT_SOLD = ("canceled", "returned", "declined")
+
+VIEWS = EventBuffer("pop:views")
+
+_UPDATE_SQL = """
+UPDATE products_variant AS v SET popularity = u.popularity
+FROM unnest(%s::uuid[], %s::integer[]) AS u(id, popularity)
+WHERE v.id = u.id
+"""
+
+
+def record_view(variant_id) -> None:
+    VIEWS.push((str(variant_id), timezone.localdate().toordinal()))
+
+
+def _write_views(items) -> None:
+    counts = Counter(items)
+    alive = {str(i) for i in Variant.objects.filter(id__in={v for v, _ in counts}).values_list("id", flat=True)}
+    counts = {(v, day): n for (v, day), n in counts.items() if v in alive}  # удалённые с момента просмотра
+    days = {dt.date.fromordinal(day) for _, day in counts}
+    with transaction.atomic():
+        existing = list(VariantViewDay.objects.filter(day__in=days, variant_id__in={v for v, _ in counts}))
+        for row in existing:
+            key = (str(row.variant_id), row.day.toordinal())
+            if key in counts:
+                row.views += counts.pop(key)
+        VariantViewDay.objects.bulk_update(existing, ["views"])
+        VariantViewDay.objects.bulk_create([
+            VariantViewDay(variant_id=v, day=dt.date.fromordinal(day), views=n) for (v, day), n in counts.items()
+        ])
+
+
+def flush_views(batch_size: int = BATCH_SIZE) -> int:
+    """Переносит просмотры из буфера в VariantViewDay; строки старше WINDOW_DAYS удаляются."""
+    handled = VIEWS.drain(_write_views, batch_size)
+    VariantViewDay.objects.filter(day__lt=timezone.localdate() - dt.timedelta(days=WINDOW_DAYS)).delete()
+    return handled
+
+
+def _decayed(rows, pos: dict, today: dt.date, n: int) -> np.ndarray:
+    """Сумма amount по вариантам с весом decay; rows — (variant_id, день, amount)."""
+    rows = [(pos[v], (today - day).days, amount) for v, day, amount in rows if v in pos]
+    if not rows:
+        return np.zeros(n)
+    idx, age, amount = (np.array(col) for col in zip(*rows))
+    weights = amount.astype(float) * 0.5 ** (np.maximum(age, 0) / HALF_LIFE_DAYS)
+    return np.bincount(idx, weights=weights, minlength=n)
+
+
+def _key(field: str) -> Cast:
+    # id строкой: сотни тысяч строк агрегатов без разбора в uuid.UUID
+    return Cast(field, CharField())
+
+
+def _degree(pos: dict, n: int) -> np.ndarray:
+    degree = np.zeros(n)
+    for side in ("variant_min_id", "variant_max_id"):
+        rows = [(pos[v], c) for v, c in CopurchaseVariantStat.objects.values_list(_key(side)).annotate(c=Count("id"))
+                if v in pos]
+        if rows:
+            idx, c = (np.array(col) for col in zip(*rows))
+            degree += np.bincount(idx, weights=c, minlength=n)
+    return degree
+
+
+def scores(today: Optional[dt.date] = None):
+    """(id вариантов строками, новые popularity, текущие popularity)."""
+    today = today or timezone.localdate()
+    since = today - dt.timedelta(days=WINDOW_DAYS)
+    rows = list(Variant.objects.values_list(_key("id"), "popularity"))
+    ids, n = [r[0] for r in rows], len(rows)
+    current = np.fromiter((r[1] for r in rows), dtype=np.int64, count=n)
+    pos = {v: i for i, v in enumerate(ids)}
+
+    OrderItem = apps.get_model("cart", "OrderItem")
+    orders = (OrderItem.objects
+              .filter(order__date_ordered__date__gte=since)
+              .exclude(order__status__in=NOT_SOLD)
+              .values_list(_key("variant_id"), TruncDate("order__date_ordered"))
+              .annotate(qty=Sum("quantity")))
+    views = VariantViewDay.objects.filter(day__gte=since).values_list(_key("variant_id"), "day", "views")
+
+    score = (ORDER_WEIGHT * _decayed(orders, pos, today, n)
+             + VIEW_WEIGHT * _decayed(views, pos, today, n)
+             + COPURCHASE_WEIGHT * np.log1p(_degree(pos, n)))
+    new = np.minimum(np.rint(score * SCALE), MAX_SCORE).astype(np.int64)
+    return ids, new, current
+
+
+def _save(rows: List[Tuple[uuid.UUID, int]], batch_size: int) -> None:
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if is_postgres():
+            # один UPDATE ... FROM unnest на пачку; bulk_update строит CASE на каждую строку
+            with connection.cursor() as cursor:
+                cursor.execute(_UPDATE_SQL, [[str(v) for v, _ in batch], [p for _, p in batch]])
+        else:
+            Variant.objects.bulk_update([Variant(id=v, popularity=p) for v, p in batch], ["popularity"])
+
+
+def recompute(batch_size: int = 10 * BATCH_SIZE) -> int:
+    """Пересчитывает Variant.popularity; возвращает число изменившихся вариантов."""
+    ids, new, current = scores()
+    changed = [(uuid.UUID(ids[i]), int(new[i])) for i in np.flatnonzero(new != current)]
+    if not changed:
+        return 0
+    with transaction.atomic():
+        _save(changed, batch_size)
+    # запись идёт мимо сигналов. Меняется только порядок sort=pop: ни дельты индекса каталога
+    # (пересчёт трогает почти все варианты — воркеры перестроились бы целиком), ни версии
+    # каталога (карточки, поиск, фасеты от популярности не зависят) — своя версия POPULARITY
+    record_popularity()
+    return len(changed)
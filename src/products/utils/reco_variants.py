@@ -1,10 +1,31 @@
 # products/reco_variants.py
+"""
+Рекомендации «С этим покупают» на странице варианта.
+
+Считаются заранее (build_categories, задача products.tasks.build_recommendations):
+по каждому активному варианту категории — ручные связи, ко-покупки и контентная
+похожесть внутри категории, лучшие TOP_K пишутся в RelatedVariant(source=AUTO) с итоговой
+оценкой в weight и score; ручным связям пересборка пишет ту же оценку в score. Страница читает готовые связи одним запросом по индексу from_variant
+(related_variants) и отсекает то, чего сейчас нет в наличии, поэтому остатки в оценку не входят.
+
+Пересчёт — только затронутых категорий: products.signals (правки вариантов и ручных
+связей) и ко-покупки кладут id категорий в буфер TOUCHED, задача его разбирает.
+"""
 from math import log1p
 from collections import defaultdict
-from django.db.models import Q
+from typing import Iterable, Optional
+from django.db import transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Coalesce
 from products.models import Variant, AttributeValue, RelatedVariant, CopurchaseVariantStat
+from products.utils.event_buffer import EventBuffer
+from products.utils.similarity import ContentSimilarity
 
 W_MAN, W_COP, W_CNT = 3.0, 2.0, 1.0
+TOP_K = 24          # связей на вариант: с запасом на распроданное и ограничение по бренду
+CAP_PER_BRAND = 3
+
+TOUCHED = EventBuffer("reco:touched")
 
 def _price_closeness(a: float, b: float) -> float:
     if not a or not b: return 0.0
@@ -14,7 +35,7 @@ def _price_closeness(a: float, b: float) -> float:
 def _attr_signature(variant_ids: list[int]) -> dict[int, set[str]]:
     sig = defaultdict(set)
     qs = (AttributeValue.objects
-          .select_related("attribute","variant__product__category")
+          .select_related("attribute")
           .filter(variant_id__in=variant_ids))
     for av in qs:
         a = av.attribute
@@ -28,6 +49,7 @@ def _attr_signature(variant_ids: list[int]) -> dict[int, set[str]]:
     return sig
 
 def _content_similarity(a: Variant, b: Variant, sig_map: dict[int,set[str]]) -> float:
+    # эталон для products.utils.similarity (тесты и scripts/bench_similarity.py)
     s = 0.0
     if a.product.category_id == b.product.category_id: s += 0.6
     if a.product.brand_id and a.product.brand_id == b.product.brand_id: s += 0.2
@@ -38,65 +60,141 @@ def _content_similarity(a: Variant, b: Variant, sig_map: dict[int,set[str]]) ->
         s += 0.2 * min(j, 1.0)  # добавка за пересечение атрибутов
     return min(s, 1.0)
 
-def recommend_variants_with(variant: Variant, limit: int = 12) -> list[Variant]:
-    vid = variant.id
-    cand = defaultdict(lambda: {"man":0.0,"cop":0.0,"cnt":0.0,"pinned":False})
+def touch_categories(category_ids: Iterable[Optional[int]]) -> None:
+    for cat_id in set(category_ids):
+        TOUCHED.push(cat_id or 0)  # 0 — товары без категории (None буфер считает пропуском)
 
-    # ручные/авто связи
-    for rl in (RelatedVariant.objects
-               .select_related("to_variant","to_variant__product")
-               .filter(from_variant=variant, is_active=True)
-               .order_by("-pinned","-weight","position","id")):
-        if rl.to_variant.inventory <= 0: 
-            continue
-        cand[rl.to_variant_id]["man"] = max(cand[rl.to_variant_id]["man"], float(rl.weight))
-        cand[rl.to_variant_id]["pinned"] |= rl.pinned
+def touch_variants(variant_ids) -> None:
+    touch_categories(Variant.objects.filter(id__in=list(variant_ids)).values_list("product__category_id", flat=True))
 
-    # ко-покупки
+def _in_category(cat_id: Optional[int]) -> Q:
+    return Q(product__category__isnull=True) if cat_id is None else Q(product__category_id=cat_id)
+
+def _light(qs):
+    return qs.select_related("product").only("id", "price", "product__category_id", "product__brand_id")
+
+def score_category(cat_id: Optional[int], top_k: int = TOP_K) -> dict:
+    """
+    {id варианта: [(pinned, оценка, цена, id кандидата), …]} по активным вариантам категории,
+    по убыванию оценки: ручные связи, ко-покупки и top_k (плюс число ручных связей) самых
+    похожих по содержанию — остальные варианты категории в top_k пересборки попасть не могут.
+    """
+    pool = list(_light(Variant.objects.filter(_in_category(cat_id), is_active=True)))
+    ids = [v.id for v in pool]
+    pos = {v: i for i, v in enumerate(ids)}
+
+    man = defaultdict(dict)  # from -> {to: (weight, pinned)}
+    for rl in (RelatedVariant.objects
+               .filter(from_variant_id__in=ids, source=RelatedVariant.Source.MANUAL, is_active=True)
+               .values("from_variant_id", "to_variant_id", "weight", "pinned")):
+        man[rl["from_variant_id"]][rl["to_variant_id"]] = (float(rl["weight"]), rl["pinned"])
+    cop = defaultdict(dict)  # variant -> {other: count}
     for p in (CopurchaseVariantStat.objects
-              .filter(Q(variant_min_id=vid)|Q(variant_max_id=vid))
-              .values("variant_min_id","variant_max_id","count")):
-        other = p["variant_max_id"] if p["variant_min_id"] == vid else p["variant_min_id"]
-        cand[other]["cop"] = max(cand[other]["cop"], float(p["count"]))
-
-    # контентная похожесть в пуле соседей
-    pool = (Variant.objects
-            .filter(is_active=True)
-            .select_related("product")
-            .filter(product__category_id=variant.product.category_id)
-            .exclude(id=vid))
-    sig_map = _attr_signature(list(pool.values_list("id", flat=True)) + [vid])
-    for b in pool:
-        if b.inventory > 0:
-            cand[b.id]["cnt"] = max(cand[b.id]["cnt"], _content_similarity(variant, b, sig_map))
-
-    # скоринг и правила
-    scored = []
-    for other_id, s in cand.items():
-        if other_id == vid: 
-            continue
-        b = Variant.objects.filter(is_active=True).select_related("product").only(
-            "id","price","inventory","product__brand_id","product__category_id"
-        ).get(id=other_id)
-        if b.inventory <= 0: 
-            continue
-        score = (W_MAN*s["man"]) + (W_COP*log1p(s["cop"])) + (W_CNT*s["cnt"])
-        if variant.product.category_id == b.product.category_id: score += 0.2
-        if variant.product.brand_id and variant.product.brand_id == b.product.brand_id: score += 0.1
-        scored.append((s["pinned"], score, float(b.price or 0), b))
+              .filter(Q(variant_min_id__in=ids) | Q(variant_max_id__in=ids))
+              .values("variant_min_id", "variant_max_id", "count")):
+        cop[p["variant_min_id"]][p["variant_max_id"]] = float(p["count"])
+        cop[p["variant_max_id"]][p["variant_min_id"]] = float(p["count"])
+
+    # кандидаты из других категорий — только по ручным связям и ко-покупкам, одним запросом
+    by_id = {v.id: v for v in pool}
+    outside = {o for v in ids for o in (*man[v], *cop[v])} - by_id.keys()
+    by_id.update((v.id, v) for v in _light(Variant.objects.filter(id__in=outside, is_active=True)))
+
+    # контентная похожесть внутри категории — матрицами (products.utils.similarity); ранжируем
+    # по её вкладу в оценку вместе с надбавками за категорию и бренд
+    engine = ContentSimilarity.from_variants(pool, _attr_signature(ids))
+    k = top_k + max((len(man[v]) for v in ids), default=0)
+    cnt = [dict(zip((ids[j] for j in cols), sims.tolist()))
+           for cols, sims in engine.top_k(k, weight=W_CNT, category_bonus=0.2, brand_bonus=0.1)]
+    # ручные связи и ко-покупки внутри категории вне top_k — похожесть парами, одним вызовом
+    extra = [(i, pos[o]) for i, v in enumerate(ids) for o in (*man[v], *cop[v]) if o in pos and o not in cnt[i]]
+    if extra:
+        for (i, j), sim in zip(extra, engine.pairs(*zip(*extra)).tolist()):
+            cnt[i][ids[j]] = sim
+
+    out = {}
+    for i, a in enumerate(pool):
+        cand = defaultdict(lambda: {"man": 0.0, "cop": 0.0, "cnt": 0.0, "pinned": False})
+        for other, (weight, pinned) in man[a.id].items():
+            cand[other]["man"] = max(cand[other]["man"], weight)
+            cand[other]["pinned"] |= pinned
+        for other, count in cop[a.id].items():
+            cand[other]["cop"] = max(cand[other]["cop"], count)
+        for other, sim in cnt[i].items():
+            cand[other]["cnt"] = sim
+
+        scored = []
+        for other, s in cand.items():
+            b = by_id.get(other)
+            if b is None or other == a.id:
+                continue
+            score = (W_MAN*s["man"]) + (W_COP*log1p(s["cop"])) + (W_CNT*s["cnt"])
+            if a.product.category_id == b.product.category_id: score += 0.2
+            if a.product.brand_id and a.product.brand_id == b.product.brand_id: score += 0.1
+            scored.append((s["pinned"], score, float(b.price or 0), other))
+        scored.sort(key=lambda t: (not t[0], -t[1], t[2]))
+        out[a.id] = scored
+    return out
+
+def build_category(cat_id: Optional[int], top_k: int = TOP_K) -> int:
+    """
+    Перезаписывает AUTO-связи вариантов категории, ручным связям обновляет score;
+    возвращает число записанных AUTO.
+    """
+    scored = score_category(cat_id, top_k)
+    manual = {(a, b): pk for pk, a, b in RelatedVariant.objects
+              .filter(from_variant_id__in=list(scored), source=RelatedVariant.Source.MANUAL)
+              .values_list("id", "from_variant_id", "to_variant_id")}
+    rows, curated = [], []
+    for a, candidates in scored.items():
+        # пара с ручной связью уже есть в RelatedVariant — её строку не трогаем, только оценку
+        curated += [RelatedVariant(pk=manual[a, other], score=score)
+                    for _, score, _, other in candidates if (a, other) in manual]
+        top = [c for c in candidates if (a, c[3]) not in manual][:top_k]
+        rows += [RelatedVariant(from_variant_id=a, to_variant_id=other, source=RelatedVariant.Source.AUTO,
+                                weight=score, score=score, position=i)
+                 for i, (_, score, _, other) in enumerate(top)]
+    with transaction.atomic():
+        RelatedVariant.objects.filter(from_variant__in=Variant.objects.filter(_in_category(cat_id)),
+                                      source=RelatedVariant.Source.AUTO).delete()
+        RelatedVariant.objects.bulk_create(rows, batch_size=5000)
+        RelatedVariant.objects.bulk_update(curated, ["score"], batch_size=5000)
+    return len(rows)
+
+def build_categories(category_ids: Iterable[Optional[int]]) -> int:
+    return sum(build_category(cat_id or None) for cat_id in set(category_ids))
+
+def build_touched() -> int:
+    """Пересчёт категорий из буфера TOUCHED; возвращает число разобранных отметок."""
+    return TOUCHED.drain(build_categories, batch_size=100_000)
+
+def build_all() -> int:
+    """Полная пересборка (первый запуск, смена весов); отметки в буфере при этом не нужны."""
+    return build_categories(Variant.objects.filter(is_active=True).values_list("product__category_id", flat=True))
 
-    scored.sort(key=lambda t: (not t[0], -t[1], t[2]))
+def related_variants(variant: Variant, limit: int = 12) -> list[Variant]:
+    """
+    Готовые связи варианта одним запросом: закреплённые, затем по оценке пересборки (score —
+    одна формула для AUTO и ручных связей; ручной, ещё не оценённой, — её вклад W_MAN * weight);
+    только то, что сейчас в наличии.
+    """
+    links = (RelatedVariant.objects
+             .filter(from_variant_id=variant.id, is_active=True,
+                     to_variant__is_active=True, to_variant__inventory__gt=0)
+             .select_related("to_variant__card", "to_variant__product__brand", "to_variant__product__category")
+             .annotate(rank=Coalesce(F("score"), F("weight") * W_MAN, output_field=FloatField()))
+             .order_by("-pinned", "-rank", "to_variant__price", "id"))
 
     # diversity по бренду
-    cap_per_brand = 3
     used = defaultdict(int)
     out = []
-    for _, _, _, b in scored:
+    for rl in links:
+        b = rl.to_variant
         key = b.product.brand_id or 0
-        if used[key] >= cap_per_brand: 
+        if used[key] >= CAP_PER_BRAND:
             continue
         used[key] += 1
         out.append(b)
-        if len(out) >= limit: 
+        if len(out) >= limit:
             break
     return out
@@ -0,0 +1,288 @@
+# products/utils/search.py
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Prefetch, Q, QuerySet, Value
+from django.db.models.functions import Cast
+from unidecode import unidecode
+
+from products.models import Variant, VariantSearch, AttributeValue, Attribute, SearchTerm
+from products.utils.category_tree import get_tree
+
+# текстовый конфиг из миграции 0011: копия russian + unaccent перед стеммером
+SEARCH_CONFIG = "lbs_ru"
+# ключи написания — как есть, без стемминга
+KEYS_CONFIG = "simple"
+BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r"\w+(?:[.,]\d+)*", re.UNICODE)
+
+
+def search_tokens(q: str) -> List[str]:
+    """'Покрышка 2,3"' -> ['покрышка', '2.3']. Без спецсимволов tsquery."""
+    return [t.replace(",", ".") for t in _TOKEN_RE.findall((q or "").lower())]
+
+
+def normalized_query(q: str) -> str:
+    """Запрос как ключ кэша и журнала: "Покрышка  20!" -> "покрышка 20"."""
+    return " ".join(search_tokens(q))
+
+
+def is_postgres() -> bool:
+    return connection.vendor == "postgresql"
+
+
+# ---------- написание: транслит и раскладка ----------
+
+_LAYOUT_EN = "`qwertyuiop[]asdfghjkl;'zxcvbnm,./"
+_LAYOUT_RU = "ёйцукенгшщзхъфывапролджэячсмитьбю."
+_TO_RU = str.maketrans(_LAYOUT_EN, _LAYOUT_RU)
+_TO_EN = str.maketrans(_LAYOUT_RU, _LAYOUT_EN)
+_LATIN_RE = re.compile(r"[a-z]")
+_CYRILLIC_RE = re.compile(r"[а-яё]")
+
+# после unidecode: латиница и русский транслит одного слова сводятся к одной записи
+# (Maxxis/максис -> maksis, Schwalbe/швальбе -> shvalbe, Continental/континенталь -> kontinental)
+_KEY_STRIP_RE = re.compile(r"[^a-z0-9.]")
+_KEY_DOUBLE_RE = re.compile(r"([a-z])\1+")
+_KEY_RULES = [(re.compile(a), b) for a, b in (
+    (r"sch", "sh"), (r"ck", "k"), (r"ph", "f"), (r"kh", "h"), (r"x", "ks"), (r"w", "v"),
+    (r"q", "k"), (r"j", "dzh"), (r"y", "i"), (r"c(?!h)", "k"),
+)]
+MAX_KEY = 64
+
+
+def spelling_key(token: str) -> str:
+    """Ключ написания слова: транслит в латиницу + упрощения, общие для обеих записей."""
+    key = _KEY_STRIP_RE.sub("", unidecode(token.lower().replace("ё", "е")).lower())
+    key = _KEY_DOUBLE_RE.sub(r"\1", key)
+    for pattern, repl in _KEY_RULES:
+        key = pattern.sub(repl, key)
+    return _KEY_DOUBLE_RE.sub(r"\1", key)[:MAX_KEY]
+
+
+def swap_layout(text: str) -> Optional[str]:
+    """Текст, набранный не в той раскладке (ЙЦУКЕН <-> QWERTY); None, если раскладка смешанная."""
+    text = text.lower()
+    latin, cyrillic = bool(_LATIN_RE.search(text)), bool(_CYRILLIC_RE.search(text))
+    if latin == cyrillic:
+        return None
+    return text.translate(_TO_RU if latin else _TO_EN)
+
+
+def is_word(key: str) -> bool:
+    """Ключи со цифрами (артикулы, размеры) в словарь не попадают и не исправляются."""
+    return len(key) >= 2 and key.isalpha()
+
+
+# ---------- документ ----------
+
+def _fmt(av: AttributeValue) -> str:
+    a = av.attribute
+    if a.value_type == Attribute.TEXT:
+        return av.value_text or ""
+    if a.value_type == Attribute.NUMBER:
+        return str(av.value_number).rstrip("0").rstrip(".") if av.value_number is not None else ""
+    return a.name if av.value_bool else ""
+
+
+def _join(parts: Iterable[str]) -> str:
+    return " ".join(p.strip() for p in parts if p and p.strip()).lower()
+
+
+def build_documents(variant_ids) -> List[VariantSearch]:
+    tree = get_tree()
+    av_qs = AttributeValue.objects.select_related("attribute")
+    variants = (
+        Variant.objects.filter(id__in=list(variant_ids))
+        .select_related("product", "product__brand")
+        .prefetch_related(
+            Prefetch("attribute_values", queryset=av_qs),
+            Prefetch("product__attribute_values", queryset=av_qs),
+        )
+    )
+    docs = []
+    for v in variants:
+        p = v.product
+        title = [p.brand.title if p.brand_id else "", p.base_name or ""]
+        body = []
+        if p.category_id in tree.nodes:
+            *parents, cat = tree.ancestors(p.category_id)
+            title += [cat.title, cat.title_plural, cat.title_singular]
+            for node in parents:
+                body += [node.title, node.title_plural, node.title_singular]
+        body += [_fmt(av) for av in v.merged_attribute_values]
+        body += [v.seller_article, v.wb_article, v.ozon_article, v.slug]
+        title, body = _join(title), _join(body)
+        keys = sorted({spelling_key(t) for t in search_tokens(f"{title} {body}")} - {""})
+        docs.append(VariantSearch(variant_id=v.id, title=title, body=body, keys=" ".join(keys), dirty=False))
+    return docs
+
+
+def search_vector():
+    return (SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("body", weight="B", config=SEARCH_CONFIG)
+            + SearchVector("keys", weight="D", config=KEYS_CONFIG))
+
+
+def reindex_variants(variant_ids) -> int:
+    docs = build_documents(variant_ids)
+    if not docs:
+        return 0
+    with transaction.atomic():
+        VariantSearch.objects.bulk_create(
+            docs, update_conflicts=True, unique_fields=["variant"],
+            update_fields=["title", "body", "keys", "dirty", "updated"],
+        )
+        words = {k for d in docs for k in d.keys.split() if is_word(k)}
+        # словарь только растёт: лишнее слово в худшем случае даст исправление без результатов
+        SearchTerm.objects.bulk_create([SearchTerm(word=w) for w in words], ignore_conflicts=True,
+                                       batch_size=BATCH_SIZE)
+        if is_postgres():
+            (VariantSearch.objects
+             .filter(variant_id__in=[d.variant_id for d in docs])
+             .update(vector=search_vector()))
+    return len(docs)
+
+
+def mark_dirty(variants: QuerySet) -> int:
+    """Дешёвая пометка (один UPDATE) для массовых правок: бренд, категория."""
+    return VariantSearch.objects.filter(variant__in=variants).update(dirty=True)
+
+
+def pending_ids(limit: int) -> List:
+    return list(
+        Variant.objects
+        .filter(Q(search__isnull=True) | Q(search__dirty=True))
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def reindex_dirty(batch_size: int = BATCH_SIZE, max_batches=None) -> int:
+    """
+    Переиндексирует документы без строки в индексе или с dirty=True.
+    Каждая пачка коммитится отдельно, поэтому прерванный прогон просто продолжается со следующего.
+    """
+    done = batches = 0
+    while True:
+        ids = pending_ids(batch_size)
+        if not ids:
+            break
+        done += reindex_variants(ids)
+        batches += 1
+        if max_batches and batches >= max_batches:
+            break
+    return done
+
+
+# ---------- запрос ----------
+
+_TRIGRAMS: Dict[str, bool] = {}
+
+_RESOLVE_SQL = """
+SELECT c.key,
+       EXISTS (SELECT 1 FROM products_searchterm t WHERE t.word ^@ c.key),
+       {fuzzy}
+FROM unnest(%s::text[]) AS c(key)
+"""
+# ближайшее слово словаря (word_similarity: запрос похож на начало слова) — только для неизвестных ключей
+_FUZZY_SQL = """CASE WHEN length(c.key) >= 3 AND NOT EXISTS (
+           SELECT 1 FROM products_searchterm t WHERE t.word ^@ c.key)
+       THEN (SELECT t.word FROM products_searchterm t WHERE c.key <%% t.word
+             ORDER BY word_similarity(c.key, t.word) DESC, length(t.word), t.word LIMIT 1)
+       END"""
+
+
+def has_trigrams() -> bool:
+    """pg_trgm есть не везде (миграция 0014 ставит его, только если доступен) — проверяем раз на базу."""
+    name = connection.settings_dict["NAME"]
+    if name not in _TRIGRAMS:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _TRIGRAMS[name] = cursor.fetchone() is not None
+    return _TRIGRAMS[name]
+
+
+def lookup_keys(keys: List[str]) -> Dict[str, Tuple[bool, Optional[str]]]:
+    """ключ -> (в словаре есть слово с таким началом, ближайшее слово словаря для неизвестного)."""
+    if not keys:
+        return {}
+    if is_postgres():
+        fuzzy = _FUZZY_SQL if has_trigrams() else "NULL"
+        with connection.cursor() as cursor:
+            cursor.execute(_RESOLVE_SQL.format(fuzzy=fuzzy), [keys])
+            return {key: (known, fixed) for key, known, fixed in cursor.fetchall()}
+    # sqlite/dev: без исправления опечаток
+    return {key: (SearchTerm.objects.filter(word__startswith=key).exists(), None) for key in keys}
+
+
+def resolve_query(q: str) -> List[Tuple[str, str]]:
+    """
+    Слова запроса парами (слово, ключ написания). Каждый кусок запроса берётся как набран
+    или в другой раскладке ("ырштфтщ" -> "shimano") — какой вариант есть в словаре;
+    если ни одного, неизвестные слова заменяются ближайшими по триграммам. Один запрос
+    к словарю на весь поиск, сколько бы вариантов написания ни было.
+    """
+    pieces = []
+    for chunk in (q or "").split():
+        alternatives = [search_tokens(chunk)]
+        swapped = swap_layout(chunk)
+        if swapped:
+            alternatives.append(search_tokens(swapped))
+        pieces.append([[(t, spelling_key(t)) for t in alt] for alt in alternatives])
+
+    found = lookup_keys(sorted({k for alts in pieces for alt in alts for _, k in alt if is_word(k)}))
+
+    def fixed(alt):
+        # None — есть слово, которое не узнали и не исправили
+        out = []
+        for tok, key in alt:
+            known, fix = found.get(key, (True, None))
+            if not known:
+                if not fix:
+                    return None
+                tok = key = fix
+            out.append((tok, key))
+        return out
+
+    result = []
+    for alts in pieces:
+        exact = next((alt for alt in alts if all(found.get(k, (True, None))[0] for _, k in alt)), None)
+        result += exact or next(filter(None, map(fixed, alts)), alts[0])
+    return result
+
+
+def search_query(pairs: List[Tuple[str, str]]) -> SearchQuery:
+    # префиксный поиск по каждому слову — само слово (lbs_ru) или его ключ написания (simple):
+    # ('шиман':* | 'shiman':*) & ('20':* | '20':*)
+    query = None
+    for tok, key in pairs:
+        part = SearchQuery(f"'{tok}':*", search_type="raw", config=SEARCH_CONFIG)
+        if key:
+            part |= SearchQuery(f"'{key}':*", search_type="raw", config=KEYS_CONFIG)
+        query = part if query is None else query & part
+    return query
+
+
+def filter_search(qs: QuerySet, q: str) -> QuerySet:
+    """Фильтрует по поисковому документу и добавляет аннотацию search_rank."""
+    pairs = resolve_query(q)
+    if not pairs:
+        # в запросе нет слов ("!!!", "-"): выдача без фильтра, но ранжированная сортировка остаётся
+        return qs.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if is_postgres():
+        query = search_query(pairs)
+        return (qs.filter(search__vector=query)
+                  # ts_rank — real; в double, чтобы значение в курсоре пагинации совпадало с БД точно
+                  .annotate(search_rank=Cast(SearchRank(F("search__vector"), query), FloatField())))
+
+    # sqlite/dev: тот же документ, но без стемминга и ранжирования
+    for tok, key in pairs:
+        cond = Q(search__title__contains=tok) | Q(search__body__contains=tok)
+        if key:
+            cond |= Q(search__keys__contains=key)
+        qs = qs.filter(cond)
+    return qs.annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,134 @@
+# products/utils/search_cache.py
+"""
+Кэш результатов поиска: упорядоченные ключи сортировки (has_stock, search_rank, …, id)
+первых MAX_ROWS строк на нормализованный запрос + фильтры, плюс общее число.
+
+Ключ — версия каталога + путь + слова запроса (search_tokens) + canonical_query
+остальных фильтров, так что "Покрышка  20" и "покрышка 20" — одна запись. Пока
+страницы в пределах сохранённых строк, SQL-поиск не выполняется: читаются только
+строки страницы по id. Дальше — обычный QuerySetSource.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional
+
+from django.core.cache import cache
+
+from products.utils.cursor import Ordering, QuerySetSource
+from products.utils.list import FilterParams, base_qs, canonical_query
+from products.utils.search import normalized_query
+from products.utils.versions import CATALOG, get_version
+
+TTL = 600
+MAX_ROWS = 1000
+HITS, MISSES = "catalog:search:hits", "catalog:search:misses"
+
+
+def search_key(path: str, params: FilterParams) -> str:
+    raw = json.dumps([path, normalized_query(params.q), canonical_query(replace(params, q=""))], ensure_ascii=False)
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"catalog:search:{get_version(CATALOG)}:{digest}"
+
+
+@dataclass
+class _Entry:
+    keys: List[tuple]  # значения полей ordering по строкам, в порядке выдачи
+    complete: bool     # строк не больше MAX_ROWS — все в keys
+    total: int
+
+
+def _count(key: str) -> None:
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def _beyond(row: tuple, key: list, ordering: Ordering, backwards: bool) -> bool:
+    """Строка строго после ключа в порядке ordering (до ключа — при backwards); как keyset_q."""
+    for (_, desc), a, b in zip(ordering, row, key):
+        if a != b:
+            return a < b if desc != backwards else a > b
+    return False
+
+
+class CachedSearch:
+    """
+    Источник keyset-пагинации (seek/at/count) поверх кэша; за пределами кэша — SQL.
+    make_source вызывается только при промахе или листании дальше MAX_ROWS: сама сборка
+    поискового queryset'а уже ходит в БД (search.resolve_query).
+    """
+
+    def __init__(self, key: str, ordering: Ordering, make_source: Callable[[], QuerySetSource]):
+        self.key = key
+        self.ordering = ordering
+        self._make_source = make_source
+        self._source: Optional[QuerySetSource] = None
+        self._entry: Optional[_Entry] = None
+
+    @property
+    def source(self) -> QuerySetSource:
+        if self._source is None:
+            self._source = self._make_source()
+        return self._source
+
+    @property
+    def entry(self) -> _Entry:
+        if self._entry is None:
+            entry = cache.get(self.key)
+            if entry is None:
+                _count(MISSES)
+                fields = [name for name, _ in self.ordering]
+                keys = list(self.source.qs.values_list(*fields)[:MAX_ROWS + 1])
+                complete = len(keys) <= MAX_ROWS
+                entry = _Entry(keys[:MAX_ROWS], complete, len(keys) if complete else self.source.count())
+                cache.set(self.key, entry, TTL)
+            else:
+                _count(HITS)
+            self._entry = entry
+        return self._entry
+
+    def _rows(self, keys: List[tuple]) -> list:
+        ids = [k[-1] for k in keys]  # id — последнее поле любой сортировки
+        rows = {v.id: v for v in base_qs().filter(id__in=ids)}
+        out = []
+        for k in keys:
+            v = rows.get(k[-1])
+            if v is None:
+                continue  # снят с продажи после записи в кэш
+            for (name, _), value in zip(self.ordering, k):
+                setattr(v, name, value)  # search_rank и прочее — для курсора следующей страницы
+            out.append(v)
+        return out
+
+    def seek(self, key: Optional[list], backwards: bool, limit: int) -> list:
+        entry = self.entry
+        keys = entry.keys
+        if backwards:
+            # строки до ключа — префикс списка
+            end = next((i for i, row in enumerate(keys) if not _beyond(row, key, self.ordering, True)), len(keys))
+            if end == len(keys) and not entry.complete:
+                return self.source.seek(key, backwards, limit)
+            return self._rows(keys[max(0, end - limit):end])
+        start = 0
+        if key is not None:
+            start = next((i for i, row in enumerate(keys) if _beyond(row, key, self.ordering, False)), len(keys))
+        if start + limit > len(keys) and not entry.complete:
+            return self.source.seek(key, backwards, limit)
+        return self._rows(keys[start:start + limit])
+
+    def at(self, offset: int):
+        entry = self.entry
+        if offset < len(entry.keys):
+            rows = self._rows(entry.keys[offset:offset + 1])
+            return rows[0] if rows else None
+        return None if entry.complete else self.source.at(offset)
+
+    def count(self) -> int:
+        return self.entry.total
+
+
+def stats() -> dict:
+    values = cache.get_many([HITS, MISSES])
+    hits, misses = values.get(HITS, 0), values.get(MISSES, 0)
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "ratio": round(100 * hits / total, 1) if total else None}
@@ -0,0 +1,60 @@
+# products/utils/search_log.py
+"""
+Журнал поиска без записи в БД из запроса: record() кладёт запись в буфер в Redis
+(event_buffer); products.tasks.flush_search_log раз в минуту переносит записи
+пачкой в SearchLog. Отчёт для админки — частые запросы и запросы без результатов.
+"""
+import datetime as dt
+import time
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from products.models import SearchLog
+from products.utils.event_buffer import BATCH_SIZE, EventBuffer
+from products.utils.search import normalized_query
+
+BUFFER = EventBuffer("search:log")
+KEEP_DAYS = 90
+REPORT_TTL = 300
+
+
+def record(q: str, results: int, ms: float) -> None:
+    query = normalized_query(q)[:200]
+    if query:
+        BUFFER.push((query, results, int(ms), time.time()))
+
+
+def _write(items) -> None:
+    SearchLog.objects.bulk_create([
+        SearchLog(query=query, results=results, ms=ms, created=dt.datetime.fromtimestamp(ts, dt.timezone.utc))
+        for query, results, ms, ts in items
+    ])
+
+
+def flush(batch_size: int = BATCH_SIZE) -> int:
+    """Переносит накопленное в SearchLog и удаляет записи старше KEEP_DAYS."""
+    written = BUFFER.drain(_write, batch_size)
+    SearchLog.objects.filter(created__lt=timezone.now() - dt.timedelta(days=KEEP_DAYS)).delete()
+    return written
+
+
+def report(days: int = 7, limit: int = 20) -> dict:
+    key = f"search:log:report:{days}:{limit}"
+    data = cache.get(key)
+    if data is not None:
+        return data
+    qs = SearchLog.objects.filter(created__gte=timezone.now() - dt.timedelta(days=days))
+    totals = qs.aggregate(n=Count("id"), zero=Count("id", filter=Q(results=0)), ms=Avg("ms"))
+    by_query = qs.values("query").annotate(n=Count("id")).order_by("-n", "query")
+    data = {
+        "days": days,
+        "total": totals["n"],
+        "zero_ratio": round(100 * totals["zero"] / totals["n"], 1) if totals["n"] else None,
+        "avg_ms": round(totals["ms"]) if totals["ms"] is not None else None,
+        "top": list(by_query.annotate(results=Avg("results"), ms=Avg("ms"))[:limit]),
+        "zero": list(by_query.filter(results=0)[:limit]),
+    }
+    cache.set(key, data, REPORT_TTL)
+    return data
@@ -0,0 +1,131 @@
+# products/utils/similarity.py
+"""
+Контентная похожесть вариантов для рекомендаций (products.utils.reco_variants) —
+матрицами по пачкам строк вместо пар в Python:
+
+    sim(a, b) = min(1, 0.6·[та же категория] + 0.2·[тот же бренд] + 0.2·min(цен)/max(цен)
+                       + 0.2·Jaccard(атрибутов "slug=value"))
+
+— то же, что reco_variants._content_similarity, в том же порядке сложения. Значения атрибутов —
+разреженная бинарная матрица S (вариант × признак), пересечения — S[пачка] @ S.T, Jaccard —
+|A∩B| / (|A|+|B|−|A∩B|). Категория и бренд — номера столбцов one-hot (равенство номеров —
+то же скалярное произведение), цена — колонка; отношение min/max считается напрямую, без
+логарифмов, чтобы совпасть с прежней формулой до бита. Пачка строк подбирается так, чтобы
+плотные матрицы пачка × все варианты не превышали MAX_CELLS ячеек.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+W_CATEGORY, W_BRAND, W_PRICE, W_ATTRS = 0.6, 0.2, 0.2, 0.2
+MAX_CELLS = 1_000_000  # ячеек в каждой плотной матрице пачки (float64 — ~8 МБ, их в пачке с десяток)
+
+
+def _codes(values: Iterable[Optional[int]], none_matches: bool) -> np.ndarray:
+    """
+    Номера столбцов one-hot; -1 — признака нет. none_matches — None тоже значение
+    (у категории: два варианта без категории прежняя формула считает совпавшими, у бренда — нет).
+    """
+    index: Dict[Optional[int], int] = {}
+    return np.array([index.setdefault(v, len(index)) if v or none_matches else -1 for v in values],
+                    dtype=np.int64)
+
+
+class ContentSimilarity:
+    def __init__(self, categories: Sequence[Optional[int]], brands: Sequence[Optional[int]],
+                 prices: Sequence[float], signatures: Sequence[Set[str]]):
+        self.n = len(prices)
+        self.category = _codes(categories, none_matches=True)
+        self.brand = _codes(brands, none_matches=False)
+        self.price = np.asarray(prices, dtype=np.float64)
+        self.free = ~(self.price > 0)
+        features: Dict[str, int] = {}
+        rows, cols = [], []
+        for i, sig in enumerate(signatures):
+            for f in sig:
+                rows.append(i)
+                cols.append(features.setdefault(f, len(features)))
+        self.attrs = sparse.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, cols)),
+                                       shape=(self.n, max(len(features), 1)))
+        self.attrs_t = self.attrs.T.tocsr()
+        self.sizes = np.diff(self.attrs.indptr).astype(np.float64)
+
+    @classmethod
+    def from_variants(cls, variants, sig_map: Dict[object, Set[str]]) -> "ContentSimilarity":
+        """variants — с product (category_id, brand_id) и price, sig_map — reco_variants._attr_signature."""
+        return cls([v.product.category_id for v in variants], [v.product.brand_id for v in variants],
+                   [float(v.price or 0) for v in variants], [sig_map.get(v.id, set()) for v in variants])
+
+    def chunk_size(self) -> int:
+        return max(1, MAX_CELLS // max(self.n, 1))
+
+    def _parts(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(категория совпала, бренд совпал, sim) для строк rows против всех вариантов."""
+        cat = self.category[rows, None] == self.category[None, :]
+        brand = (self.brand[rows, None] == self.brand[None, :]) & (self.brand[rows, None] >= 0)
+
+        # операции на месте: на пачку — несколько плотных матриц, а не по одной на шаг формулы
+        a, b = self.price[rows, None], self.price[None, :]
+        ratio = np.minimum(a, b)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio /= np.maximum(a, b)
+        if self.free.any():  # цена 0 — без надбавки за близость
+            ratio[self.free[rows]] = 0.0
+            ratio[:, self.free] = 0.0
+
+        # |A∩B| / max(1, |A∪B|); у пустой сигнатуры пересечение 0 — и Jaccard 0, как в прежней формуле
+        jaccard = (self.attrs[rows] @ self.attrs_t).toarray()
+        union = self.sizes[rows, None] + self.sizes[None, :]
+        union -= jaccard
+        np.maximum(union, 1.0, out=union)
+        jaccard /= union
+
+        sim = np.where(cat, W_CATEGORY, 0.0)
+        np.add(sim, W_BRAND, out=sim, where=brand)
+        ratio *= W_PRICE
+        sim += ratio
+        jaccard *= W_ATTRS
+        sim += jaccard
+        np.minimum(sim, 1.0, out=sim)
+        return cat, brand, sim
+
+    def block(self, rows: Sequence[int]) -> np.ndarray:
+        """Плотная матрица sim: строки rows × все варианты."""
+        return self._parts(np.asarray(rows, dtype=np.int64))[2]
+
+    def pairs(self, left: Sequence[int], right: Sequence[int]) -> np.ndarray:
+        """sim для пар (left[i], right[i])."""
+        left, right = np.asarray(left, dtype=np.int64), np.asarray(right, dtype=np.int64)
+        out = np.empty(len(left))
+        step = self.chunk_size()
+        for start in range(0, len(left), step):
+            sl = slice(start, start + step)
+            # пары пачки — по строкам left, столбец — свой у каждой
+            uniq, pos = np.unique(left[sl], return_inverse=True)
+            out[sl] = self._parts(uniq)[2][pos, right[sl]]
+        return out
+
+    def top_k(self, k: int, weight: float = 1.0, category_bonus: float = 0.0,
+              brand_bonus: float = 0.0) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Для каждой строки — k лучших других вариантов по weight·sim + category_bonus·[категория]
+        + brand_bonus·[бренд]: (номера по убыванию этой оценки, их sim).
+        """
+        k = min(k, self.n - 1)
+        out: List[Tuple[np.ndarray, np.ndarray]] = []
+        if k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0))] * self.n
+        step = self.chunk_size()
+        for start in range(0, self.n, step):
+            rows = np.arange(start, min(start + step, self.n))
+            cat, brand, sim = self._parts(rows)
+            rank = sim * weight
+            np.add(rank, category_bonus, out=rank, where=cat)
+            np.add(rank, brand_bonus, out=rank, where=brand)
+            rank[np.arange(len(rows)), rows] = -np.inf  # сам с собой
+            best = np.argpartition(-rank, k - 1, axis=1)[:, :k]
+            for r, cols in enumerate(best):
+                cols = cols[np.argsort(-rank[r, cols], kind="stable")]
+                out.append((cols, sim[r, cols]))
+        return out
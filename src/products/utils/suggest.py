@@ -0,0 +1,345 @@
+# products/utils/suggest.py
+"""
+Подсказки поиска в шапке (products.views.suggest) из in-process префиксного индекса.
+
+Термы варианта — слова названия товара, бренда и категории плюс артикулы (словами
+и целиком без разделителей). Термы хранятся отсортированным списком, а варианты
+каждого терма — подряд в одном массиве (CSR), поэтому все варианты термов,
+начинающихся с префикса, — один непрерывный срез postings[offsets[lo]:offsets[hi]].
+Порядок выдачи — в наличии, затем новее. Вместе со словами хранятся их ключи написания
+(search.spelling_key: "шимано" находит Shimano), запрос без результатов повторяется
+в другой раскладке.
+
+Свежесть — как у catalog_index: та же версия "catalog_index" и те же дельты id
+(changes_between). Изменённые варианты уходят в overlay (просматривается целиком),
+их строки в базе маскируются; большой overlay, смена дерева категорий или
+потерянная дельта — полная пересборка. Она идёт в фоновом потоке воркера, а запросы
+до её конца отвечают прежним индексом; синхронно индекс строится только при первом
+запросе воркера, когда отдавать ещё нечего. Опубликованный индекс не меняется:
+apply() и with_tree() возвращают копию, которая подменяет его целиком.
+"""
+import calendar
+import copy
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.db import connection
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.urls import reverse
+
+from products.models import Brand, Variant
+from products.utils.catalog_index import VERSION, changes_between
+from products.utils.category_tree import CategoryTree, get_tree
+from products.utils.search import search_tokens, spelling_key, swap_layout
+from products.utils.versions import get_version
+
+LIMIT = 8          # вариантов в ответе
+GROUP_LIMIT = 5    # брендов и категорий
+MAX_OVERLAY = 5000
+_STOCK = 1 << 62   # в наличии — выше любых дат
+
+_ARTICLE_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    return (text or "").lower().replace("ё", "е")
+
+
+def tokens(text: str) -> List[str]:
+    return search_tokens(normalize(text))
+
+
+def with_keys(words: List[str]) -> List[str]:
+    return words + [k for k in map(spelling_key, words) if k and k not in words]
+
+
+def _score(inventory: int, created) -> int:
+    micros = calendar.timegm(created.utctimetuple()) * 1_000_000 + created.microsecond
+    return (_STOCK if inventory > 0 else 0) + micros
+
+
+class _Row(NamedTuple):
+    key: str
+    base_name: Optional[str]
+    brand_id: Optional[int]
+    category_id: Optional[int]
+    seller_article: Optional[str]
+    wb_article: Optional[str]
+    ozon_article: Optional[str]
+    inventory: int
+    created: object
+
+
+def _rows(ids=None) -> List[_Row]:
+    qs = Variant.objects.filter(is_active=True)
+    if ids is not None:
+        qs = qs.filter(id__in=list(ids))
+    rows = qs.annotate(key=Cast("id", CharField())).values_list(
+        "key", "product__base_name", "product__brand_id", "product__category_id",
+        "seller_article", "wb_article", "ozon_article", "inventory", "created",
+    )
+    return [_Row(str(r[0]).replace("-", ""), *r[1:]) for r in rows]
+
+
+class Match(NamedTuple):
+    title: str
+    url: str
+
+
+class SuggestIndex:
+    def __init__(self, version: int, tree: CategoryTree):
+        self.version = version
+        self.tree = tree
+        self.ids: List[str] = []            # позиция -> hex id варианта
+        self.pos_of: Dict[str, int] = {}
+        self.score = np.zeros(0, dtype=np.int64)
+        self.stale = np.zeros(0, dtype=bool)  # строка базы устарела (вариант изменён или удалён)
+        self.terms: List[str] = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int32)
+        self.overlay: Dict[int, Tuple[str, ...]] = {}  # позиция -> термы свежей версии варианта
+        self.brands: Dict[int, Tuple[str, str]] = {}   # id -> (title, slug)
+        self._brand_names: List[Tuple[List[str], Match]] = []
+        self._category_names: List[Tuple[List[str], Match]] = []
+        self.set_tree(tree)
+
+    # ---------- построение ----------
+
+    def _load_brands(self):
+        self.brands = {bid: (title, slug) for bid, title, slug in Brand.objects.values_list("id", "title", "slug")}
+        self._brand_names = sorted(
+            ((with_keys(tokens(title)), Match(title, reverse("products:brand", args=[slug])))
+             for title, slug in self.brands.values()),
+            key=lambda item: item[1].title.lower(),
+        )
+
+    def set_tree(self, tree: CategoryTree):
+        self.tree = tree
+        names = []
+        for node in tree.nodes.values():
+            words = with_keys(tokens(" ".join(filter(None, (node.title, node.title_plural, node.title_singular)))))
+            url = reverse("products:category", kwargs={"category_path": tree.path(node.id)})
+            names.append((words, Match(node.title_plural or node.title, url)))
+        self._category_names = sorted(names, key=lambda item: item[1].title.lower())
+
+    def _terms(self, r: _Row) -> Tuple[str, ...]:
+        words = tokens(r.base_name)
+        if r.brand_id in self.brands:
+            words += tokens(self.brands[r.brand_id][0])
+        node = self.tree.nodes.get(r.category_id)
+        if node is not None:
+            for title in (node.title, node.title_plural, node.title_singular):
+                words += tokens(title)
+        for article in (r.seller_article, r.wb_article, r.ozon_article):
+            if article:
+                words += tokens(article)
+                words.append(_ARTICLE_RE.sub("", normalize(article)))
+        return tuple(sorted(set(w for w in with_keys(words) if w)))
+
+    def _position(self, key: str) -> int:
+        pos = self.pos_of.get(key)
+        if pos is None:
+            pos = self.pos_of[key] = len(self.ids)
+            self.ids.append(key)
+        return pos
+
+    @classmethod
+    def build(cls, version: int, tree: CategoryTree) -> "SuggestIndex":
+        index = cls(version, tree)
+        index._load_brands()
+        rows = _rows()
+        by_term: Dict[str, List[int]] = {}
+        scores = []
+        for r in rows:
+            pos = index._position(r.key)
+            scores.append(_score(r.inventory, r.created))
+            for term in index._terms(r):
+                by_term.setdefault(term, []).append(pos)
+        index.score = np.array(scores, dtype=np.int64)
+        index.stale = np.zeros(len(index.ids), dtype=bool)
+        index.terms = sorted(by_term)
+        sizes = np.fromiter((len(by_term[t]) for t in index.terms), dtype=np.int64, count=len(index.terms))
+        index.offsets = np.concatenate([[0], np.cumsum(sizes)])
+        index.postings = np.fromiter((p for t in index.terms for p in by_term[t]), dtype=np.int32,
+                                     count=int(index.offsets[-1]))
+        return index
+
+    # ---------- инкрементальное обновление ----------
+
+    def with_tree(self, tree: CategoryTree) -> "SuggestIndex":
+        """Копия с другим объектом дерева той же версии (массивы общие, сами не меняются)."""
+        index = copy.copy(self)
+        index.set_tree(tree)
+        return index
+
+    def apply(self, ids, version: int) -> "SuggestIndex":
+        """Новый индекс версии version: ids перечитаны из БД в overlay (копия при записи)."""
+        index = SuggestIndex(version, self.tree)
+        index.ids, index.pos_of = list(self.ids), dict(self.pos_of)
+        index.terms, index.offsets, index.postings = self.terms, self.offsets, self.postings
+        index.overlay = dict(self.overlay)
+        old_brands = self.brands
+        index._load_brands()
+        renamed = [b for b, (title, _) in index.brands.items() if old_brands.get(b, (title,))[0] != title]
+        ids = {str(i).replace("-", "") for i in ids}
+        if renamed:
+            ids |= {str(i).replace("-", "") for i in
+                    Variant.objects.filter(product__brand_id__in=renamed).values_list("id", flat=True)}
+
+        rows = _rows(ids) if ids else []
+        for r in rows:
+            index._position(r.key)
+        grow = len(index.ids) - len(self.ids)
+        index.score = np.concatenate([self.score, np.zeros(grow, dtype=np.int64)])
+        index.stale = np.concatenate([self.stale, np.ones(grow, dtype=bool)])
+        for key in ids:
+            pos = index.pos_of.get(key)
+            if pos is not None:
+                index.stale[pos] = True
+                index.overlay.pop(pos, None)  # удалён или неактивен — пропадает из выдачи
+        for r in rows:
+            pos = index.pos_of[r.key]
+            index.score[pos] = _score(r.inventory, r.created)
+            index.overlay[pos] = index._terms(r)
+        return index
+
+    # ---------- запросы ----------
+
+    def _prefix_mask(self, prefix: str) -> np.ndarray:
+        """Маска позиций вариантов, у которых есть терм с этим префиксом."""
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + "\uffff")
+        mask = np.zeros(len(self.ids), dtype=bool)
+        mask[self.postings[self.offsets[lo]:self.offsets[hi]]] = True
+        mask &= ~self.stale
+        for pos, terms in self.overlay.items():
+            if any(t.startswith(prefix) for t in terms):
+                mask[pos] = True
+        return mask
+
+    def _word_mask(self, word: str) -> np.ndarray:
+        mask = self._prefix_mask(word)
+        key = spelling_key(word)
+        if key and key != word:
+            mask |= self._prefix_mask(key)
+        return mask
+
+    def _match(self, words: List[str]) -> np.ndarray:
+        # маски, а не np.unique/np.isin по срезам postings: у короткого префикса
+        # срез — все варианты каталога, и хеширование дороже самого поиска
+        mask = self._word_mask(words[0])
+        for w in words[1:]:
+            mask &= self._word_mask(w)
+        return np.flatnonzero(mask)
+
+    def variants(self, q: str, limit: int = LIMIT) -> List[str]:
+        """hex id лучших вариантов, у которых каждое слово запроса — префикс какого-то терма."""
+        words = tokens(q)
+        if not words:
+            return []
+        found = self._match(words)
+        swapped = tokens(swap_layout(q) or "") if not len(found) else None
+        if swapped:
+            found = self._match(swapped)
+        if len(found) > limit:
+            found = found[np.argpartition(-self.score[found], limit - 1)[:limit]]
+        found = found[np.argsort(-self.score[found], kind="stable")]
+        return [self.ids[p] for p in found]
+
+    def brand_matches(self, q: str, limit: int = GROUP_LIMIT) -> List[Match]:
+        return _first_matches(q, self._brand_names, limit)
+
+    def category_matches(self, q: str, limit: int = GROUP_LIMIT) -> List[Match]:
+        return _first_matches(q, self._category_names, limit)
+
+
+def _first_matches(q: str, named: List[Tuple[List[str], Match]], limit: int) -> List[Match]:
+    """Бренды и категории: их сотни — просто перебор (каждое слово запроса — префикс слова названия)."""
+    def scan(words):
+        prefixes = [(w, spelling_key(w) or w) for w in words]
+        hits = []
+        for names, match in named:
+            if all(any(n.startswith(w) or n.startswith(k) for n in names) for w, k in prefixes):
+                hits.append(match)
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    words = tokens(q)
+    if not words:
+        return []
+    hits = scan(words)
+    swapped = tokens(swap_layout(q) or "") if not hits else None
+    return scan(swapped) if swapped else hits
+
+
+# ---------- состояние воркера ----------
+
+_lock = threading.Lock()
+_index: Optional[SuggestIndex] = None
+_rebuilding = False  # фоновая пересборка уже идёт
+
+
+def _spawn(target) -> None:
+    def run():
+        try:
+            target()
+        finally:
+            connection.close()  # соединение этого потока
+
+    threading.Thread(target=run, name="suggest-rebuild", daemon=True).start()
+
+
+def _rebuild(current: int, tree: CategoryTree) -> None:
+    global _index, _rebuilding
+    try:
+        index = SuggestIndex.build(current, tree)
+        with _lock:
+            if _index is None or _index.version <= index.version:
+                _index = index
+    finally:
+        with _lock:
+            _rebuilding = False
+
+
+def _start_rebuild(current: int, tree: CategoryTree) -> None:
+    """Пересборка в фоне (под _lock); следующая — только после конца текущей."""
+    global _rebuilding
+    if not _rebuilding:
+        _rebuilding = True
+        _spawn(lambda: _rebuild(current, tree))
+
+
+def get_index() -> SuggestIndex:
+    global _index
+    current, tree = get_version(VERSION), get_tree()
+    index = _index
+    if index is not None and index.version == current and index.tree is tree:
+        return index
+    with _lock:
+        index = _index
+        if index is None:
+            index = SuggestIndex.build(current, tree)  # первый запрос воркера — отдать нечего
+        elif index.version > current or index.tree.version != tree.version:
+            _start_rebuild(current, tree)
+            return index
+        elif index.version < current:
+            ids = changes_between(index.version, current)
+            if ids is None or len(index.overlay) + len(ids) > MAX_OVERLAY:
+                _start_rebuild(current, tree)
+                return index
+            index = index.apply(ids, current)
+        if index.tree is not tree:
+            index = index.with_tree(tree)  # то же дерево той же версии, перечитанное после локальной правки
+        _index = index
+    return index
+
+
+def reset() -> None:
+    global _index
+    with _lock:
+        _index = None
@@ -0,0 +1,106 @@
+# products/utils/swatches.py
+"""
+Свотчи в карточке листинга: другие значения вариантных атрибутов того же товара
+(цвета, размеры) со ссылками на варианты-соседи.
+
+Соседи всех товаров страницы со значениями вариантных атрибутов — один запрос
+(load), порядок атрибутов — как Category.variant_attrs (sort_order, id), значения —
+как на странице варианта (number_aware_sort_key), ссылка — первый сосед с этим
+значением. Набор товара кэшируется по его счётчику (versions.for_product) и версии
+дерева категорий (пути в ссылках). Остатков в наборе нет: после sync_inventory, когда
+пересобираются все фрагменты карточек, заново строятся наборы только товаров с новыми
+остатками (их счётчик поднимается ради страниц вариантов).
+"""
+from typing import Dict, List
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.urls import reverse
+
+from products.models import AttributeValue, CategoryAttribute, Variant, category_url_path
+from products.utils import category_tree
+from products.utils.detail import format_value, number_aware_sort_key
+from products.utils.versions import for_product, get_version, get_versions
+
+TTL = 24 * 3600  # переименование атрибута (Attribute.name) набор не сбрасывает
+LIMIT = 6        # значений в строке карточки, остальные — «+N»
+
+
+def _rows(product_ids):
+    ca = CategoryAttribute.objects.filter(category_id=OuterRef("variant__product__category_id"),
+                                          attribute_id=OuterRef("attribute_id"), is_variant=True)
+    return (AttributeValue.objects
+            .filter(variant__product_id__in=product_ids, variant__is_active=True)
+            .annotate(ca_order=Subquery(ca.values("sort_order")[:1]), ca_id=Subquery(ca.values("id")[:1]))
+            .filter(ca_id__isnull=False)
+            .order_by("variant_id")
+            .values_list("variant__product_id", "variant_id", "variant__slug", "variant__product__category_id",
+                         "ca_order", "ca_id", "attribute__name", "attribute__value_type",
+                         "value_text", "value_number", "value_bool"))
+
+
+def build(product_ids) -> Dict[object, dict]:
+    """
+    Наборы товаров одним запросом: {product_id: {"rows": [(название, [(значение, url), …]), …],
+    "picked": {variant_id.hex: (значение или None по строкам)}}}. Строка — атрибут, у которого
+    у соседей больше одного значения; товар без таких строк в ответ не попадает.
+    """
+    attrs: Dict[object, dict] = {}   # product_id -> {(sort_order, ca_id): (название, {значение: url})}
+    picked: Dict[object, dict] = {}  # product_id -> {variant hex: {(sort_order, ca_id): значение}}
+    urls = {}
+    for pid, vid, slug, cat_id, order, ca_id, name, value_type, text, number, flag in _rows(product_ids):
+        if vid not in urls:
+            urls[vid] = reverse("products:detail", kwargs={
+                "category_path": category_url_path(cat_id) if cat_id else "", "slug": slug})
+        value = format_value(value_type, text, number, flag)
+        _, values = attrs.setdefault(pid, {}).setdefault((order, ca_id), (name, {}))
+        values.setdefault(value, urls[vid])
+        picked.setdefault(pid, {}).setdefault(vid.hex, {})[(order, ca_id)] = value
+
+    out = {}
+    for pid, by_attr in attrs.items():
+        keys = [k for k in sorted(by_attr) if len(by_attr[k][1]) > 1]
+        if not keys:
+            continue
+        rows = [(by_attr[k][0], sorted(by_attr[k][1].items(), key=lambda item: number_aware_sort_key(item[0])))
+                for k in keys]
+        out[pid] = {"rows": rows,
+                    "picked": {vid: tuple(vals.get(k) for k in keys) for vid, vals in picked[pid].items()}}
+    return out
+
+
+def load(product_ids) -> Dict[object, dict]:
+    """Наборы из кэша; промахи — одним build на всю пачку."""
+    ids = list(set(product_ids))
+    if not ids:
+        return {}
+    versions = get_versions(for_product(pid) for pid in ids)
+    tree = get_version(category_tree.VERSION)
+    keys = {pid: f"catalog:swatches:{tree}:{versions[for_product(pid)]}:{pid}" for pid in ids}
+    cached = cache.get_many(keys.values())
+    out = {pid: cached[key] for pid, key in keys.items() if key in cached}
+    missing = [pid for pid in ids if pid not in out]
+    if missing:
+        built = build(missing)
+        fresh = {pid: built.get(pid, {}) for pid in missing}  # {} — у товара нечего показывать (None Redis не вернёт)
+        cache.set_many({keys[pid]: data for pid, data in fresh.items()}, TTL)
+        out.update(fresh)
+    return out
+
+
+def for_cards(variants: List[Variant]) -> Dict[object, List[dict]]:
+    """Строки свотчей для card.html по карточкам страницы: {variant_id: [{name, items, more}]}."""
+    sets = load(v.product_id for v in variants)
+    out = {}
+    for v in variants:
+        data = sets.get(v.product_id)
+        if not data:
+            continue
+        current = data["picked"].get(v.id.hex, ())
+        out[v.id] = [
+            {"name": name,
+             "items": [{"text": text, "url": url, "active": text == value} for text, url in values[:LIMIT]],
+             "more": max(len(values) - LIMIT, 0)}
+            for (name, values), value in zip(data["rows"], current or [None] * len(data["rows"]))
+        ]
+    return out
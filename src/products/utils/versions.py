@@ -0,0 +1,45 @@
+# products/utils/versions.py
+from typing import Dict, Iterable
+
+from django.core.cache import cache
+
+CATALOG = "catalog"  # любая правка, видимая на витрине: остатки, варианты, атрибуты, фото, категории
+POPULARITY = "popularity"  # пересчёт Variant.popularity (products.utils.popularity) — только порядок sort=pop
+
+
+def for_product(product_id) -> str:
+    """Счётчик товара: правки его вариантов, их значений и фото, вариантных атрибутов категории (products.signals)."""
+    return f"product:{product_id}"
+
+
+def for_category(category_id) -> str:
+    """Счётчик снимка фасетов категории (products.utils.facet_snapshot)."""
+    return f"category:{category_id}"
+
+
+def _key(name: str) -> str:
+    return f"ver:{name}"
+
+
+def get_version(name: str) -> int:
+    """Текущее значение счётчика; 0, пока его ни разу не поднимали."""
+    return cache.get(_key(name)) or 0
+
+
+def get_versions(names: Iterable[str]) -> Dict[str, int]:
+    """Несколько счётчиков одним обращением к кэшу (MGET)."""
+    names = list(names)
+    found = cache.get_many([_key(n) for n in names])
+    return {n: found.get(_key(n)) or 0 for n in names}
+
+
+def bump_version(name: str) -> int:
+    """Атомарно поднимает счётчик (INCR в Redis) и возвращает новое значение."""
+    key = _key(name)
+    cache.add(key, 0, None)
+    return cache.incr(key)
+
+
+def bump_products(product_ids: Iterable) -> None:
+    for pid in set(product_ids):
+        bump_version(for_product(pid))
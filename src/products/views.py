@@ -1,59 +1,161 @@
+import time
+from urllib.parse import urlencode
+
 from django.db.models import Prefetch
-from django.shortcuts import render
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.safestring import mark_safe
 
-from .models import Category, Brand
+from .models import Category, Brand, Variant
 
 from products.utils.list import *
 from products.utils.detail import *
-from products.utils.reco_variants import recommend_variants_with
+from products.utils.facets import compute_facets
+from products.utils.catalog_index import index_for
+from products.utils.cursor import QuerySetSource, legacy_page_cursor, paginate_cursor, parse_ordering
+from products.utils.page_cache import DETAIL, body_key, cached_body, detail_key
+from products.utils import facet_snapshot, popularity, search_log
+from products.utils.cards import render_cards
+from products.utils.category_tree import get_tree
+from products.utils.search_cache import CachedSearch, search_key
+from products.utils.reco_variants import related_variants
+from products.utils.suggest import LIMIT as SUGGEST_LIMIT, get_index as suggest_index
+
+CARDS_SCOPE = ("path", "brand")  # GET-параметры cards вместо пути страницы
+
+
+def _listing_path(cat, br) -> str:
+    """Путь страницы листинга: ключи кэшей выдачи у пачек прокрутки (cards) — те же, что у страницы."""
+    if cat is not None:
+        return reverse("products:category", kwargs={"category_path": get_tree().path(cat.id)})
+    if br is not None:
+        return reverse("products:brand", args=[br.slug])
+    return reverse("products:search")
+
+
+def _listing_source(request, params, cat, br, path=None):
+    """Упорядоченные варианты листинга: из in-process индекса или SQL; + сортировка для курсоров."""
+    path = path or request.path
+    by_slug = attr_slug_map(cat)
+    ordering = parse_ordering(ordering_for(params.sort, ranked=bool(params.q)))
+    index = index_for(params)
+    if index is not None:
+        return index, index.listing(cat, br, params, by_slug), ordering
+
+    def sql_source():
+        qs = base_qs()
+        qs = apply_scope(qs, cat, br, params)
+        qs = apply_attr_filters(qs, params, by_slug)
+        if params.group:
+            qs = group_by_product(qs, params.sort, ranked=bool(params.q))
+        qs = order_qs(qs, params.sort, ranked=bool(params.q))
+        count_key = listing_cache_key(request, "catalog:count", ("page", "cursor", "sort") + CARDS_SCOPE, path)
+        return QuerySetSource(qs, ordering, count_key)
+
+    if params.q and not params.group:
+        # популярные запросы не гоняют поиск заново: выдача по версии каталога в кэше
+        return None, CachedSearch(search_key(path, params), ordering, sql_source), ordering
+    return None, sql_source(), ordering
+
 
 def list(request, category_path=None, brand=None):
     params = parse_params(request)
     cat, br = get_cat_brand_by_path(category_path, brand)
 
-    qs = base_qs()
-    qs = apply_scope(qs, cat, br, params)
-    by_slug = attr_slug_map(cat)
-    qs = apply_attr_filters(qs, params, by_slug)
-    qs = order_qs(qs, params.sort)
-    page_obj = paginate_qs(qs, params.page)
-
-    fb = faceting_base_qs(cat, br, params)
-    price_rng = price_range_facet(fb)
-    brands = brand_facet(fb)
-    attrs = attr_facets(cat, fb)
-
-    ctx = {
-        "variants": page_obj.object_list,
-        "page_obj": page_obj,
-        "q": params.q,
+    if "page" in request.GET:
+        # старые ссылки ?page=N → та же страница в курсорной схеме
+        _, source, ordering = _listing_source(request, params, cat, br)
+        token = legacy_page_cursor(source, ordering, params.page)
+        query = qs_without_page(request)
+        if token:
+            query = "&".join(filter(None, [query, urlencode({"cursor": token})]))
+        return redirect(f"{request.path}?{query}" if query else request.path, permanent=True)
+
+    cursor = request.GET.get("cursor")
+    found = {}
+
+    def render_body():
+        index, source, ordering = _listing_source(request, params, cat, br)
+        page_obj = paginate_cursor(source, ordering, cursor)
+        found["count"] = page_obj.count
+        facets = facet_snapshot.get(cat, br, params)
+        if facets is None:
+            facets = index.facets(cat, br, params) if index is not None else compute_facets(cat, br, params)
+        return get_template("products/partials/list_body.html").render({
+            "request": request,
+            "variants": page_obj.object_list,
+            "cards": render_cards(page_obj.object_list, params.group),
+            "cards_url": _cards_url(cat, br, params),
+            "page_obj": page_obj,
+            "q": params.q,
+            "cat": cat,
+            "brand": br,
+            "notfound": page_obj.count == 0,
+            "group": params.group,
+            "sort": params.sort,
+            "price_range": facets["price_range"],
+            "price_histogram": facets["price_histogram"],
+            "brand_facet": facets["brand_facet"],
+            "attr_facets": facets["attr_facets"],
+            "category_facet": facets["category_facet"],
+            "selected": selected_dict(request, params),
+            "qs": canonical_query(params),
+        })
+
+    if params.q:
+        started = time.perf_counter()
+        body = render_body()  # длинный хвост запросов — тело не кэшируем, только выдачу
+        if not cursor:
+            search_log.record(params.q, found["count"], (time.perf_counter() - started) * 1000)
+    else:
+        body = cached_body(body_key(request.path, params, cursor), render_body)
+
+    return render(request, "products/list.html", {
+        "body": mark_safe(body),
         "cat": cat,
         "brand": br,
-        "notfound": page_obj.paginator.count == 0,
-        "sort": params.sort,
-        "price_range": price_rng,
-        "brand_facet": brands,
-        "attr_facets": attrs,
-        "selected": selected_dict(request, params),
-        "qs": qs_without_page(request),
-    }
-    return render(request, "products/list.html", ctx)
+        "q": params.q,
+    })
 
 
-def detail(request, category_path, slug):
-    variant = get_variant_or_404(slug)
-    siblings = get_sibling_variants_qs(variant.product_id)
+def _cards_url(cat, br, params) -> str:
+    scope = [("path", get_tree().path(cat.id))] if cat is not None else []
+    if br is not None:
+        scope.append(("brand", br.slug))
+    query = "&".join(filter(None, [urlencode(scope), canonical_query(params)]))
+    return f"{reverse('products:cards')}?{query}" if query else reverse("products:cards")
+
 
-    attrs, attr_ids = variant_attributes(variant)
-    variants_data, values_by_attr, first_by_attr_val = build_variants_index(siblings, attr_ids)
-    current_values = current_values_map(variant, attr_ids)
-    rows = build_rows(attrs, attr_ids, values_by_attr, first_by_attr_val, variants_data, current_values)
-    related_variants = recommend_variants_with(variant, limit=12)
+def cards(request):
+    """
+    Следующая пачка карточек листинга для бесконечной прокрутки: тот же разбор фильтров
+    и источник выдачи (индекс каталога, кэш поиска, SQL), что у list, но без фасетов,
+    тела страницы и обвязки сайта. Карточки — готовым HTML (кэш фрагментов card.html).
+    """
+    params = parse_params(request)
+    cat, br = get_cat_brand_by_path(request.GET.get("path"), request.GET.get("brand"))
+    _, source, ordering = _listing_source(request, params, cat, br, _listing_path(cat, br))
+    page_obj = paginate_cursor(source, ordering, request.GET.get("cursor"))
+    return JsonResponse({
+        "html": "".join(render_cards(page_obj.object_list, params.group)),
+        "next": page_obj.next_cursor,
+        "count": page_obj.count,
+        "end": page_obj.end_index(),
+    }, json_dumps_params={"ensure_ascii": False})
+
+
+def detail(request, category_path, slug):
+    variant = get_variant_head_or_404(slug)
+    popularity.record_view(variant.id)
+    page = cached_body(detail_key(slug, variant.product_id), lambda: render_page(slug), DETAIL)
+    request.variant_crumb = (variant.product.category_id, page["crumb"])  # крошкам не нужен второй запрос
 
     return render(request, "products/detail.html", {
-        "variant": variant,
-        "rows": rows,
-        "related_variants": related_variants,
+        "page": page,
+        "body": mark_safe(page["body"]),
+        "related_variants": related_variants(variant, limit=12),
     })
 
 
@@ -76,4 +178,32 @@ def catalog(request):
 
 def brands(request):
     brands = Brand.objects.all()
-    return render(request, 'products/catalog.html', {'brands': brands})
\ No newline at end of file
+    return render(request, 'products/catalog.html', {'brands': brands})
+
+def suggest(request):
+    """Подсказки поиска в шапке: бренды, категории и варианты по префиксу (products.utils.suggest)."""
+    q = (request.GET.get("q") or "").strip()[:100]
+    try:
+        limit = max(1, min(int(request.GET.get("limit", SUGGEST_LIMIT)), 20))
+    except ValueError:
+        limit = SUGGEST_LIMIT
+
+    index = suggest_index()
+    ids = index.variants(q, limit)
+    by_id = {v.id.hex: v for v in Variant.objects.filter(id__in=ids).select_related("card")} if ids else {}
+    variants = []
+    for key in ids:
+        v = by_id.get(key)
+        if v is None:
+            continue
+        c = v.card_view
+        variants.append({
+            "id": key, "name": c.display_name, "url": c.url_path, "thumb": c.thumb_url,
+            "price": str(v.price), "in_stock": v.inventory > 0,
+        })
+    return JsonResponse({
+        "q": q,
+        "brands": [m._asdict() for m in index.brand_matches(q)],
+        "categories": [m._asdict() for m in index.category_matches(q)],
+        "variants": variants,
+    }, json_dumps_params={"ensure_ascii": False})